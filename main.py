@@ -6,8 +6,15 @@ import sys
 import glob
 import numpy as np
 import threading
-from src.camera import WebcamStream, VideoFileStream
+from src.camera import WebcamStream, VideoFileStream, FFmpegVideoReader
 from src.swapper import FaceSwapper
+from src.video import ChunkedVideoJob, swap_video_file
+from src.enhancer import RESTORERS, QUALITY_TIERS
+from src.virtualcam import VirtualCamOutput, PIXEL_FORMATS, VCAM_BACKENDS
+from src.streams import open_source, open_sink, read_frame, parse_size, LatencyStats
+from src.scheduler import DeadlineScheduler
+from src.display import PreviewWindow
+from src.utils import RUNTIME_PROFILE
 
 try:
     import pyaudio
@@ -15,7 +22,7 @@ try:
     AUDIO_AVAILABLE = True
 except ImportError:
     AUDIO_AVAILABLE = False
-    print("Aviso: 'pyaudio' não encontrado. Gravação de áudio desativada.")
+    print("Aviso: 'pyaudio' não encontrado. Gravação de áudio desativada.", file=sys.stderr)
 
 # Tenta importar moviepy para processamento de vídeo com áudio
 try:
@@ -23,12 +30,12 @@ try:
     MOVIEPY_AVAILABLE = True
 except ImportError as e:
     MOVIEPY_AVAILABLE = False
-    print(f"Aviso: 'moviepy' não pôde ser importado: {e}")
-    print("Processamento de vídeo será sem áudio.")
+    print(f"Aviso: 'moviepy' não pôde ser importado: {e}", file=sys.stderr)
+    print("Processamento de vídeo será sem áudio.", file=sys.stderr)
 except Exception as e:
     MOVIEPY_AVAILABLE = False
-    print(f"Aviso: Erro inesperado ao importar 'moviepy': {e}")
-    print("Processamento de vídeo será sem áudio.")
+    print(f"Aviso: Erro inesperado ao importar 'moviepy': {e}", file=sys.stderr)
+    print("Processamento de vídeo será sem áudio.", file=sys.stderr)
 
 class AudioRecorder:
     def __init__(self):
@@ -92,21 +99,156 @@ class AudioRecorder:
             audio_thread = threading.Thread(target=self.record)
             audio_thread.start()
 
+def open_video_frames(path):
+    """
+    Abre um vídeo/GIF para leitura quadro a quadro em BGR.
+    Usa FFmpegVideoReader (decodificação multithread direto em bgr24) quando o
+    ffmpeg está disponível e MoviePy como fallback.
+
+    Returns:
+        tuple: (iterador de (frame_bgr, small), fps, (largura, altura), total de frames, close)
+            small é o quadro reduzido em 50% para detecção, ou None.
+    """
+    if FFmpegVideoReader.available():
+        reader = FFmpegVideoReader(path, detect_scale=0.5).start()
+        return iter(reader), reader.fps, (reader.width, reader.height), reader.frame_count, reader.stop
+
+    clip = VideoFileClip(path)
+    # MoviePy usa RGB, OpenCV usa BGR
+    frames = ((cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2BGR), None) for frame_rgb in clip.iter_frames())
+    total_frames = int(clip.duration * clip.fps) if clip.duration and clip.fps else 0
+    return frames, clip.fps, tuple(clip.size), total_frames, clip.close
+
+def process_video_chunked(args, swapper, source_path, out_path):
+    import subprocess
+
+    job = ChunkedVideoJob(args.video, job_dir=args.job_dir, chunk_seconds=args.chunk_seconds)
+    try:
+        # source_id: identidade do índice (--source-id) que substitui o rosto de --source
+        job.prepare(meta={'source': os.path.abspath(source_path), 'source_id': swapper.source_id},
+                    strict=('source_id',))
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        print(f"Erro ao dividir vídeo (ffmpeg/ffprobe necessários): {e}")
+        sys.exit(1)
+    except ValueError as e:
+        print(f"Erro: {e}")
+        sys.exit(1)
+
+    # Processos locais adicionais trabalhando no mesmo job
+    children = []
+    if not args.chunk_worker and args.chunk_workers > 1:
+        child_args = [sys.executable] + sys.argv + ['--chunk-worker', '--job-dir', job.job_dir]
+        for _ in range(args.chunk_workers - 1):
+            children.append(subprocess.Popen(child_args))
+        print(f"[Main] {len(children)} processos auxiliares iniciados.")
+
+    start_time = time.time()
+    processed = {'frames': 0}
+
+    def process_chunk(in_path, part_path, heartbeat):
+        def on_frame(count):
+            processed['frames'] += 1
+            if count % 10 == 0:
+                heartbeat()
+                elapsed = time.time() - start_time
+                fps_proc = processed['frames'] / elapsed if elapsed > 0 else 0
+                print(f"\rSegmento: {count} frames | FPS: {fps_proc:.2f}", end="")
+        frames = swap_video_file(swapper, in_path, part_path, fps=job.fps, on_frame=on_frame)
+        print()
+        return frames
+
+    try:
+        job.run(process_chunk)
+    except KeyboardInterrupt:
+        print("\nInterrompido. Execute o mesmo comando para retomar do último segmento concluído.")
+        for child in children:
+            child.terminate()
+        sys.exit(1)
+
+    if args.chunk_worker:
+        return
+
+    for child in children:
+        child.wait()
+
+    if not job.is_complete():
+        print("Aguardando segmentos em processamento por outros workers.")
+        job.wait(process_chunk)
+
+    try:
+        job.finalize(out_path)
+    except subprocess.CalledProcessError as e:
+        print(f"Erro ao concatenar segmentos: {e.stderr.decode(errors='ignore')[-500:]}")
+        sys.exit(1)
+
 def main():
     parser = argparse.ArgumentParser(description="Deepfake em Tempo Real")
     parser.add_argument("--source", help="Caminho para imagem de origem inicial", required=True)
-    parser.add_argument("--model", help="Caminho para modelo inswapper", default="models/inswapper_128_fp16.onnx")
+    parser.add_argument("--model", help="Caminho para modelo inswapper (padrão: do perfil de execução ou models/inswapper_128_fp16.onnx)", default=None)
     parser.add_argument("--max-workers", type=int, default=None, help="Número máximo de threads (workers). Menos = menos latência, Mais = mais FPS.")
-    parser.add_argument("--detect-interval", type=int, default=5, help="Intervalo de quadros para detecção de rosto. Maior = mais FPS.")
+    parser.add_argument("--detect-interval", type=int, default=None, help="Intervalo de quadros para detecção de rosto. Maior = mais FPS (padrão: do perfil de execução ou 5).")
+    parser.add_argument("--det-size", type=int, default=None, help="Tamanho base da detecção (padrão: do perfil de execução ou 320).")
+    parser.add_argument("--intra-op-threads", type=int, default=None, help="Threads do ONNX Runtime por sessão (padrão: do perfil de execução ou do ORT).")
+    parser.add_argument("--runtime-profile", default=RUNTIME_PROFILE, help="Perfil gerado por tools/probe_hardware.py.")
+    parser.add_argument("--no-runtime-profile", action="store_true", help="Ignora o perfil de execução da máquina.")
+    parser.add_argument("--det-sizes", default=None, help="Níveis da pirâmide de detecção, ex.: 160,256,320,480,640.")
+    parser.add_argument("--roi-detect", action="store_true", help="Detecta apenas ao redor dos rostos já conhecidos entre varreduras completas.")
+    parser.add_argument("--full-sweep-interval", type=int, default=10, help="Detecções entre varreduras completas no modo --roi-detect.")
+    parser.add_argument("--deadline-ms", type=float, default=100.0, help="Prazo por quadro no modo tempo real; quadros atrasados são descartados em favor do mais recente.")
     parser.add_argument("--camera-fps", type=int, default=30, help="FPS desejado para a webcam.")
+    parser.add_argument("--camera-size", default="1920x1080", help="Resolução solicitada à webcam (LARGURAxALTURA).")
+    parser.add_argument("--camera-fourcc", choices=("MJPG", "YUYV", "auto"), default="MJPG", help="Formato solicitado à webcam. MJPG permite resoluções altas a 30 FPS em câmeras UVC.")
+    parser.add_argument("--preview-size", default="960x540", help="Tamanho máximo da janela de pré-visualização (LARGURAxALTURA ou 'full'). A interface é desenhada só na pré-visualização.")
     parser.add_argument("--virtual-cam", action="store_true", help="Ativa saída para câmera virtual (OBS Virtual Camera).")
+    parser.add_argument("--vcam-format", choices=('auto',) + PIXEL_FORMATS, default="auto", help="Formato de pixel da câmera virtual (auto = formato nativo do backend).")
+    parser.add_argument("--vcam-backend", choices=VCAM_BACKENDS, default="auto", help="Backend da câmera virtual ('null' descarta os quadros, para testes).")
+    parser.add_argument("--vcam-device", default=None, help="Dispositivo da câmera virtual (ex.: /dev/video10 com v4l2loopback).")
+    parser.add_argument("--input-uri", default=None, help="Fonte de quadros do modo tempo real (webcam:0, file:, raw:-, shm:nome, tcp://host:porta, unix:caminho).")
+    parser.add_argument("--input-size", default=None, help="Tamanho LARGURAxALTURA dos quadros de --input-uri raw.")
+    parser.add_argument("--output-uri", default="window", help="Destino dos quadros (window, null, raw:-, shm:nome, tcp://host:porta, unix:caminho).")
+    parser.add_argument("--replay", help="Usa um arquivo de vídeo (em loop, no ritmo original) no lugar da webcam no modo tempo real.")
     parser.add_argument("--video", help="Caminho para arquivo de vídeo de destino")
     parser.add_argument("--image", help="Caminho para imagem de destino")
     parser.add_argument("--gif", help="Caminho para arquivo GIF de destino")
     parser.add_argument("--out", help="Caminho para salvar o vídeo gravado/processado")
     parser.add_argument("--enhance", action="store_true", help="Ativa melhoria de rosto (GFPGAN) por padrão")
+    parser.add_argument("--enhance-model", choices=sorted(RESTORERS), default=None, help="Modelo de restauração de rosto (padrão: gfpgan-1.4).")
+    parser.add_argument("--enhance-tier", choices=sorted(QUALITY_TIERS), default=None, help="Nível de qualidade da melhoria; escolhe o modelo disponível do nível.")
+    parser.add_argument("--enhance-budget-ms", type=float, default=None, help="Latência máxima por rosto (ms); escolhe o melhor modelo que cabe no orçamento.")
+    parser.add_argument("--enhance-workers", type=int, default=1, help="Threads do estágio de melhoria (separado das threads de troca).")
+    parser.add_argument("--enhance-queue", type=int, default=None, help="Máximo de quadros aguardando o enhancer; acima disso o quadro sai sem melhoria (padrão: workers + 1).")
+    parser.add_argument("--session-pool", action="store_true", help="Uma sessão ONNX por worker (pesos compartilhados) para escalar com --max-workers.")
+    parser.add_argument("--tile-size", type=int, default=640, help="Lado dos blocos da detecção em imagens grandes (--image e modo servidor).")
+    parser.add_argument("--tile-overlap", type=float, default=0.25, help="Sobreposição entre blocos da detecção em imagens grandes (fração, mínimo 0.25).")
+    parser.add_argument("--identity-index", default=None, help="Pasta do índice de identidades (tools/build_identity_index.py).")
+    parser.add_argument("--source-id", default=None, help="Id da identidade de origem no --identity-index (substitui o rosto de --source).")
+    parser.add_argument("--swap-reuse-threshold", type=float, default=0.0, help="Diferença máxima (0-255) do recorte alinhado para reaproveitar a última troca de um rosto parado (tempo real). 0 desativa.")
+    parser.add_argument("--swap-refresh", type=int, default=5, help="Máximo de quadros seguidos reaproveitando a troca de um rosto antes de rodar o inswapper de novo.")
+    parser.add_argument("--swap-batch", type=int, default=16, help="Máximo de rostos por inferência do inswapper (requer variante com lote dinâmico; 1 desativa).")
+    parser.add_argument("--batch-frames", type=int, default=4, help="Quadros agrupados por inferência no processamento offline (vídeo/GIF).")
+    parser.add_argument("--no-optimized-models", action="store_true", help="Ignora as variantes otimizadas de models/manifest.json e usa os modelos originais.")
+    parser.add_argument("--enhance-reuse-threshold", type=float, default=3.0, help="Diferença máxima (0-255) para reaproveitar a última saída do GFPGAN de um rosto no modo tempo real (--image/--video/--gif/--serve nunca reaproveitam). 0 desativa.")
+    parser.add_argument("--enhance-refresh", type=int, default=10, help="Máximo de quadros seguidos reaproveitando a saída do GFPGAN antes de rodar o modelo de novo.")
+    parser.add_argument("--chunked", action="store_true", help="Processa --video em segmentos retomáveis (checkpoint em disco).")
+    parser.add_argument("--job-dir", default=None, help="Diretório do job em segmentos (compartilhável entre processos/máquinas).")
+    parser.add_argument("--chunk-seconds", type=int, default=30, help="Duração aproximada de cada segmento em segundos.")
+    parser.add_argument("--chunk-workers", type=int, default=1, help="Número de processos locais processando segmentos em paralelo.")
+    parser.add_argument("--chunk-worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--serve", action="store_true", help="Modo servidor: mantém os modelos carregados e atende jobs por API HTTP local.")
+    parser.add_argument("--listen", default="127.0.0.1:8765", help="Endereço host:porta do modo --serve.")
+    parser.add_argument("--unix-socket", default=None, help="Atende em um socket Unix em vez de TCP (modo --serve).")
+    parser.add_argument("--queue-size", type=int, default=32, help="Máximo de quadros na fila do servidor antes de responder 503.")
+    parser.add_argument("--batch-size", type=int, default=8, help="Máximo de quadros agrupados por lote no servidor.")
+    parser.add_argument("--batch-wait-ms", type=float, default=5.0, help="Espera máxima para completar um lote no servidor.")
     args = parser.parse_args()
 
+    # Aberto antes de tudo: com raw:- o stdout fica reservado para os quadros
+    try:
+        sink = open_sink(args.output_uri)
+    except Exception as e:
+        print(f"Erro ao abrir saída {args.output_uri}: {e}")
+        sys.exit(1)
+
     # Procura imagens no diretório
     image_extensions = ['*.jpg', '*.jpeg', '*.png', '*.bmp']
     image_files = []
@@ -143,15 +285,42 @@ def main():
     print(f"Imagens disponíveis: {len(image_files)}")
     print("Inicializando.")
     try:
-        swapper = FaceSwapper(args.model, max_workers=args.max_workers)
+        det_sizes = tuple(int(v) for v in args.det_sizes.split(',')) if args.det_sizes else None
+        # Reaproveitamento da saída do GFPGAN só no modo tempo real: nos modos offline a
+        # qualidade de cada quadro vale mais que o tempo economizado
+        realtime = not (args.serve or args.image or args.video or args.gif)
+        swapper = FaceSwapper(args.model, max_workers=args.max_workers, det_sizes=det_sizes,
+                              roi_detect=args.roi_detect, full_sweep_interval=args.full_sweep_interval,
+                              enhance_cache_threshold=args.enhance_reuse_threshold if realtime else 0.0,
+                              enhance_cache_max_reuse=args.enhance_refresh,
+                              enhance_model=args.enhance_model, enhance_tier=args.enhance_tier,
+                              enhance_budget_ms=args.enhance_budget_ms,
+                              enhance_workers=args.enhance_workers, enhance_queue_size=args.enhance_queue,
+                              session_pool=args.session_pool, optimized_models=not args.no_optimized_models,
+                              swap_batch_size=args.swap_batch, batch_frames=args.batch_frames,
+                              swap_cache_threshold=args.swap_reuse_threshold, swap_cache_max_reuse=args.swap_refresh,
+                              tile_size=args.tile_size, tile_overlap=args.tile_overlap,
+                              identity_index=args.identity_index,
+                              det_size=(args.det_size, args.det_size) if args.det_size else None,
+                              intra_op_threads=args.intra_op_threads, detect_interval=args.detect_interval,
+                              runtime_profile=None if args.no_runtime_profile else args.runtime_profile)
         swapper.set_source_image(image_files[current_image_index])
+        if args.source_id:
+            swapper.set_source_by_id(args.source_id)
         if args.enhance:
-            swapper.enhancement_enabled = True
-            print("Enhancer ativado por padrão.")
+            if swapper.set_enhancement(True, block=True):
+                print("Enhancer ativado por padrão.")
     except Exception as e:
         print(f"Erro ao inicializar swapper: {e}")
         sys.exit(1)
 
+    # Modo servidor (sem janela): os modelos ficam carregados entre os jobs
+    if args.serve:
+        from src.server import serve
+        serve(swapper, listen=args.listen, unix_socket=args.unix_socket, queue_size=args.queue_size,
+              batch_size=args.batch_size, batch_wait_ms=args.batch_wait_ms)
+        return
+
     # Modo de Imagem Estática
     if args.image:
         print(f"Processando imagem única: {args.image}")
@@ -160,8 +329,9 @@ def main():
             print("Erro: Não foi possível ler a imagem de destino.")
             sys.exit(1)
         
-        # Detecta rostos na imagem alvo
-        faces = swapper.app.get(target_img)
+        # Detecta rostos na imagem alvo (em blocos sobrepostos se a imagem for grande)
+        faces = swapper.detect_still(target_img)
+        print(f"{len(faces)} rosto(s) detectado(s).")
         res = target_img.copy()
         
         # Realiza a troca
@@ -179,7 +349,7 @@ def main():
         if args.out:
             out_path = args.out
         else:
-            source_name = os.path.splitext(os.path.basename(image_files[current_image_index]))[0]
+            source_name = os.path.basename(swapper.source_id or os.path.splitext(image_files[current_image_index])[0])
             target_name = os.path.splitext(os.path.basename(args.image))[0]
             filename = f"processed_{target_name}_with_{source_name}_{int(time.time())}.jpg"
             out_path = os.path.join("outputs", filename)
@@ -206,7 +376,7 @@ def main():
             filename = args.out
         else:
             video_name = os.path.splitext(os.path.basename(args.video))[0]
-            source_name = os.path.splitext(os.path.basename(image_files[current_image_index]))[0]
+            source_name = os.path.basename(swapper.source_id or os.path.splitext(image_files[current_image_index])[0])
             filename = f"processed_{video_name}_with_{source_name}_{int(time.time())}.mp4"
 
         if not os.path.isabs(filename) and not args.out:
@@ -214,54 +384,51 @@ def main():
         else:
              out_path = filename
 
-        # Se moviepy estiver disponível, usa ele para preservar áudio
-        if MOVIEPY_AVAILABLE:
-            print("Usando MoviePy para processamento com áudio.")
+        # Processamento em segmentos retomáveis
+        if args.chunked:
+            process_video_chunked(args, swapper, image_files[current_image_index], out_path)
+            return
+
+        # Se ffmpeg ou moviepy estiverem disponíveis, preserva o áudio
+        if FFmpegVideoReader.available() or MOVIEPY_AVAILABLE:
+            print("Usando FFmpeg/MoviePy para processamento com áudio.")
             try:
                 import tempfile
                 import subprocess
                 
-                clip = VideoFileClip(args.video)
-                fps = clip.fps
-                width, height = clip.size
+                frames, fps, (width, height), total_frames, close_video = open_video_frames(args.video)
                 
-                # Cria arquivo temporário para vídeo sem áudio
-                temp_video = tempfile.NamedTemporaryFile(suffix='.mp4', delete=False).name
+                try:
+                    # Cria arquivo temporário para vídeo sem áudio
+                    temp_video = tempfile.NamedTemporaryFile(suffix='.mp4', delete=False).name
                 
-                # Processa frames manualmente usando OpenCV writer
-                fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-                out_writer = cv2.VideoWriter(temp_video, fourcc, fps, (width, height))
+                    # Processa frames manualmente usando OpenCV writer
+                    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+                    out_writer = cv2.VideoWriter(temp_video, fourcc, fps, (width, height))
                 
-                frame_count = 0
-                total_frames = int(clip.duration * fps)
-                start_time = time.time()
+                    frame_count = 0
+                    start_time = time.time()
                 
-                print(f"Processando {total_frames} frames.")
+                    print(f"Processando {total_frames} frames.")
                 
-                # Itera sobre os frames
-                for frame_rgb in clip.iter_frames():
-                    # MoviePy usa RGB, OpenCV usa BGR
-                    frame_rgb = np.array(frame_rgb)
-                    frame_bgr = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2BGR)
-                    
-                    # Detecta e troca faces
-                    faces = swapper._detect_faces_downscale(frame_bgr, scale=0.5)
-                    try:
-                        res_bgr = swapper._swap_worker(frame_bgr, faces, swapper.source_face)
-                    except Exception:
-                        res_bgr = frame_bgr
-                    
-                    out_writer.write(res_bgr)
+                    # Detecta faces quadro a quadro e troca em grupos de --batch-frames quadros
+                    detected = ((frame_bgr, swapper.detect_faces(frame_bgr, small=small, small_scale=0.5))
+                                for frame_bgr, small in frames)
+                    for res_bgr in swapper.swap_stream(detected):
+                        out_writer.write(res_bgr)
                     
-                    frame_count += 1
-                    if frame_count % 10 == 0:
-                        elapsed = time.time() - start_time
-                        fps_proc = frame_count / elapsed if elapsed > 0 else 0
-                        progress = (frame_count / total_frames) * 100 if total_frames > 0 else 0
-                        print(f"\rProcessando: {progress:.1f}% | FPS: {fps_proc:.2f} | Frame: {frame_count}/{total_frames}", end="")
+                        frame_count += 1
+                        if frame_count % 10 == 0:
+                            elapsed = time.time() - start_time
+                            fps_proc = frame_count / elapsed if elapsed > 0 else 0
+                            progress = (frame_count / total_frames) * 100 if total_frames > 0 else 0
+                            print(f"\rProcessando: {progress:.1f}% | FPS: {fps_proc:.2f} | Frame: {frame_count}/{total_frames}", end="")
                 
-                print()  # Nova linha
-                out_writer.release()
+                    print()  # Nova linha
+                    out_writer.release()
+                finally:
+                    # Encerra o processo do ffmpeg mesmo se o processamento falhar
+                    close_video()
                 
                 # Combina vídeo processado com áudio original usando ffmpeg
                 print("Combinando com áudio original.")
@@ -288,10 +455,9 @@ def main():
                     if os.path.exists(temp_video) and temp_video != out_path:
                         os.remove(temp_video)
                 
-                clip.close()
                 return
             except Exception as e:
-                print(f"Erro com MoviePy: {e}")
+                print(f"Erro com FFmpeg/MoviePy: {e}")
                 print("Tentando fallback para OpenCV (sem áudio).")
 
 
@@ -309,17 +475,14 @@ def main():
         frame_count = 0
         start_time = time.time()
         
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            faces = swapper._detect_faces_downscale(frame, scale=0.5)
-            try:
-                res = swapper._swap_worker(frame, faces, swapper.source_face)
-            except Exception as e:
-                res = frame
-                
+        def read_frames():
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    return
+                yield frame, swapper.detect_faces(frame)
+
+        for res in swapper.swap_stream(read_frames()):
             out.write(res)
             
             frame_count += 1
@@ -349,7 +512,7 @@ def main():
             filename = args.out
         else:
             gif_name = os.path.splitext(os.path.basename(args.gif))[0]
-            source_name = os.path.splitext(os.path.basename(image_files[current_image_index]))[0]
+            source_name = os.path.basename(swapper.source_id or os.path.splitext(image_files[current_image_index])[0])
             filename = f"processed_{gif_name}_with_{source_name}_{int(time.time())}.gif"
 
         if not os.path.isabs(filename) and not args.out:
@@ -360,43 +523,35 @@ def main():
         try:
             import imageio
             
-            if MOVIEPY_AVAILABLE:
-                clip = VideoFileClip(args.gif)
+            if FFmpegVideoReader.available() or MOVIEPY_AVAILABLE:
+                video_frames, fps, _, total_frames, close_video = open_video_frames(args.gif)
                 # Tenta obter FPS, se não tiver (comum em alguns GIFs), assume 15
-                fps = clip.fps if clip.fps else 15 
+                fps = fps if fps else 15 
                 
-                frames = []
-                # Estimativa de frames
-                total_frames = int(clip.duration * fps) if clip.duration else "Desconhecido"
-                print(f"Lendo GIF.")
+                try:
+                    frames = []
+                    print(f"Lendo GIF.")
                 
-                frame_count = 0
-                for frame_rgb in clip.iter_frames():
-                    # MoviePy retorna RGB
-                    frame_rgb = np.array(frame_rgb)
-                    frame_bgr = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2BGR)
+                    frame_count = 0
+                    detected = ((frame_bgr, swapper.detect_faces(frame_bgr, small=small, small_scale=0.5))
+                                for frame_bgr, small in video_frames)
+                    for res_bgr in swapper.swap_stream(detected):
+                        # Converte de volta para RGB para o GIF
+                        res_rgb = cv2.cvtColor(res_bgr, cv2.COLOR_BGR2RGB)
+                        frames.append(res_rgb)
                     
-                    # Detecta e troca faces
-                    faces = swapper._detect_faces_downscale(frame_bgr, scale=0.5)
-                    try:
-                        res_bgr = swapper._swap_worker(frame_bgr, faces, swapper.source_face)
-                    except Exception:
-                        res_bgr = frame_bgr
-                        
-                    # Converte de volta para RGB para o GIF
-                    res_rgb = cv2.cvtColor(res_bgr, cv2.COLOR_BGR2RGB)
-                    frames.append(res_rgb)
-                    
-                    frame_count += 1
-                    print(f"\rProcessando frame: {frame_count}", end="")
+                        frame_count += 1
+                        print(f"\rProcessando frame: {frame_count}", end="")
                 
-                print("\nSalvando GIF.")
-                # Salva usando imageio
-                imageio.mimsave(out_path, frames, fps=fps, loop=0)
-                print(f"Salvo em: {out_path}")
-                clip.close()
+                    print("\nSalvando GIF.")
+                    # Salva usando imageio
+                    imageio.mimsave(out_path, frames, fps=fps, loop=0)
+                    print(f"Salvo em: {out_path}")
+                finally:
+                    # Encerra o processo do ffmpeg mesmo se o processamento falhar
+                    close_video()
             else:
-                print("Erro: MoviePy necessário para processar GIFs.")
+                print("Erro: FFmpeg ou MoviePy necessário para processar GIFs.")
                 sys.exit(1)
                 
         except Exception as e:
@@ -405,18 +560,38 @@ def main():
         return
 
     # Modo Webcam (Real-time)
-    print(f"Iniciando webcam com {args.camera_fps} FPS solicitados.")
-    webcam = WebcamStream(fps=args.camera_fps).start()
+    if args.input_uri:
+        print(f"Lendo quadros de {args.input_uri}.")
+        input_size = parse_size(args.input_size) if args.input_size else None
+        webcam = open_source(args.input_uri, size=input_size, fps=args.camera_fps,
+                             camera_size=parse_size(args.camera_size),
+                             fourcc=None if args.camera_fourcc == 'auto' else args.camera_fourcc)
+    elif args.replay:
+        # Reproduz gravação pelo pipeline ao vivo (testes de carga)
+        print(f"Reproduzindo {args.replay} no lugar da webcam.")
+        webcam = VideoFileStream(args.replay, realtime=True, loop=True).start()
+    else:
+        print(f"Iniciando webcam com {args.camera_fps} FPS solicitados.")
+        camera_width, camera_height = parse_size(args.camera_size)
+        webcam = WebcamStream(fps=args.camera_fps, width=camera_width, height=camera_height,
+                              fourcc=None if args.camera_fourcc == 'auto' else args.camera_fourcc).start()
 
     # Inicializa câmera virtual se solicitado
     vcam = None
     if args.virtual_cam:
         try:
-            import pyvirtualcam
-            # Tenta inicializar com resolução padrão
-            # é usado o valor que foi definido na WebcamStream.
-            vcam = pyvirtualcam.Camera(width=1920, height=1080, fps=args.camera_fps, fmt=pyvirtualcam.PixelFormat.BGR)
-            print(f"[VirtualCam] Câmera virtual iniciada: {vcam.device}")
+            # Resolução negociada a partir do quadro real da webcam (sem resize por quadro)
+            first_frame = None
+            deadline = time.time() + 5.0
+            while first_frame is None and time.time() < deadline:
+                first_frame = webcam.read()
+                if first_frame is None:
+                    time.sleep(0.05)
+            if first_frame is None:
+                raise RuntimeError("Nenhum quadro recebido da webcam")
+            height, width = first_frame.shape[:2]
+            vcam = VirtualCamOutput(width, height, fps=args.camera_fps, fmt=args.vcam_format,
+                                    backend=args.vcam_backend, device=args.vcam_device).start()
         except ImportError:
             print("Erro: 'pyvirtualcam' não instalado. Execute: pip install pyvirtualcam")
             sys.exit(1)
@@ -425,30 +600,42 @@ def main():
             print("Certifique-se que o OBS Studio está instalado (ou outro driver de câmera virtual).")
             vcam = None
 
-    print("Controles:")
-    print("  'q': Sair")
-    print("  'n': Próxima imagem")
-    print("  'p': Imagem anterior")
-    print("  'x': Ativar/Desativar troca")
-    print("  'e': Ativar/Desativar melhoria de rosto (GFPGAN)")
-    print("  'r': Iniciar/Parar gravação")
-    print("  'u': Mostrar/Ocultar Interface (UI)")
+    # Sem janela quando a saída é outro destino (sem teclado; Ctrl+C para sair)
+    show_window = sink is None
+    preview = None
+    if show_window:
+        # Exibição reduzida em thread própria; a interface não entra no quadro de saída
+        preview_size = None if args.preview_size == 'full' else parse_size(args.preview_size)
+        preview = PreviewWindow(max_size=preview_size).start()
+
+    if preview is not None:
+        # Teclas só funcionam com a janela de pré-visualização
+        print("Controles:")
+        print("  'q': Sair")
+        print("  'n': Próxima imagem")
+        print("  'p': Imagem anterior")
+        print("  'x': Ativar/Desativar troca")
+        print("  'e': Ativar/Desativar melhoria de rosto (GFPGAN)")
+        print("  'r': Iniciar/Parar gravação")
+        print("  'u': Mostrar/Ocultar Interface (UI)")
+    else:
+        print("Modo sem janela: Ctrl+C para sair.")
     
     fps_start_time = time.time()
     fps_frame_count = 0
     fps = 0
     swap_enabled = True
-    show_ui = True
+    show_ui = show_window
+    # Latência por quadro: da captura até a saída
+    latency = LatencyStats()
     
-    from collections import deque
-    # Buffer para armazenar futures pendentes. 
-    # Tamanho = workers + 1 minimiza latência enquanto mantém workers ocupados.
-    # Acessa swapper.max_workers que foi adicionado ao swapper.py
-    buffer_size = getattr(swapper, 'max_workers', 4) + 1
-    pending_futures = deque(maxlen=buffer_size)
-    print(f"[Main] Tamanho do buffer de quadros: {buffer_size}")
+    # Quadros em processamento limitados à profundidade do pipeline (troca + melhoria).
+    # Sempre exibe o quadro concluído mais recente; quadros que ficaram para trás são descartados.
+    max_in_flight = getattr(swapper, 'pipeline_depth', 4)
+    scheduler = DeadlineScheduler(max_in_flight=max_in_flight, deadline_ms=args.deadline_ms)
+    print(f"[Main] Quadros em processamento: até {max_in_flight}, prazo {args.deadline_ms:.0f} ms")
     
-    current_image_name = os.path.basename(image_files[current_image_index])
+    current_image_name = swapper.source_id or os.path.basename(image_files[current_image_index])
 
     # Estado de gravação
     recording = False
@@ -457,214 +644,240 @@ def main():
     recording_start_time = 0
     recording_frame_count = 0
 
-    while True:
-        frame = webcam.read()
-        if frame is None:
-            continue
-            
-        if swap_enabled:
-            # 1. Envia quadro para o pool de workers
-            try:
-                future = swapper.process_frame_async(frame, detect_interval=args.detect_interval)
-                pending_futures.append(future)
-            except Exception as e:
-                print(f"Erro de envio: {e}")
+    # try/finally: Ctrl+C (modo sem janela) também libera entrada/saída e mostra o resumo
+    try:
+        while True:
+            frame, frame_ts = read_frame(webcam)
+            if frame is None:
+                # Fontes finitas (pipe, arquivo) encerram o loop no fim do stream
+                if getattr(webcam, 'finished', False):
+                    break
                 continue
+            
+            if swap_enabled:
+                # 1. Envia quadro para o pool de workers (com o pipeline cheio, o quadro é pulado)
+                if scheduler.full():
+                    scheduler.skip()
+                else:
+                    try:
+                        future = swapper.process_frame_async(frame)
+                        scheduler.submit(future, frame_ts)
+                    except Exception as e:
+                        print(f"Erro de envio: {e}")
+                        continue
+
+                # 2. Pega o quadro concluído mais recente; os anteriores são descartados
+                result, result_ts = scheduler.poll(timeout=scheduler.wait_timeout())
+                if result is None:
+                    # Nada novo pronto ainda (pipeline enchendo ou quadros atrasados)
+                    continue
+                output, output_ts = result, result_ts
+            else:
+                # Se desativado, descarta os pendentes para não mostrar frames antigos ao reativar
+                scheduler.clear()
+                output = frame
+                output_ts = frame_ts
 
-            # 2. Recupera resultado se o buffer estiver cheio (ou apenas para manter o fluxo)
-            # Aguarda o quadro mais antigo ficar pronto.
-            if len(pending_futures) >= buffer_size - 1:
+            # Envia para câmera virtual (conversão e ritmo ficam na thread da câmera virtual)
+            if vcam:
                 try:
-                    # Remove o future mais antigo e aguarda por ele
-                    output = pending_futures.popleft().result()
+                    vcam.submit(output)
                 except Exception as e:
-                    print(f"Erro de processamento: {e}")
-                    output = frame # Fallback se houver erro
-            else:
-                # Buffer enchendo
-                # Espera um pouco para encher o pipeline ou mostra quadro bruto para evitar congelamento inicial
-                # Continua enchendo o buffer pelos primeiros quadros
-                continue
-        else:
-            # Se desativado, limpa o buffer para não mostrar frames antigos ao reativar
-            if pending_futures:
-                pending_futures.clear()
-            output = frame
+                    print(f"Erro na câmera virtual: {e}")
 
-        # Envia para câmera virtual
-        if vcam:
-            try:
-                # Garante que o tamanho do frame corresponde ao esperado pela câmera virtual
-                if output.shape[1] != vcam.width or output.shape[0] != vcam.height:
-                    output_vcam = cv2.resize(output, (vcam.width, vcam.height))
-                    vcam.send(output_vcam)
-                else:
-                    vcam.send(output)
-                    
-                vcam.sleep_until_next_frame()
-            except Exception as e:
-                print(f"Erro na câmera virtual: {e}")
-
-        # Cálculo de FPS
-        fps_frame_count += 1
-        if time.time() - fps_start_time > 1.0:
-            fps = fps_frame_count / (time.time() - fps_start_time)
-            fps_frame_count = 0
-            fps_start_time = time.time()
-
-        # UI Overlay
-        if show_ui:
-            cv2.putText(output, f"FPS: {fps:.2f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-            cv2.putText(output, f"Img: {current_image_name}", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
-            
-            status_color = (0, 255, 0) if swap_enabled else (0, 0, 255)
-            status_text = "ON" if swap_enabled else "OFF"
-            cv2.putText(output, f"Status: {status_text}", (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.7, status_color, 2)
-
-            # Status do enhancer
-            enh_enabled = getattr(swapper, 'enhancement_enabled', False)
-            enh_color = (0, 255, 0) if enh_enabled else (0, 0, 255)
-            enh_text = "ON" if enh_enabled else "OFF"
-            cv2.putText(output, f"Enhance: {enh_text}", (10, 120), cv2.FONT_HERSHEY_SIMPLEX, 0.7, enh_color, 2)
-        
-        # Status de gravação
-        if recording:
+            # Envia para o destino configurado (antes da interface ser desenhada no quadro)
+            if sink:
+                try:
+                    sink.write(output, output_ts)
+                except Exception as e:
+                    print(f"Erro na saída {args.output_uri}: {e}")
+            latency.add(output_ts)
+
+            # Cálculo de FPS
+            fps_frame_count += 1
+            if time.time() - fps_start_time > 1.0:
+                fps = fps_frame_count / (time.time() - fps_start_time)
+                fps_frame_count = 0
+                fps_start_time = time.time()
+
+            # UI Overlay (desenhada pela janela de pré-visualização, só na cópia reduzida)
+            overlay = None
             if show_ui:
-                cv2.circle(output, (50, 150), 10, (0, 0, 255), -1)
-                cv2.putText(output, "REC", (70, 160), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+                overlay = [(f"FPS: {fps:.2f} | Lat: {latency.summary()['avg']:.0f} ms | Fora do prazo: {scheduler.miss_rate() * 100:.0f}%", (0, 255, 0)),
+                           (f"Img: {current_image_name}", (255, 255, 0))]
             
-            if video_writer is None:
-                # Inicia gravação de áudio
-                audio_recorder = AudioRecorder()
-                audio_recorder.start()
-
-                # Cria pasta outputs se não existir
-                if not os.path.exists("outputs"):
-                    os.makedirs("outputs")
+                status_color = (0, 255, 0) if swap_enabled else (0, 0, 255)
+                status_text = "ON" if swap_enabled else "OFF"
+                if swap_enabled and swapper.swap_cache is not None:
+                    status_text += f" (reuso {swapper.swap_reuse_rate() * 100:.0f}%)"
+                overlay.append((f"Status: {status_text}", status_color))
+
+                # Status do enhancer
+                enh_enabled = getattr(swapper, 'enhancement_enabled', False)
+                enh_color = (0, 255, 0) if enh_enabled else (0, 0, 255)
+                enh_text = f"ON [{swapper.enhancer.restorer}]" if enh_enabled and swapper.enhancer else ("ON" if enh_enabled else "OFF")
+                enh_cache = getattr(swapper.enhancer, 'cache', None)
+                if enh_enabled and enh_cache is not None:
+                    enh_text += f" (cache {enh_cache.hit_rate() * 100:.0f}%)"
+                if enh_enabled and swapper.pipeline_stats['enhance_skipped']:
+                    enh_text += f" (pulados {swapper.enhance_skip_rate() * 100:.0f}%)"
+                overlay.append((f"Enhance: {enh_text}", enh_color))
+        
+            # Status de gravação
+            if recording:
+                if video_writer is None:
+                    # Inicia gravação de áudio
+                    audio_recorder = AudioRecorder()
+                    audio_recorder.start()
+
+                    # Cria pasta outputs se não existir
+                    if not os.path.exists("outputs"):
+                        os.makedirs("outputs")
                 
-                # Usa mp4v para melhor compatibilidade com áudio aac
-                fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-                filename = args.out if args.out else f"output_{int(time.time())}.mp4"
-                # Se não for caminho absoluto, salva em outputs/
-                if not os.path.isabs(filename) and not args.out:
-                     out_path = os.path.join("outputs", filename)
-                else:
-                     out_path = filename
+                    # Usa mp4v para melhor compatibilidade com áudio aac
+                    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+                    filename = args.out if args.out else f"output_{int(time.time())}.mp4"
+                    # Se não for caminho absoluto, salva em outputs/
+                    if not os.path.isabs(filename) and not args.out:
+                         out_path = os.path.join("outputs", filename)
+                    else:
+                         out_path = filename
                      
-                video_writer = cv2.VideoWriter(out_path, fourcc, 30.0, (output.shape[1], output.shape[0]))
-                print(f"Gravando em: {out_path}")
-                recording_start_time = time.time()
-                recording_frame_count = 0
+                    video_writer = cv2.VideoWriter(out_path, fourcc, 30.0, (output.shape[1], output.shape[0]))
+                    print(f"Gravando em: {out_path}")
+                    recording_start_time = time.time()
+                    recording_frame_count = 0
             
-            video_writer.write(output)
-            recording_frame_count += 1
-        elif video_writer:
-            video_writer.release()
-            video_writer = None            
-            # Para gravação de áudio e combina
-            if audio_recorder:
-                print("Processando áudio.")
-                temp_audio = audio_recorder.stop()
+                video_writer.write(output)
+                recording_frame_count += 1
+            elif video_writer:
+                video_writer.release()
+                video_writer = None            
+                # Para gravação de áudio e combina
+                if audio_recorder:
+                    print("Processando áudio.")
+                    temp_audio = audio_recorder.stop()
                 
-                if temp_audio and os.path.exists(temp_audio):
-                    print("Combinando áudio e vídeo.")
-                    # Cria nome para arquivo temporário de vídeo
-                    temp_video = out_path.replace(".mp4", "_temp.mp4")
-                    if temp_video == out_path:
-                        temp_video = out_path + "_temp.mp4"
+                    if temp_audio and os.path.exists(temp_audio):
+                        print("Combinando áudio e vídeo.")
+                        # Cria nome para arquivo temporário de vídeo
+                        temp_video = out_path.replace(".mp4", "_temp.mp4")
+                        if temp_video == out_path:
+                            temp_video = out_path + "_temp.mp4"
                     
-                    try:
-                        if os.path.exists(out_path):
-                            # Renomeia vídeo original para temp
-                            # Se arquivo temp já existe, remove antes
-                            if os.path.exists(temp_video):
-                                os.remove(temp_video)
+                        try:
+                            if os.path.exists(out_path):
+                                # Renomeia vídeo original para temp
+                                # Se arquivo temp já existe, remove antes
+                                if os.path.exists(temp_video):
+                                    os.remove(temp_video)
                                 
-                            os.rename(out_path, temp_video)
+                                os.rename(out_path, temp_video)
                             
-                            # Calcula FPS real
-                            elapsed_recording = time.time() - recording_start_time
-                            actual_fps = recording_frame_count / elapsed_recording if elapsed_recording > 0 else 30.0
-                            print(f"FPS real da gravação: {actual_fps:.2f}")
-
-                            # Combina usando ffmpeg com re-encode para ajustar FPS
-                            import subprocess
-                            subprocess.run([
-                                'ffmpeg', '-y', 
-                                '-r', f'{actual_fps:.2f}', 
-                                '-i', temp_video, 
-                                '-i', temp_audio,
-                                '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '23',
-                                '-c:a', 'aac', 
-                                '-map', '0:v:0', '-map', '1:a:0',
-                                out_path
-                            ], check=True, capture_output=True)
+                                # Calcula FPS real
+                                elapsed_recording = time.time() - recording_start_time
+                                actual_fps = recording_frame_count / elapsed_recording if elapsed_recording > 0 else 30.0
+                                print(f"FPS real da gravação: {actual_fps:.2f}")
+
+                                # Combina usando ffmpeg com re-encode para ajustar FPS
+                                import subprocess
+                                subprocess.run([
+                                    'ffmpeg', '-y', 
+                                    '-r', f'{actual_fps:.2f}', 
+                                    '-i', temp_video, 
+                                    '-i', temp_audio,
+                                    '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '23',
+                                    '-c:a', 'aac', 
+                                    '-map', '0:v:0', '-map', '1:a:0',
+                                    out_path
+                                ], check=True, capture_output=True)
                             
-                            print(f"Gravação concluída com áudio: {out_path}")
+                                print(f"Gravação concluída com áudio: {out_path}")
                             
-                            # Limpa arquivos temporários
-                            if os.path.exists(temp_video):
-                                os.remove(temp_video)
-                            if os.path.exists(temp_audio):
-                                os.remove(temp_audio)
-                        else:
-                            print("Erro: Arquivo de vídeo não encontrado para merge.")
-                    except Exception as e:
-                        print(f"Erro ao combinar áudio: {e}")
-                        # Tenta restaurar vídeo original se falhar
-                        if os.path.exists(temp_video) and not os.path.exists(out_path):
-                            os.rename(temp_video, out_path)
-                else:
-                    print("Áudio não gravado ou erro ao salvar.")
+                                # Limpa arquivos temporários
+                                if os.path.exists(temp_video):
+                                    os.remove(temp_video)
+                                if os.path.exists(temp_audio):
+                                    os.remove(temp_audio)
+                            else:
+                                print("Erro: Arquivo de vídeo não encontrado para merge.")
+                        except Exception as e:
+                            print(f"Erro ao combinar áudio: {e}")
+                            # Tenta restaurar vídeo original se falhar
+                            if os.path.exists(temp_video) and not os.path.exists(out_path):
+                                os.rename(temp_video, out_path)
+                    else:
+                        print("Áudio não gravado ou erro ao salvar.")
                 
-                audio_recorder = None
-        
-        cv2.imshow("Deepfake Real-time", output)
+                    audio_recorder = None
         
-        key = cv2.waitKey(1) & 0xFF
-        if key == ord('q'):
-            break
-        elif key == ord('n'):
-            current_image_index = (current_image_index + 1) % len(image_files)
-            new_image = image_files[current_image_index]
-            print(f"Trocando para: {new_image}")
-            try:
-                swapper.set_source_image(new_image)
-                current_image_name = os.path.basename(new_image)
-                # Limpa buffer para evitar mistura de rostos antigos
-                pending_futures.clear() 
-            except Exception as e:
-                print(f"Erro ao trocar imagem: {e}")
-        elif key == ord('p'):
-            current_image_index = (current_image_index - 1) % len(image_files)
-            new_image = image_files[current_image_index]
-            print(f"Trocando para: {new_image}")
-            try:
-                swapper.set_source_image(new_image)
-                current_image_name = os.path.basename(new_image)
-                pending_futures.clear()
-            except Exception as e:
-                print(f"Erro ao trocar imagem: {e}")
-        elif key == ord('x'):
-            swap_enabled = not swap_enabled
-            print(f"Troca de rosto: {'Ativado' if swap_enabled else 'Desativado'}")
-        elif key == ord('e'):
-            if hasattr(swapper, 'toggle_enhancer'):
-                is_enabled = swapper.toggle_enhancer()
-                print(f"Enhancer: {'Ativado' if is_enabled else 'Desativado'}")
+            if preview:
+                preview.show(output, overlay, recording=recording and show_ui)
+                key = preview.poll_key()
             else:
-                print("Enhancer não disponível.")
-        elif key == ord('r'):
-            recording = not recording
-            print(f"Gravação: {'Iniciada' if recording else 'Parada'}")
-        elif key == ord('u'):
-            show_ui = not show_ui
-            print(f"Interface: {'Visível' if show_ui else 'Oculta'}")
-            
-    webcam.stop()
-    if vcam:
-        vcam.close()
-    cv2.destroyAllWindows()
+                key = 0xFF
+            if key == ord('q'):
+                break
+            elif key == ord('n'):
+                current_image_index = (current_image_index + 1) % len(image_files)
+                new_image = image_files[current_image_index]
+                print(f"Trocando para: {new_image}")
+                try:
+                    swapper.set_source_image(new_image)
+                    current_image_name = os.path.basename(new_image)
+                    # Descarta quadros pendentes para evitar mistura de rostos antigos
+                    scheduler.clear()
+                except Exception as e:
+                    print(f"Erro ao trocar imagem: {e}")
+            elif key == ord('p'):
+                current_image_index = (current_image_index - 1) % len(image_files)
+                new_image = image_files[current_image_index]
+                print(f"Trocando para: {new_image}")
+                try:
+                    swapper.set_source_image(new_image)
+                    current_image_name = os.path.basename(new_image)
+                    scheduler.clear()
+                except Exception as e:
+                    print(f"Erro ao trocar imagem: {e}")
+            elif key == ord('x'):
+                swap_enabled = not swap_enabled
+                print(f"Troca de rosto: {'Ativado' if swap_enabled else 'Desativado'}")
+            elif key == ord('e'):
+                if hasattr(swapper, 'toggle_enhancer'):
+                    is_enabled = swapper.toggle_enhancer()
+                    print(f"Enhancer: {'Ativado' if is_enabled else 'Desativado'}")
+                else:
+                    print("Enhancer não disponível.")
+            elif key == ord('r'):
+                recording = not recording
+                print(f"Gravação: {'Iniciada' if recording else 'Parada'}")
+            elif key == ord('u'):
+                show_ui = not show_ui
+                print(f"Interface: {'Visível' if show_ui else 'Oculta'}")
+    except KeyboardInterrupt:
+        print("\nInterrompido.")
+    finally:
+        if video_writer:
+            # Gravação em andamento: fecha o arquivo (sem o merge do áudio)
+            video_writer.release()
+            print(f"Gravação salva sem áudio: {out_path}")
+        if audio_recorder:
+            audio_recorder.stop()
+        webcam.stop()
+        if vcam:
+            vcam.stop()
+        if sink:
+            sink.close()
+        print(f"[Main] Latência por quadro: {latency}")
+        if sink:
+            print(f"[Main] Saída {args.output_uri}: {sink.frames} quadros, latência na escrita: {sink.latency}")
+        if hasattr(webcam, 'dropped'):
+            print(f"[Main] Entrada {args.input_uri}: {webcam.frames} quadros, {webcam.dropped} descartados (fila cheia ou perdidos pelo produtor)")
+        print(f"[Main] Prazos: {scheduler.summary()}")
+        if swapper.swap_cache is not None:
+            print(f"[Main] Trocas reaproveitadas: {swapper.swap_reuse_rate() * 100:.1f}% dos rostos")
+        if preview:
+            preview.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,149 @@
+"""
+Troca de rostos em lote com o inswapper.
+
+O INSwapper.get do insightface faz, para cada rosto, o alinhamento, uma inferência
+[1,3,128,128] e uma colagem que transforma máscaras do tamanho do quadro inteiro.
+Aqui todos os rostos (de um quadro ou de vários) são alinhados primeiro e inferidos
+juntos em um tensor [N,3,128,128]; a colagem é feita só na região do rosto.
+
+O lote depende de um modelo com a dimensão de lote dinâmica (gerado com
+tools/optimize_models.py --batch 0). Com o modelo original (lote 1 fixo) os rostos
+são inferidos um a um, ainda com a colagem restrita à região do rosto.
+"""
+import cv2
+import numpy as np
+from insightface.utils import face_align
+
+
+def paste_back(target, bgr_fake, M):
+    """
+    Cola o rosto trocado no quadro (no lugar), como o paste_back do INSwapper.
+
+    Mesma máscara (quadrado transformado, erodido e suavizado) e mesma mistura, mas
+    calculadas apenas no retângulo que contém o rosto mais a margem dos filtros.
+
+    Args:
+        target: Quadro BGR uint8 (alterado no lugar)
+        bgr_fake: Saída do inswapper (BGR uint8, size x size)
+        M: Matriz afim quadro -> recorte alinhado
+
+    Returns:
+        bool: False se o rosto está inteiramente fora do quadro
+    """
+    h, w = target.shape[:2]
+    size = bgr_fake.shape[0]
+    IM = cv2.invertAffineTransform(M)
+    corners = np.array([[0, 0], [size, 0], [0, size], [size, size]], dtype=np.float64)
+    pts = corners @ IM[:, :2].T + IM[:, 2]
+    (min_x, min_y), (max_x, max_y) = pts.min(axis=0), pts.max(axis=0)
+    # Erosão e desfoque alcançam no máximo ~lado/20 + 5 pixels além do quadrado
+    margin = int(max(max_x - min_x, max_y - min_y)) // 20 + 8
+    x0, y0 = max(int(min_x) - margin, 0), max(int(min_y) - margin, 0)
+    x1, y1 = min(int(np.ceil(max_x)) + margin + 1, w), min(int(np.ceil(max_y)) + margin + 1, h)
+    if x0 >= x1 or y0 >= y1:
+        return False
+
+    IM_roi = IM.copy()
+    IM_roi[0, 2] -= x0
+    IM_roi[1, 2] -= y0
+    roi_size = (x1 - x0, y1 - y0)
+    fake = cv2.warpAffine(bgr_fake, IM_roi, roi_size, borderValue=0.0)
+    mask = cv2.warpAffine(np.full((size, size), 255, dtype=np.float32), IM_roi, roi_size, borderValue=0.0)
+    mask[mask > 20] = 255
+
+    rows, cols = np.where(mask == 255)
+    if len(rows) == 0:
+        return False
+    mask_size = int(np.sqrt((rows.max() - rows.min()) * (cols.max() - cols.min())))
+    k = max(mask_size // 10, 10)
+    mask = cv2.erode(mask, np.ones((k, k), np.uint8), iterations=1)
+    k = max(mask_size // 20, 5)
+    mask = cv2.GaussianBlur(mask, (2 * k + 1, 2 * k + 1), 0)
+    mask /= 255
+    mask = mask[:, :, None]
+
+    roi = target[y0:y1, x0:x1]
+    merged = mask * fake + (1 - mask) * roi.astype(np.float32)
+    roi[:] = merged.astype(np.uint8)
+    return True
+
+
+class BatchedInswapper:
+    def __init__(self, inswapper, max_batch=16):
+        """
+        Args:
+            inswapper: INSwapper do insightface (sessão, emap e nomes de entrada/saída).
+                A sessão é lida a cada inferência (pode ser trocada por um SessionPool).
+            max_batch: Máximo de rostos por inferência.
+        """
+        self.model = inswapper
+        self.max_batch = max(1, max_batch)
+        self.size = inswapper.input_size[0]
+        batch_dim = inswapper.session.get_inputs()[0].shape[0]
+        # Lote fixo (normalmente 1) ou modelo sem lote dinâmico: um rosto por inferência
+        self.dynamic = self.max_batch > 1 and not isinstance(batch_dim, int)
+
+    def latent(self, source_face):
+        latent = np.dot(source_face.normed_embedding.reshape((1, -1)), self.model.emap)
+        return (latent / np.linalg.norm(latent)).astype(np.float32)
+
+    def _infer(self, blobs, latents):
+        outputs = []
+        step = self.max_batch if self.dynamic else 1
+        for start in range(0, len(blobs), step):
+            feed = {self.model.input_names[0]: blobs[start:start + step],
+                    self.model.input_names[1]: latents[start:start + step]}
+            try:
+                outputs.append(self.model.session.run(self.model.output_names, feed)[0])
+            except Exception as e:
+                if step == 1:
+                    raise
+                # Modelo declarado dinâmico mas que não aceita lote > 1: volta para um a um
+                print(f"[BatchedInswapper] Inferência em lote falhou ({e}); usando um rosto por inferência.")
+                self.dynamic = False
+                return self._infer(blobs, latents)
+        return np.concatenate(outputs, axis=0)
+
+    def swap(self, jobs, cache=None):
+        """
+        Troca vários rostos com uma inferência por lote.
+
+        Args:
+            jobs: Lista de (quadro, rosto alvo, rosto de origem)
+            cache: EnhancementCache opcional. Rostos cujo recorte alinhado quase não mudou
+                reaproveitam a saída anterior (colada com a matriz atual) sem inferência.
+
+        Returns:
+            list: Para cada job, (rosto trocado BGR uint8, matriz de alinhamento)
+        """
+        if not jobs:
+            return []
+        results = [None] * len(jobs)
+        crops, matrices, pending, latents = [], [], [], {}
+        for index, (frame, face, source_face) in enumerate(jobs):
+            aimg, M = face_align.norm_crop2(frame, face.kps, self.size)
+            signature = None
+            if cache is not None:
+                signature = cache.signature(aimg)
+                cached = cache.lookup(face.bbox, signature)
+                if cached is not None:
+                    results[index] = (cached, M)
+                    continue
+            crops.append(aimg)
+            matrices.append(M)
+            pending.append((index, face, signature))
+            if id(source_face) not in latents:
+                latents[id(source_face)] = self.latent(source_face)
+        if not crops:
+            return results
+
+        blobs = cv2.dnn.blobFromImages(crops, 1.0 / self.model.input_std, (self.size, self.size),
+                                       (self.model.input_mean,) * 3, swapRB=True)
+        latent_batch = np.concatenate([latents[id(jobs[index][2])] for index, _, _ in pending], axis=0)
+        pred = self._infer(blobs, latent_batch)
+        fakes = np.clip(255 * pred.transpose((0, 2, 3, 1)), 0, 255).astype(np.uint8)[..., ::-1]
+        for (index, face, signature), fake, M in zip(pending, fakes, matrices):
+            if cache is not None:
+                cache.store(face.bbox, signature, fake)
+            results[index] = (fake, M)
+        return results
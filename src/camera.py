@@ -1,53 +1,364 @@
 import cv2 
 from    threading import Thread 
+import threading
+import sys
 import time 
+import queue
+import shutil
+import subprocess
+import numpy as np
+
+def capture_backend():
+    # Backend de captura por sistema operacional
+    if sys.platform.startswith('win'):
+        # DirectShow evita erros do MSMF e inicializa mais rápido
+        return cv2.CAP_DSHOW
+    if sys.platform.startswith('linux'):
+        return cv2.CAP_V4L2
+    if sys.platform == 'darwin':
+        return cv2.CAP_AVFOUNDATION
+    return cv2.CAP_ANY
+
+
+def fourcc_to_str(value):
+    value = int(value)
+    return "".join(chr((value >> 8 * i) & 0xFF) for i in range(4)).strip('\x00')
+
 
 class WebcamStream: 
-    def __init__(self, src=0, fps=30): 
-        # Usa DirectShow (CAP_DSHOW) para Windows para evitar erros MSMF e melhorar a velocidade de inicialização 
-        self.stream = cv2.VideoCapture(src, cv2.CAP_DSHOW) 
-        (self.grabbed, self.frame) = self.stream.read() 
+    # Captura de webcam com negociação de formato antes do primeiro quadro.
+    # Com MJPEG, a thread de captura só retira os pacotes JPEG do driver (mantendo a fila
+    # do V4L2 vazia) e a decodificação acontece em threads próprias, apenas do pacote mais recente.
+    def __init__(self, src=0, fps=30, width=1920, height=1080, fourcc='MJPG', decode_threads=1): 
+        self.stream = cv2.VideoCapture(src, capture_backend()) 
         self.stopped = False 
-        # Define resolução, pode ser ajustado 
-        self.stream.set(cv2.CAP_PROP_FRAME_WIDTH, 1920) 
-        self.stream.set(cv2.CAP_PROP_FRAME_HEIGHT, 1080) 
+
+        # Ordem importa no V4L2: formato antes da resolução, FPS por último
+        if fourcc:
+            self.stream.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+        self.stream.set(cv2.CAP_PROP_FRAME_WIDTH, width) 
+        self.stream.set(cv2.CAP_PROP_FRAME_HEIGHT, height) 
         self.stream.set(cv2.CAP_PROP_FPS, fps)
 
+        if not self.stream.isOpened():
+            print(f"[WebcamStream] Erro: não foi possível abrir a câmera {src}")
+        self.mode = {
+            'backend': self.stream.getBackendName() if self.stream.isOpened() else None,
+            'fourcc': fourcc_to_str(self.stream.get(cv2.CAP_PROP_FOURCC)),
+            'width': int(self.stream.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(self.stream.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            'fps': self.stream.get(cv2.CAP_PROP_FPS),
+        }
+
+        # Pacotes MJPEG crus (decodificados fora da thread de captura)
+        self.raw_mjpeg = False
+        if self.mode['fourcc'] == 'MJPG':
+            self.raw_mjpeg = bool(self.stream.set(cv2.CAP_PROP_CONVERT_RGB, 0))
+        self.mode['decode'] = 'thread' if self.raw_mjpeg else 'driver'
+        if self.stream.isOpened():
+            print(f"[WebcamStream] Modo negociado: {self.mode['width']}x{self.mode['height']} @ "
+                  f"{self.mode['fps']:.0f} FPS ({self.mode['fourcc'] or '?'}, {self.mode['backend']}, "
+                  f"decodificação: {self.mode['decode']})")
+
+        self.frame = None
+        self.grabbed = False
+        self.packets = 0
+        self.decoded = 0
+        self.skipped_packets = 0
+        self._packet = None
+        self._packet_seq = 0
+        self._frame_seq = 0
+        self._cond = threading.Condition()
+        self.decode_threads = decode_threads
+        self.thread = None
+
+        (self.grabbed, first) = self.stream.read() 
+        self._publish_packet(first)
+
+    def _publish_packet(self, data):
+        if data is None:
+            return
+        if not self.raw_mjpeg or (data.ndim == 3 and data.shape[2] == 3):
+            # Backend já entregou BGR (não honrou CONVERT_RGB=0)
+            self.raw_mjpeg = False
+            self.frame = data
+            return
+        with self._cond:
+            if self._packet is not None:
+                self.skipped_packets += 1
+            self._packet_seq += 1
+            self._packet = (self._packet_seq, data)
+            self._cond.notify()
+
     def start(self): 
-        Thread(target=self.update, args=()).start() 
+        self.thread = Thread(target=self.update, args=(), daemon=True)
+        self.thread.start() 
+        for _ in range(self.decode_threads if self.raw_mjpeg else 0):
+            Thread(target=self._decode_loop, daemon=True).start()
         return self 
 
     def update(self): 
         while True: 
             if self.stopped: 
+                # Libera aqui: release() durante um read() em outra thread pode derrubar o processo
+                self.stream.release()
                 return 
-            (self.grabbed, self.frame) = self.stream.read() 
+            (self.grabbed, data) = self.stream.read() 
+            if self.grabbed:
+                self.packets += 1
+                self._publish_packet(data)
+            else:
+                time.sleep(0.005)
+
+    def _decode_loop(self):
+        while not self.stopped:
+            with self._cond:
+                while self._packet is None and not self.stopped:
+                    self._cond.wait(timeout=0.1)
+                if self.stopped:
+                    return
+                seq, data = self._packet
+                self._packet = None
+            # Um quadro novo por decodificação: o imdecode do Python não aceita buffer de saída, e o
+            # quadro publicado continua em uso no pipeline (futures em voo) após o próximo pacote
+            frame = cv2.imdecode(data.reshape(-1), cv2.IMREAD_COLOR)
+            if frame is None:
+                continue
+            with self._cond:
+                # Com várias threads de decodificação, nunca volta para um quadro mais antigo
+                if seq > self._frame_seq:
+                    self._frame_seq = seq
+                    self.frame = frame
+                    self.decoded += 1
 
     def read(self): 
         return self.frame 
 
     def stop(self): 
         self.stopped = True 
-        self.stream.release()
+        with self._cond:
+            self._cond.notify_all()
+        if self.thread is None:
+            self.stream.release()
+        else:
+            self.thread.join(timeout=1.0)
 
 class VideoFileStream:
-    def __init__(self, path):
+    # Leitura de arquivo de vídeo com decodificação em thread própria e fila limitada.
+    # start_frame/end_frame restringem a leitura a um intervalo (seek direto, sem decodificar o início).
+    # realtime=True imita a WebcamStream: read() retorna o quadro mais recente, no ritmo do FPS
+    # do arquivo, para reproduzir gravações no pipeline ao vivo (loop=True repete o trecho).
+    def __init__(self, path, queue_size=8, start_frame=0, end_frame=None, realtime=False, loop=False):
         self.stream = cv2.VideoCapture(path)
         self.stopped = False
         self.frame_count = int(self.stream.get(cv2.CAP_PROP_FRAME_COUNT))
-        self.fps = self.stream.get(cv2.CAP_PROP_FPS)
+        self.fps = self.stream.get(cv2.CAP_PROP_FPS) or 30.0
+        self.start_frame = start_frame
+        # None = lê até o read() falhar (CAP_PROP_FRAME_COUNT pode ser 0, -1 ou estimado)
+        self.end_frame = end_frame
+        self.realtime = realtime
+        self.loop = loop
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = None
+
+        # Último quadro decodificado (modo realtime) e seus metadados
+        self.frame = None
+        self.frame_index = -1
+        self.timestamp = 0.0
+        self.finished = False
+        self.next_index = 0
+        self.seek(start_frame)
+
+    def seek(self, frame_index):
+        # O backend FFmpeg do OpenCV posiciona no keyframe anterior e decodifica até o quadro pedido
+        if frame_index > 0:
+            self.stream.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+        elif self.next_index != 0:
+            self.stream.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self.next_index = frame_index
 
     def start(self):
+        if self.thread is None:
+            self.thread = Thread(target=self.update, args=(), daemon=True)
+            self.thread.start()
         return self
 
+    def _put(self, item):
+        # put com timeout para não travar a thread após stop()
+        while not self.stopped:
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def update(self):
+        pace_start = time.perf_counter()
+        pace_first = self.next_index
+        while not self.stopped:
+            grabbed = False
+            if self.end_frame is None or self.next_index < self.end_frame:
+                (grabbed, frame) = self.stream.read()
+
+            if not grabbed:
+                # Em loop, só volta ao início se a passada leu algum quadro (evita girar em vazio)
+                if self.loop and self.next_index > pace_first:
+                    self.seek(self.start_frame)
+                    pace_start = time.perf_counter()
+                    pace_first = self.next_index
+                    continue
+                self.finished = True
+                self._put(None)
+                return
+
+            index = self.next_index
+            self.next_index += 1
+            timestamp = self.stream.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+
+            if self.realtime:
+                # Mantém o ritmo do arquivo, como uma câmera
+                delay = pace_start + (index - pace_first) / self.fps - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                (self.frame, self.frame_index, self.timestamp) = (frame, index, timestamp)
+            elif not self._put((frame, index, timestamp)):
+                return
+
     def read(self):
+        frame, _, _ = self.read_with_meta()
+        return frame
+
+    def read_with_meta(self):
+        # Retorna (quadro, índice, timestamp em segundos) ou (None, -1, 0.0) no fim do intervalo
         if self.stopped:
-            return None
-        (grabbed, frame) = self.stream.read()
-        if not grabbed:
-            return None
+            return None, -1, 0.0
+        if self.realtime:
+            self.start()
+            # Sem loop, o fim do arquivo é sinalizado como na leitura offline (não repete o último quadro)
+            if self.finished and not self.loop:
+                return None, -1, 0.0
+            return self.frame, self.frame_index, self.timestamp
+        self.start()
+        item = self.queue.get()
+        if item is None:
+            # Mantém o marcador de fim para leituras seguintes
+            self.queue.put(None)
+            return None, -1, 0.0
+        (frame, self.frame_index, self.timestamp) = item
+        return frame, self.frame_index, self.timestamp
+
+    def stop(self):
+        self.stopped = True
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        self.stream.release()
+
+
+class FFmpegVideoReader:
+    # Leitor de vídeo offline via ffmpeg: decodificação multithread direto em bgr24,
+    # lida em buffers NumPy pré-alocados (readinto) por uma thread de leitura antecipada.
+    # O quadro retornado por read() é válido até a próxima chamada de read().
+    def __init__(self, path, threads=0, read_ahead=4, detect_scale=None):
+        from .video import probe_video
+
+        self.path = path
+        self.threads = threads
+        info = probe_video(path)
+        self.width = info['width']
+        self.height = info['height']
+        self.fps = info['fps']
+        self.frame_count = info['frames']
+        self.frame_bytes = self.width * self.height * 3
+
+        # read_ahead quadros podem estar prontos enquanto o consumidor segura mais um
+        self.buffers = [np.empty((self.height, self.width, 3), dtype=np.uint8) for _ in range(read_ahead + 1)]
+
+        # Versão reduzida para o ramo de detecção, redimensionada na thread de leitura
+        self.detect_scale = detect_scale
+        self.small_buffers = None
+        if detect_scale:
+            small_size = (max(1, int(self.width * detect_scale)), max(1, int(self.height * detect_scale)))
+            self.small_buffers = [np.empty((small_size[1], small_size[0], 3), dtype=np.uint8) for _ in self.buffers]
+
+        self.free = queue.Queue()
+        self.filled = queue.Queue()
+        for i in range(len(self.buffers)):
+            self.free.put(i)
+        self.current = None
+        self.process = None
+        self.thread = None
+        self.stopped = False
+
+    @staticmethod
+    def available():
+        return shutil.which('ffmpeg') is not None and shutil.which('ffprobe') is not None
+
+    def start(self):
+        cmd = ['ffmpeg', '-v', 'error', '-threads', str(self.threads), '-i', self.path,
+               '-map', '0:v:0', '-vsync', 'passthrough',
+               '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-']
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
+        self.thread = Thread(target=self.update, daemon=True)
+        self.thread.start()
+        return self
+
+    def _read_exact(self, view):
+        # readinto pode retornar leituras parciais em pipes
+        read = 0
+        while read < self.frame_bytes:
+            n = self.process.stdout.readinto(view[read:])
+            if not n:
+                return False
+            read += n
+        return True
+
+    def update(self):
+        while not self.stopped:
+            index = self.free.get()
+            if index is None:
+                break
+            frame = self.buffers[index]
+            if not self._read_exact(memoryview(frame).cast('B')):
+                break
+            if self.small_buffers is not None:
+                small = self.small_buffers[index]
+                cv2.resize(frame, (small.shape[1], small.shape[0]), dst=small, interpolation=cv2.INTER_AREA)
+            self.filled.put(index)
+        # Sinaliza fim do stream
+        self.filled.put(None)
+
+    def read(self):
+        frame, _ = self.read_with_small()
         return frame
 
+    def read_with_small(self):
+        # Devolve o buffer anterior para a thread de leitura
+        if self.current is not None:
+            self.free.put(self.current)
+            self.current = None
+        if self.stopped:
+            return None, None
+        index = self.filled.get()
+        if index is None:
+            self.filled.put(None)
+            return None, None
+        self.current = index
+        small = self.small_buffers[index] if self.small_buffers is not None else None
+        return self.buffers[index], small
+
+    def __iter__(self):
+        while True:
+            frame, small = self.read_with_small()
+            if frame is None:
+                return
+            yield frame, small
+
     def stop(self):
         self.stopped = True
-        self.stream.release()
\ No newline at end of file
+        self.free.put(None)
+        if self.process:
+            self.process.kill()
+            self.process.wait()
+        if self.thread:
+            self.thread.join(timeout=1.0)
@@ -0,0 +1,317 @@
+"""
+Detecção de rostos adaptativa à resolução.
+
+Em vez de reduzir sempre o quadro pela metade e detectar em 320x320, escolhe o
+tamanho de entrada do detector (um nível de uma pirâmide fixa) a partir do
+tamanho do quadro e dos rostos vistos na última detecção, sem descer abaixo do
+nível base. Uma passada barata no quadro inteiro é feita primeiro; apenas regiões
+onde um rosto era esperado e não foi encontrado são re-detectadas em recortes
+com mais resolução.
+
+No modo ROI (roi_mode=True), com rostos já conhecidos a detecção roda apenas em
+recortes expandidos ao redor das últimas posições, com uma varredura completa
+a cada full_sweep_interval chamadas para encontrar rostos novos.
+"""
+import concurrent.futures
+
+import cv2
+import numpy as np
+from insightface.app.common import Face
+
+# Tamanhos de entrada do detector (múltiplos de 32). Um conjunto fixo limita o
+# número de engines TensorRT construídas para shapes diferentes.
+DET_SIZES = (160, 256, 320, 480, 640)
+
+
+def bbox_iou(a, b):
+    x1 = max(a[0], b[0])
+    y1 = max(a[1], b[1])
+    x2 = min(a[2], b[2])
+    y2 = min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def nms_faces(faces, iou_thresh=0.4):
+    # Remove detecções duplicadas (ex.: mesmo rosto achado na passada global e num recorte)
+    faces = sorted(faces, key=lambda f: float(f.det_score), reverse=True)
+    kept = []
+    for face in faces:
+        if all(bbox_iou(face.bbox, k.bbox) < iou_thresh for k in kept):
+            kept.append(face)
+    return kept
+
+
+def run_detector(det_model, img, size, offset=(0, 0), scale=1.0):
+    """
+    Roda o detector em uma imagem e converte as detecções para coordenadas globais.
+
+    Args:
+        det_model: Modelo de detecção do InsightFace já preparado.
+        img: Imagem (ou recorte) BGR.
+        size: Lado da entrada quadrada do detector.
+        offset: Deslocamento somado às coordenadas (após a divisão por scale).
+        scale: Fator de redução de img em relação às coordenadas globais.
+
+    Returns:
+        list: Rostos (Face com bbox, kps e det_score).
+    """
+    bboxes, kpss = det_model.detect(img, input_size=(size, size))
+    faces = []
+    for i in range(bboxes.shape[0]):
+        bbox = bboxes[i, 0:4] / scale
+        bbox[[0, 2]] += offset[0]
+        bbox[[1, 3]] += offset[1]
+        kps = None
+        if kpss is not None:
+            kps = kpss[i] / scale + np.array(offset, dtype=np.float32)
+            kps = kps.astype(np.float32)
+        faces.append(Face(bbox=bbox.astype(np.float32), kps=kps, det_score=bboxes[i, 4]))
+    return faces
+
+
+class AdaptiveFaceDetector:
+    def __init__(self, det_model, det_sizes=DET_SIZES, base_size=320, min_face_px=20,
+                 crop_expand=2.0, match_iou=0.3, escalate_every=30, roi_mode=False, full_sweep_interval=10):
+        """
+        Args:
+            det_model: Modelo de detecção do InsightFace (SCRFD/RetinaFace) já preparado.
+            det_sizes: Níveis da pirâmide de tamanhos de entrada.
+            base_size: Menor nível das varreduras do quadro inteiro (usado quando não há rostos conhecidos).
+            min_face_px: Menor lado (em pixels na entrada do detector) para um rosto ser detectado com confiança.
+            crop_expand: Fator de expansão da bbox esperada ao re-detectar em recorte.
+            match_iou: IoU mínimo para considerar um rosto esperado como encontrado.
+            escalate_every: Sem rostos conhecidos, a cada N chamadas vazias faz uma passada no maior nível.
+            roi_mode: Detecta apenas ao redor dos rostos conhecidos entre varreduras completas.
+            full_sweep_interval: Número de chamadas entre varreduras completas no modo ROI.
+        """
+        self.det_model = det_model
+        self.det_sizes = tuple(sorted(det_sizes))
+        self.base_size = base_size
+        self.min_face_px = min_face_px
+        self.crop_expand = crop_expand
+        self.match_iou = match_iou
+        self.escalate_every = escalate_every
+        self.roi_mode = roi_mode
+        self.full_sweep_interval = full_sweep_interval
+
+        self.last_faces = []
+        self.empty_count = 0
+        self.since_sweep = 0
+        self.stats = {'calls': 0, 'crop_passes': 0, 'escalations': 0, 'roi_hits': 0, 'full_sweeps': 0}
+
+    def _level_for(self, extent, face_side):
+        # Menor nível em que um rosto de lado face_side (em um quadro de maior lado extent)
+        # fica com pelo menos min_face_px na entrada do detector
+        for size in self.det_sizes:
+            if face_side * size / extent >= self.min_face_px:
+                return size
+        return self.det_sizes[-1]
+
+    def _run(self, img, size, offset=(0, 0), scale=1.0):
+        return run_detector(self.det_model, img, size, offset=offset, scale=scale)
+
+    def choose_size(self, frame_shape):
+        extent = max(frame_shape[0], frame_shape[1])
+        if not self.last_faces:
+            return self.base_size
+        smallest = min(min(f.bbox[2] - f.bbox[0], f.bbox[3] - f.bbox[1]) for f in self.last_faces)
+        # Nunca abaixo do nível base: um nível menor só enxerga os rostos grandes já conhecidos
+        # e perderia rostos novos menores (a economia com rostos conhecidos fica com o modo ROI)
+        return max(self.base_size, self._level_for(extent, max(smallest, 1.0)))
+
+    def _expected_crop(self, frame, face):
+        h, w = frame.shape[:2]
+        x1, y1, x2, y2 = face.bbox
+        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+        half = max(x2 - x1, y2 - y1) * self.crop_expand / 2
+        cx1, cy1 = int(max(0, cx - half)), int(max(0, cy - half))
+        cx2, cy2 = int(min(w, cx + half)), int(min(h, cy + half))
+        return cx1, cy1, cx2, cy2
+
+    def detect_in_regions(self, frame, regions):
+        # Re-detecção em recortes (coordenadas de quadro) com resolução próxima da nativa
+        faces = []
+        for (x1, y1, x2, y2) in regions:
+            if x2 - x1 < 8 or y2 - y1 < 8:
+                continue
+            crop = frame[y1:y2, x1:x2]
+            extent = max(crop.shape[0], crop.shape[1])
+            size = next((s for s in self.det_sizes if s >= extent), self.det_sizes[-1])
+            faces.extend(self._run(crop, size, offset=(x1, y1)))
+            self.stats['crop_passes'] += 1
+        return faces
+
+    def detect(self, frame, small=None, small_scale=1.0):
+        """
+        Detecta rostos no quadro.
+
+        Args:
+            frame: Quadro BGR em resolução original.
+            small: Versão reduzida opcional do quadro para a passada de baixa resolução.
+            small_scale: Fator de redução de small em relação a frame.
+
+        Returns:
+            list: Rostos (Face com bbox, kps e det_score) em coordenadas de frame.
+        """
+        self.stats['calls'] += 1
+        retry_missed = True
+
+        if self.roi_mode and self.last_faces and self.since_sweep < self.full_sweep_interval:
+            self.since_sweep += 1
+            regions = [self._expected_crop(frame, f) for f in self.last_faces]
+            faces = nms_faces(self.detect_in_regions(frame, regions))
+            missed = [f for f in self.last_faces
+                      if all(bbox_iou(f.bbox, d.bbox) < self.match_iou for d in faces)]
+            if not missed:
+                self.stats['roi_hits'] += 1
+                self.last_faces = faces
+                return faces
+            # Algum rosto saiu da sua região: faz a varredura completa (sem repetir os recortes)
+            retry_missed = False
+
+        self.since_sweep = 0
+        self.stats['full_sweeps'] += 1
+        size = self.choose_size(frame.shape)
+
+        # Passada barata no quadro inteiro
+        if small is not None:
+            faces = self._run(small, size, scale=small_scale)
+        else:
+            faces = self._run(frame, size)
+
+        # Rostos esperados e não encontrados: re-detecta só nessas regiões
+        missed = [f for f in self.last_faces
+                  if all(bbox_iou(f.bbox, d.bbox) < self.match_iou for d in faces)]
+        if missed and retry_missed:
+            faces = nms_faces(faces + self.detect_in_regions(frame, [self._expected_crop(frame, f) for f in missed]))
+
+        # Sem rostos conhecidos: de tempos em tempos procura rostos pequenos no maior nível
+        if not faces and not self.last_faces:
+            self.empty_count += 1
+            if self.escalate_every and self.empty_count % self.escalate_every == 0 and size < self.det_sizes[-1]:
+                self.stats['escalations'] += 1
+                faces = self._run(frame, self.det_sizes[-1])
+        else:
+            self.empty_count = 0
+
+        self.last_faces = faces
+        return faces
+
+    def reset(self):
+        self.last_faces = []
+        self.empty_count = 0
+        self.since_sweep = 0
+
+
+class TiledFaceDetector:
+    """
+    Detecção em imagens estáticas muito grandes (fotos de eventos, dezenas de megapixels).
+
+    Reduzir a imagem inteira para a entrada do detector perde os rostos pequenos.
+    Aqui a imagem é dividida em blocos sobrepostos do tamanho da entrada do detector,
+    em uma pirâmide de fator 2 (resolução original, metade, um quarto... até caber em
+    um bloco). Com sobreposição de pelo menos 1/4 do bloco, todo rosto aparece inteiro
+    em algum bloco de algum nível com tamanho detectável; detecções cortadas na borda
+    interna de um bloco são descartadas e as restantes passam por NMS global.
+
+    Os blocos são views da imagem (sem cópia). Os níveis são processados um de cada
+    vez e no máximo max_workers blocos ficam em processamento ao mesmo tempo; a
+    memória extra é o nível atual e o seguinte durante a redução (menos de 1/3 da
+    imagem) mais as entradas do detector em uso.
+    """
+
+    def __init__(self, det_model, tile_size=640, overlap=0.25, max_workers=4, edge_margin=2, nms_iou=0.4):
+        """
+        Args:
+            det_model: Modelo de detecção do InsightFace (SCRFD/RetinaFace) já preparado.
+            tile_size: Lado dos blocos e da entrada do detector (múltiplo de 32).
+            overlap: Sobreposição entre blocos vizinhos (fração do bloco, mínimo 0.25).
+            max_workers: Blocos detectados em paralelo (pool próprio).
+            edge_margin: Distância (px) da borda interna de um bloco abaixo da qual a detecção é descartada.
+            nms_iou: IoU para remover duplicatas entre blocos e níveis.
+        """
+        self.det_model = det_model
+        self.tile_size = tile_size
+        self.stride = max(1, int(tile_size * (1.0 - max(overlap, 0.25))))
+        self.edge_margin = edge_margin
+        self.nms_iou = nms_iou
+        self.max_workers = max_workers
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self.stats = {'images': 0, 'tiles': 0, 'levels': 0}
+
+    def _starts(self, length):
+        # Posições iniciais dos blocos em um eixo; o último bloco encosta na borda
+        if length <= self.tile_size:
+            return [0]
+        starts = list(range(0, length - self.tile_size, self.stride))
+        starts.append(length - self.tile_size)
+        return starts
+
+    def _tiles(self, level):
+        h, w = level.shape[:2]
+        for y in self._starts(h):
+            for x in self._starts(w):
+                yield x, y, min(x + self.tile_size, w), min(y + self.tile_size, h)
+
+    def _detect_tile(self, level, tile, scale):
+        x1, y1, x2, y2 = tile
+        h, w = level.shape[:2]
+        faces = run_detector(self.det_model, level[y1:y2, x1:x2], self.tile_size,
+                             offset=(x1 / scale, y1 / scale), scale=scale)
+        # Bordas internas (não coincidem com a borda da imagem) em coordenadas globais
+        margin = self.edge_margin / scale
+        inner = (x1 / scale + margin if x1 > 0 else None, y1 / scale + margin if y1 > 0 else None,
+                 x2 / scale - margin if x2 < w else None, y2 / scale - margin if y2 < h else None)
+        kept = []
+        for face in faces:
+            bx1, by1, bx2, by2 = face.bbox
+            if ((inner[0] is not None and bx1 <= inner[0]) or (inner[1] is not None and by1 <= inner[1])
+                    or (inner[2] is not None and bx2 >= inner[2]) or (inner[3] is not None and by2 >= inner[3])):
+                continue
+            kept.append(face)
+        return kept
+
+    def detect(self, img):
+        """
+        Detecta rostos em uma imagem de qualquer tamanho.
+
+        Args:
+            img: Imagem BGR em resolução original.
+
+        Returns:
+            list: Rostos (Face com bbox, kps e det_score) em coordenadas da imagem.
+        """
+        self.stats['images'] += 1
+        faces = []
+        level, scale = img, 1.0
+        while True:
+            self.stats['levels'] += 1
+            faces.extend(self._detect_level(level, scale))
+            if max(level.shape[:2]) <= self.tile_size:
+                break
+            # Próximo nível: metade da resolução (rostos grandes cortados entre blocos).
+            # O nível anterior é liberado aqui: só o atual fica em memória.
+            level = cv2.resize(level, ((level.shape[1] + 1) // 2, (level.shape[0] + 1) // 2),
+                               interpolation=cv2.INTER_AREA)
+            scale /= 2.0
+        return nms_faces(faces, self.nms_iou)
+
+    def _detect_level(self, level, scale):
+        # Janela de no máximo max_workers blocos enviados ao pool (não enfileira o nível inteiro)
+        faces = []
+        pending = set()
+        for tile in self._tiles(level):
+            if len(pending) >= self.max_workers:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    faces.extend(future.result())
+            pending.add(self.executor.submit(self._detect_tile, level, tile, scale))
+            self.stats['tiles'] += 1
+        for future in pending:
+            faces.extend(future.result())
+        return faces
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,154 @@
+"""
+Janela de pré-visualização do modo tempo real.
+
+A exibição roda em uma thread própria: recebe sempre o quadro de saída mais
+recente, reduz para o tamanho da pré-visualização e desenha a interface apenas
+nessa cópia reduzida. O quadro completo (gravação, câmera virtual, destinos de
+saída) nunca recebe a interface. As teclas lidas pelo cv2.waitKey vão para uma
+fila consumida pelo loop principal sem bloqueá-lo.
+
+No macOS a HighGUI só funciona na thread principal; lá a janela é desenhada no
+próprio show(), ainda com a redução e a interface só na pré-visualização.
+"""
+import queue
+import sys
+import threading
+
+import cv2
+
+NO_KEY = 0xFF
+
+
+def fit_size(width, height, max_size):
+    # Maior tamanho que cabe em max_size mantendo a proporção (nunca amplia)
+    if not max_size:
+        return width, height
+    scale = min(max_size[0] / width, max_size[1] / height, 1.0)
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def draw_overlay(img, lines, recording=False):
+    """
+    Desenha as linhas de status no canto superior esquerdo.
+
+    Args:
+        img: Quadro BGR (alterado no lugar)
+        lines: Lista de (texto, cor BGR)
+        recording: Mostra o indicador REC abaixo das linhas
+    """
+    # Fonte proporcional à altura (0.7 em 720p), legível em pré-visualizações pequenas
+    scale = max(0.4, img.shape[0] / 720 * 0.7)
+    step = int(30 * scale / 0.7)
+    thickness = 1 if scale < 0.6 else 2
+    y = step
+    for text, color in lines:
+        cv2.putText(img, text, (10, y), cv2.FONT_HERSHEY_SIMPLEX, scale, color, thickness)
+        y += step
+    if recording:
+        radius = max(4, int(10 * scale / 0.7))
+        cv2.circle(img, (10 + radius, y - step // 3), radius, (0, 0, 255), -1)
+        cv2.putText(img, "REC", (20 + 2 * radius, y), cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 0, 255), thickness)
+
+
+class PreviewWindow:
+    def __init__(self, title="Deepfake Real-time", max_size=(960, 540), threaded=None):
+        """
+        Args:
+            title: Título da janela.
+            max_size: (largura, altura) máxima da pré-visualização; None = tamanho original.
+            threaded: Exibe em uma thread própria (padrão: sim, exceto no macOS).
+        """
+        self.title = title
+        self.max_size = max_size
+        self.threaded = sys.platform != 'darwin' if threaded is None else threaded
+        self.keys = queue.Queue()
+        self.stats = {'submitted': 0, 'shown': 0}
+        self._latest = None
+        self._version = 0
+        self._cond = threading.Condition()
+        self.stopped = False
+        self.thread = None
+
+    def start(self):
+        if self.threaded:
+            self.thread = threading.Thread(target=self.update, daemon=True)
+            self.thread.start()
+        return self
+
+    def show(self, frame, lines=None, recording=False):
+        """
+        Publica o quadro de saída mais recente (não é copiado nem alterado).
+
+        Args:
+            frame: Quadro BGR em resolução completa
+            lines: Linhas da interface [(texto, cor)] ou None para ocultar
+            recording: Mostra o indicador de gravação
+        """
+        self.stats['submitted'] += 1
+        if not self.threaded:
+            self._render(frame, lines, recording)
+            self._poll_window()
+            return
+        with self._cond:
+            # Um quadro ainda não exibido é simplesmente substituído
+            self._latest = (frame, lines, recording)
+            self._version += 1
+            self._cond.notify()
+
+    def poll_key(self):
+        # Próxima tecla pressionada ou NO_KEY, sem esperar
+        try:
+            return self.keys.get_nowait()
+        except queue.Empty:
+            return NO_KEY
+
+    def _render(self, frame, lines, recording):
+        height, width = frame.shape[:2]
+        size = fit_size(width, height, self.max_size)
+        if size != (width, height):
+            preview = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        elif lines or recording:
+            preview = frame.copy()
+        else:
+            preview = frame
+        if lines or recording:
+            draw_overlay(preview, lines or [], recording)
+        cv2.imshow(self.title, preview)
+        self.stats['shown'] += 1
+
+    def _poll_window(self):
+        key = cv2.waitKey(1) & 0xFF
+        if key != NO_KEY:
+            self.keys.put(key)
+
+    def update(self):
+        shown = 0
+        while not self.stopped:
+            with self._cond:
+                if self._version == shown:
+                    # Sem quadro novo: continua atendendo a janela (~100 Hz)
+                    self._cond.wait(timeout=0.01)
+                item, version = self._latest, self._version
+            if item is not None and version != shown:
+                shown = version
+                try:
+                    self._render(*item)
+                except Exception as e:
+                    print(f"[PreviewWindow] Erro ao exibir quadro: {e}")
+            self._poll_window()
+        self._destroy()
+
+    def _destroy(self):
+        try:
+            cv2.destroyWindow(self.title)
+        except cv2.error:
+            pass
+
+    def stop(self):
+        self.stopped = True
+        with self._cond:
+            self._cond.notify()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        elif not self.threaded:
+            self._destroy()
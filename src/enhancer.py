@@ -2,42 +2,422 @@ import cv2
 import numpy as np
 import onnxruntime
 import os
-from .utils import get_default_providers
+import threading
+import time
+from .utils import get_default_providers, resolve_model_variant
+from .sessions import SessionPool
+from .detection import bbox_iou
+
+# Posição dos 5 pontos (olhos, nariz, cantos da boca) no recorte 512 usado no treino do GFPGAN (FFHQ)
+FFHQ_TEMPLATE_512 = np.array([
+    [192.98138, 239.94708], [318.90277, 240.1936], [256.63416, 314.01935],
+    [201.26117, 371.41043], [313.08905, 371.15118]], dtype=np.float32)
+
+# Template ArcFace do InsightFace (recorte 112) usado pelo inswapper
+ARCFACE_TEMPLATE_112 = np.array([
+    [38.2946, 51.6963], [73.5318, 51.5014], [56.0252, 71.7366],
+    [41.5493, 92.3655], [70.7299, 92.2041]], dtype=np.float32)
+
+
+def _compose_affine(A, B):
+    # Afim equivalente a aplicar B e depois A
+    return (np.vstack([A, [0, 0, 1]]) @ np.vstack([B, [0, 0, 1]]))[:2]
+
+
+def _arcface_to_ffhq(size, crop_size=128):
+    # Transformação fixa do recorte ArcFace (como em face_align.estimate_norm) para o recorte FFHQ
+    if crop_size % 112 == 0:
+        ratio, diff_x = crop_size / 112.0, 0.0
+    else:
+        ratio, diff_x = crop_size / 128.0, 8.0 * crop_size / 128.0
+    src = ARCFACE_TEMPLATE_112 * ratio
+    src[:, 0] += diff_x
+    M, _ = cv2.estimateAffinePartial2D(src, FFHQ_TEMPLATE_512 * (size / 512.0))
+    return M
+
+
+class EnhancementCache:
+    # Cache temporal por rosto: quando o recorte atual é quase idêntico ao último
+    # que passou pelo modelo (GFPGAN ou, na troca, o inswapper), reaproveita a saída
+    # anterior (colada na posição atual) em vez de rodar o modelo de novo.
+    def __init__(self, threshold=3.0, max_reuse=10, signature_size=16, match_iou=0.3, max_entries=16):
+        """
+        Args:
+            threshold: Diferença média absoluta máxima (níveis de cinza, 0-255) entre assinaturas para reaproveitar.
+            max_reuse: Número máximo de reaproveitamentos seguidos antes de rodar o modelo de novo.
+            signature_size: Lado da assinatura (recorte reduzido em tons de cinza).
+            match_iou: IoU mínimo entre bboxes para associar o rosto a uma entrada do cache.
+            max_entries: Número máximo de rostos rastreados.
+        """
+        self.threshold = threshold
+        self.max_reuse = max_reuse
+        self.signature_size = signature_size
+        self.match_iou = match_iou
+        self.max_entries = max_entries
+        self.entries = []
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def signature(self, face_img):
+        small = cv2.resize(face_img, (self.signature_size, self.signature_size), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.float32)
+
+    def _match(self, bbox):
+        best, best_iou = None, self.match_iou
+        for entry in self.entries:
+            iou = bbox_iou(bbox, entry['bbox'])
+            if iou >= best_iou:
+                best, best_iou = entry, iou
+        return best
+
+    def lookup(self, bbox, signature):
+        with self.lock:
+            entry = self._match(bbox)
+            if (entry is not None and entry['reuse'] < self.max_reuse
+                    and float(np.mean(np.abs(entry['signature'] - signature))) <= self.threshold):
+                entry['reuse'] += 1
+                entry['bbox'] = bbox
+                entry['last_used'] = time.monotonic()
+                self.hits += 1
+                return entry['output']
+            self.misses += 1
+            return None
+
+    def store(self, bbox, signature, output):
+        with self.lock:
+            entry = self._match(bbox)
+            if entry is None:
+                if len(self.entries) >= self.max_entries:
+                    self.entries.remove(min(self.entries, key=lambda e: e['last_used']))
+                entry = {}
+                self.entries.append(entry)
+            entry.update(bbox=bbox, signature=signature, output=output.copy(), reuse=0,
+                         last_used=time.monotonic())
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def clear(self):
+        with self.lock:
+            self.entries = []
+
+
+# Modelos de restauração suportados.
+#   size: lado da entrada quadrada; mean/std: normalização RGB sobre [0, 1] (entrada = (x - mean) / std)
+#   quality: ordem de preferência (maior = melhor); fp16: permite FP16 no TensorRT
+#   extra_inputs: valores fixos para entradas além da imagem (ex.: peso de fidelidade do CodeFormer)
+RESTORERS = {
+    'gpen-256': {'path': 'models/GPEN-BFR-256.onnx', 'size': 256, 'mean': 0.5, 'std': 0.5, 'quality': 1, 'fp16': True},
+    'gpen-512': {'path': 'models/GPEN-BFR-512.onnx', 'size': 512, 'mean': 0.5, 'std': 0.5, 'quality': 2, 'fp16': True},
+    'gfpgan-1.4': {'path': 'models/GFPGANv1.4.onnx', 'size': 512, 'mean': 0.5, 'std': 0.5, 'quality': 3, 'fp16': False},
+    'codeformer': {'path': 'models/codeformer.onnx', 'size': 512, 'mean': 0.5, 'std': 0.5, 'quality': 4, 'fp16': False,
+                   'extra_inputs': {'weight': 0.7}},
+}
+
+# Níveis de qualidade expostos na CLI, do modelo preferido para o de fallback
+QUALITY_TIERS = {
+    'low': ['gpen-256'],
+    'medium': ['gpen-512', 'gfpgan-1.4'],
+    'high': ['codeformer', 'gfpgan-1.4'],
+}
+
+DEFAULT_RESTORER = 'gfpgan-1.4'
+
+
+def restorer_providers(fp16):
+    # TensorRT em FP32 para modelos que geram artefatos em FP16 (GFPGAN/CodeFormer)
+    return [
+        ('TensorrtExecutionProvider', {
+            'trt_engine_cache_enable': True,
+            'trt_engine_cache_path': 'trt_cache',
+            'trt_fp16_enable': fp16,
+        }),
+        ('CUDAExecutionProvider', {
+            'cudnn_conv_algo_search': 'HEURISTIC',
+            'arena_extend_strategy': 'kSameAsRequested',
+        }),
+        'CPUExecutionProvider'
+    ]
+
 
 class FaceEnhancer:
-    def __init__(self, model_path="models/GFPGANv1.4.onnx", providers=None):
-        # Tenta TensorRT em modo FP32 (precisão total) para performance sem artefatos
+    def __init__(self, model_path=None, providers=None, cache_threshold=0.0, cache_max_reuse=10,
+                 restorer=DEFAULT_RESTORER, pool_size=1, optimized_models=True):
+        if restorer not in RESTORERS:
+            raise ValueError(f"Restaurador desconhecido: {restorer}. Opções: {', '.join(RESTORERS)}")
+        self.restorer = restorer
+        self.spec = RESTORERS[restorer]
+        if model_path is None:
+            model_path = self.spec['path']
+
         if providers is None:
-            providers = [
-                ('TensorrtExecutionProvider', {
-                    'trt_engine_cache_enable': True,
-                    'trt_engine_cache_path': 'trt_cache',
-                    'trt_fp16_enable': False, # desativa FP16 para evitar face borrada
-                }),
-                ('CUDAExecutionProvider', {
-                    'cudnn_conv_algo_search': 'HEURISTIC',
-                    'arena_extend_strategy': 'kSameAsRequested',
-                }),
-                'CPUExecutionProvider'
-            ]
+            providers = restorer_providers(self.spec.get('fp16', False))
         self.providers = providers
         
         if not os.path.exists(model_path):
-            raise FileNotFoundError(f"Modelo GFPGAN não encontrado em {model_path}")
+            raise FileNotFoundError(f"Modelo {restorer} não encontrado em {model_path}")
+        if optimized_models:
+            model_path = resolve_model_variant(model_path, self.providers)
             
-        print(f"[FaceEnhancer] Carregando modelo GFPGAN de {model_path}")
+        print(f"[FaceEnhancer] Carregando modelo {restorer} de {model_path}")
         try:
-            self.session = onnxruntime.InferenceSession(model_path, providers=self.providers)
+            if pool_size > 1:
+                # Uma sessão por worker do estágio de melhoria
+                self.session = SessionPool(model_path, self.providers, size=pool_size)
+            else:
+                self.session = onnxruntime.InferenceSession(model_path, providers=self.providers)
         except Exception as e:
             print(f"[FaceEnhancer] Erro ao carregar modelo: {e}")
             raise
             
-        self.input_name = self.session.get_inputs()[0].name
-        print("[FaceEnhancer] Modelo carregado com sucesso.")
+        inputs = self.session.get_inputs()
+        self.input_name = inputs[0].name
+        # Tamanho declarado pelo próprio modelo tem prioridade sobre o registro
+        self.size = inputs[0].shape[2] if isinstance(inputs[0].shape[2], int) else self.spec['size']
+
+        # Normalização: entrada = (pixel - offset) * scale
+        self.input_offset = 255.0 * self.spec['mean']
+        self.input_scale = 1.0 / (255.0 * self.spec['std'])
+
+        # Entradas extras com valor fixo, no tipo declarado pelo modelo
+        self.extra_feed = {}
+        for inp in inputs[1:]:
+            value = self.spec.get('extra_inputs', {}).get(inp.name)
+            if value is None:
+                raise ValueError(f"Entrada '{inp.name}' do modelo {restorer} sem valor definido")
+            dtype = np.float64 if inp.type == 'tensor(double)' else np.float32
+            self.extra_feed[inp.name] = np.array([value], dtype=dtype)
+
+        self._local = threading.local()
+        self._mask_cache = {}
+        self._mask_lock = threading.Lock()
+        # Recorte do inswapper (ArcFace 128) -> recorte alinhado do enhancer
+        self._arcface_to_aligned = _arcface_to_ffhq(self.size, 128)
+
+        # Cache temporal (desativado com cache_threshold=0)
+        self.cache = None
+        if cache_threshold > 0:
+            self.cache = EnhancementCache(threshold=cache_threshold, max_reuse=cache_max_reuse)
+        print(f"[FaceEnhancer] Modelo carregado com sucesso ({self.size}x{self.size}).")
+
+    @classmethod
+    def select(cls, tier=None, budget_ms=None, runs=5, **kwargs):
+        """
+        Escolhe o restaurador em tempo de execução.
+        Percorre os modelos do nível (ou todos, do melhor para o pior) cujo arquivo existe,
+        mede a latência de cada um e fica com o primeiro dentro do orçamento.
+        Se nenhum couber no orçamento, usa o mais rápido medido.
+        
+        Returns:
+            FaceEnhancer: Enhancer já aquecido.
+        """
+        if tier is not None:
+            candidates = QUALITY_TIERS[tier]
+        else:
+            candidates = sorted(RESTORERS, key=lambda name: RESTORERS[name]['quality'], reverse=True)
+        candidates = [name for name in candidates if os.path.exists(RESTORERS[name]['path'])]
+        if not candidates:
+            raise FileNotFoundError("Nenhum modelo de restauração encontrado em models/")
+
+        fastest, fastest_ms = None, None
+        for name in candidates:
+            try:
+                enhancer = cls(restorer=name, **kwargs)
+                latency_ms = enhancer.benchmark(runs)
+            except Exception as e:
+                print(f"[FaceEnhancer] Aviso: {name} indisponível: {e}")
+                continue
+            print(f"[FaceEnhancer] {name}: {latency_ms:.1f} ms por rosto")
+            if budget_ms is None or latency_ms <= budget_ms:
+                return enhancer
+            if fastest_ms is None or latency_ms < fastest_ms:
+                fastest, fastest_ms = enhancer, latency_ms
+
+        if fastest is None:
+            raise RuntimeError("Nenhum modelo de restauração pôde ser carregado")
+        print(f"[FaceEnhancer] Nenhum modelo dentro de {budget_ms} ms; usando {fastest.restorer}.")
+        return fastest
+
+    def _feed(self, blob):
+        feed = {self.input_name: blob}
+        feed.update(self.extra_feed)
+        return feed
+
+    def warmup(self):
+        # Primeira execução aloca memória e, com TensorRT, constrói a engine
+        dummy = np.zeros((1, 3, self.size, self.size), dtype=np.float32)
+        if isinstance(self.session, SessionPool):
+            self.session.warmup(self._feed(dummy))
+        else:
+            self.session.run(None, self._feed(dummy))
+
+    def benchmark(self, runs=5):
+        # Latência média por rosto (ms), após warm-up
+        self.warmup()
+        dummy = np.zeros((1, 3, self.size, self.size), dtype=np.float32)
+        t0 = time.perf_counter()
+        for _ in range(runs):
+            self.session.run(None, self._feed(dummy))
+        return (time.perf_counter() - t0) / runs * 1000
+
+    def _buffers(self):
+        # Buffers pré-alocados por thread (enhance é chamado por vários workers ao mesmo tempo)
+        buffers = self._local.__dict__
+        if not buffers:
+            size = self.size
+            buffers['resized'] = np.empty((size, size, 3), dtype=np.uint8)
+            buffers['input'] = np.empty((1, 3, size, size), dtype=np.float32)
+            buffers['output'] = np.empty((size, size, 3), dtype=np.uint8)
+        return buffers
+
+    def _blend_mask(self, h, w):
+        # Máscaras gaussianas de blending em cache por tamanho de recorte
+        key = (h, w)
+        masks = self._mask_cache.get(key)
+        if masks is None:
+            mask = np.zeros((h, w), dtype=np.float32)
+            center = (w // 2, h // 2)
+            # Raio maior para cobrir mais do rosto (45% da menor dimensão)
+            radius = int(min(h, w) * 0.45)
+            cv2.circle(mask, center, radius, 1.0, -1)
+            mask = cv2.GaussianBlur(mask, (0, 0), sigmaX=min(h, w) * 0.05)
+            masks = (mask, 1.0 - mask)
+            with self._mask_lock:
+                if len(self._mask_cache) >= 64:
+                    self._mask_cache.clear()
+                self._mask_cache[key] = masks
+        return masks
+
+    def _aligned_mask(self):
+        # Máscara suave no espaço alinhado (bordas esmaecidas), reamostrada junto com a saída
+        masks = self._mask_cache.get('aligned')
+        if masks is None:
+            size = self.size
+            border = int(size * 0.06)
+            mask = np.zeros((size, size), dtype=np.float32)
+            mask[border:size - border, border:size - border] = 1.0
+            mask = cv2.GaussianBlur(mask, (0, 0), sigmaX=border * 0.5)
+            masks = (mask, None)
+            with self._mask_lock:
+                self._mask_cache['aligned'] = masks
+        return masks[0]
+
+    def align_matrix(self, face):
+        """
+        Matriz afim quadro -> recorte alinhado (template FFHQ) a partir dos 5 pontos do InsightFace.
+        Reaproveita a matriz do swapper (recorte ArcFace 128) quando disponível.
+        """
+        swap_matrix = getattr(face, 'swap_matrix', None)
+        if swap_matrix is not None:
+            return _compose_affine(self._arcface_to_aligned, swap_matrix)
+        template = FFHQ_TEMPLATE_512 * (self.size / 512.0)
+        M, _ = cv2.estimateAffinePartial2D(np.asarray(face.kps, dtype=np.float32), template, method=cv2.LMEDS)
+        return M
+
+    def _to_blob(self, buffers):
+        # entrada size x size, RGB, NCHW, normalizada conforme o modelo
+        crop = buffers['resized']
+        blob = buffers['input']
+        # BGR -> RGB, HWC -> CHW e conversão para float em uma única passada
+        np.subtract(crop[:, :, ::-1].transpose(2, 0, 1), self.input_offset, out=blob[0], casting='unsafe')
+        blob *= self.input_scale
+        return blob
+
+    def _postprocess(self, output, buffers):
+        # Desfaz a normalização ([-1, 1] -> [0, 255]) no próprio tensor de saída
+        out = output[0]
+        out *= 1.0 / self.input_scale
+        out += self.input_offset
+        np.clip(out, 0, 255, out=out)
+        # RGB -> BGR, CHW -> HWC e conversão para uint8 em uma única passada
+        result = buffers['output']
+        np.copyto(result, out[::-1].transpose(1, 2, 0), casting='unsafe')
+        return result
+
+    def _restore(self, face, buffers):
+        # Roda o modelo no recorte em buffers['resized'] (ou reaproveita a saída em cache)
+        output = None
+        if self.cache is not None:
+            signature = self.cache.signature(buffers['resized'])
+            output = self.cache.lookup(face.bbox, signature)
+
+        if output is None:
+            face_input = self._to_blob(buffers)
+            
+            # Inferência
+            output = self.session.run(None, self._feed(face_input))[0]
+            output = self._postprocess(output, buffers)
+            if self.cache is not None:
+                self.cache.store(face.bbox, signature, output)
+        return output
+
+    def _enhance_aligned(self, frame, face, buffers):
+        size = self.size
+        h, w = frame.shape[:2]
+        M = self.align_matrix(face)
+        if M is None:
+            return False
+        cv2.warpAffine(frame, M, (size, size), dst=buffers['resized'], borderMode=cv2.BORDER_REPLICATE)
+        output = self._restore(face, buffers)
+
+        # Região do quadro coberta pelo recorte alinhado
+        IM = cv2.invertAffineTransform(M)
+        corners = np.array([[0, 0, 1], [size, 0, 1], [0, size, 1], [size, size, 1]], dtype=np.float64) @ IM.T
+        x1, y1 = np.floor(corners.min(axis=0)).astype(int)
+        x2, y2 = np.ceil(corners.max(axis=0)).astype(int)
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(w, x2), min(h, y2)
+        if x2 <= x1 or y2 <= y1:
+            return True
+
+        # Warp inverso apenas dessa região
+        IM[:, 2] -= (x1, y1)
+        roi = frame[y1:y2, x1:x2]
+        restored = cv2.warpAffine(output, IM, (x2 - x1, y2 - y1), borderMode=cv2.BORDER_REPLICATE)
+        mask = cv2.warpAffine(self._aligned_mask(), IM, (x2 - x1, y2 - y1))
+        roi[:] = cv2.blendLinear(restored, roi, mask, 1.0 - mask)
+        return True
+
+    def _enhance_bbox(self, frame, face, buffers):
+        # Fallback sem landmarks: recorte da bbox com margem redimensionado para a entrada do modelo
+        h, w = frame.shape[:2]
+        bbox = face.bbox.astype(int)
+        x1, y1, x2, y2 = bbox
+        
+        # Adiciona margem para capturar o rosto inteiro e um pouco do contexto
+        pad_x = int((x2 - x1) * 0.5)
+        pad_y = int((y2 - y1) * 0.5)
+        
+        x1_p = max(0, x1 - pad_x)
+        y1_p = max(0, y1 - pad_y)
+        x2_p = min(w, x2 + pad_x)
+        y2_p = min(h, y2 + pad_y)
+        
+        face_img = frame[y1_p:y2_p, x1_p:x2_p]
+        if face_img.size == 0:
+            return
+
+        cv2.resize(face_img, (self.size, self.size), dst=buffers['resized'])
+        output = self._restore(face, buffers)
+
+        # Redimensiona de volta para o tamanho do crop original
+        h_orig, w_orig = face_img.shape[:2]
+        output_resized = cv2.resize(output, (w_orig, h_orig))
+        
+        # Blending com máscara gaussiana para evitar bordas duras, direto no quadro
+        mask, inv_mask = self._blend_mask(h_orig, w_orig)
+        face_img[:] = cv2.blendLinear(output_resized, face_img, mask, inv_mask)
 
     def enhance(self, frame, faces):
         """
         Melhora a qualidade dos rostos detectados no quadro.
+        O quadro é modificado no próprio lugar.
+        
+        Com landmarks (kps), o rosto é alinhado ao template FFHQ antes do modelo e
+        apenas a região do rosto é reprojetada no quadro; sem landmarks, usa o
+        recorte da bbox com margem.
         
         Args:
             frame: Imagem BGR (numpy array).
@@ -48,74 +428,14 @@ class FaceEnhancer:
         """
         if not faces:
             return frame
-            
-        enhanced_frame = frame.copy()
-        
+
+        buffers = self._buffers()
         for face in faces:
-            # Obtém bounding box
-            bbox = face.bbox.astype(int)
-            x1, y1, x2, y2 = bbox
-            
-            # Adiciona margem para capturar o rosto inteiro e um pouco do contexto
-            # Margem de segurança
-            h, w = frame.shape[:2]
-            pad_x = int((x2 - x1) * 0.5)
-            pad_y = int((y2 - y1) * 0.5)
-            
-            x1_p = max(0, x1 - pad_x)
-            y1_p = max(0, y1 - pad_y)
-            x2_p = min(w, x2 + pad_x)
-            y2_p = min(h, y2 + pad_y)
-            
-            face_img = frame[y1_p:y2_p, x1_p:x2_p]
-            
-            if face_img.size == 0:
-                continue
-                
-            # Pre-processamento
-            # espera entrada 512x512, valores entre -1 e 1, RGB
             try:
-                face_input = cv2.resize(face_img, (512, 512))
-                face_input = cv2.cvtColor(face_input, cv2.COLOR_BGR2RGB) # BGR -> RGB
-                face_input = face_input.astype(np.float32) / 255.0
-                face_input = (face_input - 0.5) / 0.5
-                face_input = np.transpose(face_input, (2, 0, 1)) # HWC -> CHW
-
-                face_input = np.expand_dims(face_input, axis=0) # Adiciona batch dimension
-                
-                # Inferência
-                output = self.session.run(None, {self.input_name: face_input})[0]
-                
-                # Post-processamento
-                output = output.squeeze(0).transpose(1, 2, 0) # CHW -> HWC
-                output = (output * 0.5 + 0.5) * 255.0
-                output = np.clip(output, 0, 255).astype(np.uint8)
-                output = cv2.cvtColor(output, cv2.COLOR_RGB2BGR) # RGB -> BGR
-                
-                # Redimensiona de volta para o tamanho do crop original
-                h_orig, w_orig = face_img.shape[:2]
-                output_resized = cv2.resize(output, (w_orig, h_orig))
-                
-                # Blending simples para evitar bordas duras
-                # Cria máscara gaussiana
-                mask = np.zeros((h_orig, w_orig), dtype=np.uint8)
-                center = (w_orig // 2, h_orig // 2)
-                
-                # Raio maior para cobrir mais do rosto (45% da menor dimensão)
-                radius = int(min(h_orig, w_orig) * 0.45)
-                
-                cv2.circle(mask, center, radius, (255, 255, 255), -1)
-                
-                # Blur e normalização
-                mask = mask.astype(np.float32) / 255.0
-                mask = cv2.GaussianBlur(mask, (0, 0), sigmaX=min(h_orig, w_orig) * 0.05)
-                mask = np.expand_dims(mask, axis=2)
-                
-                # Combinar
-                enhanced_frame[y1_p:y2_p, x1_p:x2_p] = (output_resized * mask + face_img * (1 - mask)).astype(np.uint8)
-                
+                if face.kps is None or not self._enhance_aligned(frame, face, buffers):
+                    self._enhance_bbox(frame, face, buffers)
             except Exception as e:
                 print(f"[FaceEnhancer] Erro ao processar rosto: {e}")
                 continue
                 
-        return enhanced_frame
+        return frame
@@ -0,0 +1,283 @@
+"""
+Índice de embeddings de uma biblioteca de identidades (rostos de origem).
+
+Em vez de procurar imagens com glob e rodar o FaceAnalysis a cada troca de
+origem, os normed_embedding da biblioteca ficam em uma matriz contígua mapeada
+em memória (float32 ou float16), com os ids em um arquivo de metadados:
+
+    <pasta>/embeddings.npy   matriz [capacidade, dim] (np.memmap)
+    <pasta>/index.json       dim, dtype, linhas usadas, id de cada linha e metadados por id
+    <pasta>/ivf.npz          índice grosso opcional (centroides e lista de cada linha)
+
+Linhas removidas ficam marcadas (id None) até compact(). A busca exata de top-k
+por cosseno percorre a matriz em blocos (uma multiplicação por bloco, memória
+limitada). Com o índice grosso (build_ivf), só as listas dos n_probe centroides
+mais próximos da consulta são comparadas.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+from insightface.app.common import Face
+
+DTYPES = {'float32': np.float32, 'float16': np.float16}
+
+
+def _normalize(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class IdentityIndex:
+    def __init__(self, path, dim=512, dtype='float32', readonly=False):
+        """
+        Abre o índice em path, criando-o se não existir.
+
+        Args:
+            path: Pasta do índice.
+            dim: Dimensão dos embeddings (apenas na criação).
+            dtype: 'float32' ou 'float16' (apenas na criação).
+            readonly: Abre a matriz só para leitura.
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype inválido: {dtype}. Opções: {', '.join(DTYPES)}")
+        self.path = path
+        self.readonly = readonly
+        self.matrix_path = os.path.join(path, 'embeddings.npy')
+        self.meta_path = os.path.join(path, 'index.json')
+        self.ivf_path = os.path.join(path, 'ivf.npz')
+        self.lock = threading.RLock()
+        self.centroids = None
+        self.assign = None
+
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            self.dim = meta['dim']
+            self.dtype = meta['dtype']
+            self.ids = meta['ids']
+            self.info = meta.get('info', {})
+            self.matrix = np.load(self.matrix_path, mmap_mode='r' if readonly else 'r+')
+        else:
+            if readonly:
+                raise FileNotFoundError(f"Índice de identidades não encontrado em {path}")
+            os.makedirs(path, exist_ok=True)
+            self.dim = dim
+            self.dtype = dtype
+            self.ids = []
+            self.info = {}
+            self.matrix = np.lib.format.open_memmap(self.matrix_path, mode='w+', dtype=DTYPES[dtype],
+                                                    shape=(1024, dim))
+            self.save()
+
+        self.rows = {identity: row for row, identity in enumerate(self.ids) if identity is not None}
+        if os.path.exists(self.ivf_path):
+            ivf = np.load(self.ivf_path)
+            self.centroids, self.assign = ivf['centroids'], ivf['assign']
+            if len(self.assign) < len(self.ids):
+                # Linhas adicionadas depois do índice grosso salvo
+                self.assign = np.concatenate([self.assign, self._nearest_list(len(self.assign), len(self.ids))])
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, identity):
+        return identity in self.rows
+
+    # --- Escrita ---
+
+    def _reserve(self, count):
+        # Dobra a capacidade da matriz quando necessário (cópia para um novo arquivo)
+        needed = len(self.ids) + count
+        capacity = self.matrix.shape[0]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        tmp_path = self.matrix_path + '.tmp'
+        grown = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=self.matrix.dtype, shape=(capacity, self.dim))
+        grown[:len(self.ids)] = self.matrix[:len(self.ids)]
+        grown.flush()
+        # O arquivo mapeado precisa ser fechado antes de ser substituído (Windows)
+        del grown
+        self.matrix = None
+        os.replace(tmp_path, self.matrix_path)
+        self.matrix = np.load(self.matrix_path, mmap_mode='r+')
+
+    def add(self, ids, embeddings, info=None):
+        """
+        Adiciona (ou substitui) identidades.
+
+        Args:
+            ids: Lista de ids (str)
+            embeddings: Matriz [n, dim] (normalizada aqui)
+            info: Lista opcional de dicts de metadados (ex.: caminho da imagem)
+        """
+        vectors = _normalize(embeddings)
+        if vectors.shape != (len(ids), self.dim):
+            raise ValueError(f"Esperado [{len(ids)}, {self.dim}], recebido {list(vectors.shape)}")
+        with self.lock:
+            self.remove([identity for identity in ids if identity in self.rows])
+            self._reserve(len(ids))
+            start = len(self.ids)
+            self.matrix[start:start + len(ids)] = vectors.astype(self.matrix.dtype)
+            for offset, identity in enumerate(ids):
+                self.ids.append(identity)
+                self.rows[identity] = start + offset
+                self.info[identity] = (info[offset] if info else None) or {}
+            if self.centroids is not None:
+                self.assign = np.concatenate([self.assign, self._nearest_list(start, start + len(ids))])
+
+    def remove(self, ids):
+        with self.lock:
+            for identity in ids:
+                row = self.rows.pop(identity, None)
+                if row is None:
+                    continue
+                self.ids[row] = None
+                self.info.pop(identity, None)
+                if self.assign is not None:
+                    self.assign[row] = -1
+
+    def compact(self):
+        # Reescreve as linhas válidas de forma contígua (remove os buracos deixados por remove)
+        with self.lock:
+            alive = [row for row, identity in enumerate(self.ids) if identity is not None]
+            if len(alive) == len(self.ids):
+                return
+            self.matrix[:len(alive)] = self.matrix[alive]
+            if self.assign is not None:
+                self.assign = self.assign[alive]
+            self.ids = [self.ids[row] for row in alive]
+            self.rows = {identity: row for row, identity in enumerate(self.ids)}
+
+    def save(self):
+        with self.lock:
+            self.matrix.flush()
+            meta = {'version': 1, 'dim': self.dim, 'dtype': self.dtype, 'rows': len(self.ids),
+                    'ids': self.ids, 'info': self.info}
+            tmp_path = self.meta_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, self.meta_path)
+            if self.centroids is not None:
+                np.savez(self.ivf_path, centroids=self.centroids, assign=self.assign)
+
+    # --- Leitura ---
+
+    def embedding(self, identity):
+        with self.lock:
+            row = self.rows.get(identity)
+            if row is None:
+                raise KeyError(f"Identidade desconhecida: {identity}")
+            return np.asarray(self.matrix[row], dtype=np.float32)
+
+    def face(self, identity):
+        # Face usada como origem pelo inswapper (só o embedding é necessário)
+        face = Face(embedding=self.embedding(identity))
+        face.identity = identity
+        return face
+
+    def _blocks(self, rows_range, block_rows):
+        start, end = rows_range
+        for block_start in range(start, end, block_rows):
+            yield block_start, np.asarray(self.matrix[block_start:min(block_start + block_rows, end)],
+                                          dtype=np.float32)
+
+    def search(self, queries, k=5, block_rows=32768, n_probe=0):
+        """
+        Top-k por similaridade de cosseno.
+
+        Args:
+            queries: Embedding [dim] ou matriz [m, dim]
+            k: Resultados por consulta
+            block_rows: Linhas da matriz por multiplicação (limita a memória)
+            n_probe: Com o índice grosso, número de listas comparadas (0 = busca exata)
+
+        Returns:
+            list: Para cada consulta, lista de (id, similaridade) em ordem decrescente
+        """
+        q = _normalize(queries)
+        with self.lock:
+            total = len(self.ids)
+            k = min(k, len(self.rows))
+            if k == 0:
+                return [[] for _ in range(len(q))]
+            alive = np.fromiter((identity is not None for identity in self.ids), dtype=bool, count=total)
+            best_scores = np.full((len(q), k), -np.inf, dtype=np.float32)
+            best_rows = np.full((len(q), k), -1, dtype=np.int64)
+
+            if n_probe and self.centroids is not None:
+                # Só as linhas das listas mais próximas de alguma consulta
+                lists = np.argsort(-(q @ self.centroids.T), axis=1)[:, :n_probe]
+                candidates = np.nonzero(np.isin(self.assign[:total], lists))[0]
+                blocks = ((candidates[i:i + block_rows],
+                           np.asarray(self.matrix[candidates[i:i + block_rows]], dtype=np.float32))
+                          for i in range(0, len(candidates), block_rows))
+            else:
+                blocks = ((np.arange(start, start + len(block)), block)
+                          for start, block in self._blocks((0, total), block_rows))
+
+            for rows, block in blocks:
+                scores = q @ block.T
+                scores[:, ~alive[rows]] = -np.inf
+                merged_scores = np.concatenate([best_scores, scores], axis=1)
+                merged_rows = np.concatenate([best_rows, np.broadcast_to(rows, scores.shape)], axis=1)
+                top = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(merged_scores, top, axis=1)
+                best_rows = np.take_along_axis(merged_rows, top, axis=1)
+
+            results = []
+            for scores, rows in zip(best_scores, best_rows):
+                order = np.argsort(-scores)
+                results.append([(self.ids[rows[i]], float(scores[i])) for i in order
+                                if rows[i] >= 0 and np.isfinite(scores[i])])
+            return results
+
+    # --- Índice grosso (IVF) ---
+
+    def _nearest_list(self, start, end, block_rows=32768):
+        assign = np.empty(end - start, dtype=np.int32)
+        for block_start, block in self._blocks((start, end), block_rows):
+            assign[block_start - start:block_start - start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        # Linhas removidas não pertencem a nenhuma lista
+        for row in range(start, end):
+            if self.ids[row] is None:
+                assign[row - start] = -1
+        return assign
+
+    def build_ivf(self, n_lists=None, iterations=10, sample=50000, seed=0):
+        """
+        Treina o índice grosso (k-means esférico) e atribui cada linha a uma lista.
+
+        Args:
+            n_lists: Número de listas (padrão: ~sqrt do número de identidades)
+            iterations: Iterações do k-means
+            sample: Máximo de linhas usadas no treino
+        """
+        with self.lock:
+            alive = np.array([row for row, identity in enumerate(self.ids) if identity is not None])
+            if len(alive) == 0:
+                raise ValueError("Índice vazio")
+            rng = np.random.default_rng(seed)
+            train_rows = np.sort(rng.choice(alive, size=max(1, min(sample, len(alive))), replace=False))
+            train = np.asarray(self.matrix[train_rows], dtype=np.float32)
+            requested = n_lists or max(1, int(np.sqrt(len(alive))))
+            # Cada centroide inicial é uma linha distinta da amostra de treino
+            n_lists = max(1, min(requested, len(train)))
+            if n_lists < requested:
+                print(f"[IdentityIndex] Aviso: {requested} listas pedidas, mas só {len(train)} linhas de treino; "
+                      f"usando {n_lists}")
+            centroids = train[rng.choice(len(train), size=n_lists, replace=False)]
+            for _ in range(iterations):
+                labels = np.argmax(train @ centroids.T, axis=1)
+                for c in range(n_lists):
+                    members = train[labels == c]
+                    if len(members):
+                        centroids[c] = members.sum(axis=0)
+                centroids = _normalize(centroids)
+            self.centroids = centroids
+            self.assign = self._nearest_list(0, len(self.ids))
+            print(f"[IdentityIndex] Índice grosso: {n_lists} listas para {len(alive)} identidades")
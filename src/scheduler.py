@@ -0,0 +1,128 @@
+"""
+Agendamento de resultados com prazo para o modo tempo real.
+
+Em vez de esperar sempre pelo future mais antigo (um quadro lento atrasa todos
+os seguintes), cada quadro recebe um prazo a partir do instante de captura e o
+loop exibe sempre o quadro concluído mais recente. Quadros mais antigos que
+ele são descartados: os que ainda não terminaram são cancelados (o FaceSwapper
+não inicia a troca/melhoria de um future cancelado) e os já concluídos são
+contados como obsoletos.
+"""
+import concurrent.futures
+import time
+from collections import deque
+
+
+class _Entry:
+    __slots__ = ('future', 'ts_ns', 'deadline_ns', 'missed')
+
+    def __init__(self, future, ts_ns, deadline_ns):
+        self.future = future
+        self.ts_ns = ts_ns
+        self.deadline_ns = deadline_ns
+        self.missed = False
+
+
+class DeadlineScheduler:
+    def __init__(self, max_in_flight=4, deadline_ms=100.0):
+        """
+        Args:
+            max_in_flight: Máximo de quadros em processamento; acima disso novos quadros não são enviados.
+            deadline_ms: Prazo por quadro, contado do instante de captura.
+        """
+        self.max_in_flight = max_in_flight
+        self.deadline_ns = int(deadline_ms * 1e6)
+        self.pending = deque()
+        self.stats = {'submitted': 0, 'skipped': 0, 'shown': 0, 'late': 0,
+                      'stale': 0, 'cancelled': 0, 'missed': 0, 'errors': 0}
+
+    def full(self):
+        return len(self.pending) >= self.max_in_flight
+
+    def skip(self):
+        # Quadro de entrada não enviado porque o pipeline está cheio
+        self.stats['skipped'] += 1
+
+    def submit(self, future, ts_ns=None):
+        ts_ns = ts_ns or time.time_ns()
+        self.pending.append(_Entry(future, ts_ns, ts_ns + self.deadline_ns))
+        self.stats['submitted'] += 1
+
+    def _drop(self, entry):
+        # O future do FaceSwapper só é concluído no fim do pipeline, então cancel()
+        # funciona mesmo com a troca em execução (o estágio seguinte é pulado)
+        if entry.future.cancel():
+            self.stats['cancelled'] += 1
+        else:
+            self.stats['stale'] += 1
+        if not entry.missed:
+            entry.missed = True
+            self.stats['missed'] += 1
+
+    def poll(self, timeout=0.0):
+        """
+        Retorna o quadro concluído mais recente e descarta os anteriores.
+
+        Args:
+            timeout: Tempo máximo (s) de espera por algum quadro concluído. Se o
+                pipeline estiver cheio, espera no máximo até o prazo do mais antigo.
+
+        Returns:
+            tuple: (quadro, instante de captura em ns) ou (None, None) se nada novo ficou pronto.
+        """
+        if not self.pending:
+            return None, None
+        if timeout and not any(e.future.done() for e in self.pending):
+            concurrent.futures.wait([e.future for e in self.pending], timeout=timeout,
+                                    return_when=concurrent.futures.FIRST_COMPLETED)
+
+        now = time.time_ns()
+        newest = None
+        for index, entry in enumerate(self.pending):
+            if entry.future.done():
+                newest = index
+            elif not entry.missed and now > entry.deadline_ns:
+                entry.missed = True
+                self.stats['missed'] += 1
+        if newest is None:
+            return None, None
+
+        for _ in range(newest):
+            self._drop(self.pending.popleft())
+        entry = self.pending.popleft()
+        try:
+            output = entry.future.result()
+        except Exception as e:
+            print(f"[DeadlineScheduler] Erro de processamento: {e}")
+            self.stats['errors'] += 1
+            return None, None
+
+        self.stats['shown'] += 1
+        if now > entry.deadline_ns:
+            self.stats['late'] += 1
+            if not entry.missed:
+                entry.missed = True
+                self.stats['missed'] += 1
+        return output, entry.ts_ns
+
+    def wait_timeout(self):
+        # Pipeline cheio: espera até o prazo do quadro mais antigo (mínimo 10 ms, sem girar em falso)
+        if not self.full():
+            return 0.0
+        remaining = (self.pending[0].deadline_ns - time.time_ns()) / 1e9
+        return max(remaining, 0.01)
+
+    def clear(self):
+        # Troca de rosto de origem etc.: nenhum quadro pendente deve ser exibido
+        while self.pending:
+            self._drop(self.pending.popleft())
+
+    def miss_rate(self):
+        resolved = self.stats['shown'] + self.stats['stale'] + self.stats['cancelled']
+        return self.stats['missed'] / resolved if resolved else 0.0
+
+    def summary(self):
+        s = self.stats
+        return (f"{s['shown']} exibidos ({s['late']} atrasados), {s['stale']} obsoletos, "
+                f"{s['cancelled']} cancelados, {s['skipped']} não enviados, "
+                f"{self.miss_rate() * 100:.1f}% fora do prazo")
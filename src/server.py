@@ -0,0 +1,436 @@
+"""
+Modo servidor: mantém o FaceSwapper carregado e atende jobs por uma API HTTP
+local (TCP ou socket Unix), sem recarregar os modelos a cada tarefa.
+
+Endpoints:
+    GET  /health         estado da fila e estatísticas do agrupamento
+    GET  /sources        rostos de origem registrados
+    POST /sources?id=X   registra um rosto de origem (corpo: bytes da imagem)
+    POST /swap?source=X  troca rostos em uma imagem (corpo: bytes da imagem;
+                         resposta: imagem processada, formato por ?format=jpg|png);
+                         X também pode ser um id do índice de identidades
+    POST /jobs/video     processa um vídeo local (corpo JSON: input, output, source);
+                         a resposta é um stream NDJSON com o progresso e o resultado
+
+Quadros de todos os clientes (imagens e quadros de vídeo) passam por uma fila
+única e limitada. Um despachante agrupa os itens da fila em lotes (até
+batch_size itens ou batch_wait_ms de espera): a detecção roda em paralelo no pool
+do FaceSwapper e os rostos do lote inteiro são trocados em uma única inferência.
+Com a fila cheia, /swap responde 503 com Retry-After em vez de acumular trabalho.
+"""
+import concurrent.futures
+import hashlib
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import numpy as np
+
+from .detection import AdaptiveFaceDetector
+
+
+class _WorkItem:
+    # Um quadro a processar; detector é None para imagens avulsas (detecção sem estado)
+    def __init__(self, frame, source_face, detector=None):
+        self.frame = frame
+        self.source_face = source_face
+        self.detector = detector
+        self.future = concurrent.futures.Future()
+        self.enqueued = time.perf_counter()
+
+
+class QueueFullError(Exception):
+    def __init__(self, retry_after):
+        super().__init__("Fila cheia")
+        self.retry_after = retry_after
+
+
+class SwapService:
+    def __init__(self, swapper, queue_size=32, batch_size=8, batch_wait_ms=5.0, max_video_jobs=2):
+        """
+        Args:
+            swapper: FaceSwapper já inicializado (modelos carregados uma única vez).
+            queue_size: Máximo de quadros aguardando processamento (backpressure).
+            batch_size: Máximo de quadros processados juntos por lote.
+            batch_wait_ms: Espera máxima por mais itens antes de fechar um lote.
+            max_video_jobs: Jobs de vídeo simultâneos.
+        """
+        self.swapper = swapper
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000.0
+        self.video_slots = threading.BoundedSemaphore(max_video_jobs)
+
+        self.sources = {}
+        self._sources_lock = threading.Lock()
+        if swapper.source_face is not None:
+            self.sources['default'] = swapper.source_face
+
+        # Contadores escritos pelo despachante e pelas threads das requisições
+        self.stats = {'items': 0, 'batches': 0, 'rejected': 0, 'video_jobs': 0}
+        self._stats_lock = threading.Lock()
+        # Média móvel do tempo por item, usada para estimar o Retry-After
+        self.item_seconds = 0.05
+        self.stopped = False
+        self.thread = threading.Thread(target=self._dispatch, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+
+    # --- Rostos de origem ---
+
+    def register_source(self, img, source_id=None):
+        face = self.swapper.face_from_image(img)
+        if not source_id:
+            source_id = hashlib.sha1(img.tobytes()).hexdigest()[:12]
+        with self._sources_lock:
+            self.sources[source_id] = face
+        print(f"[SwapService] Rosto de origem registrado: {source_id}")
+        return source_id
+
+    def get_source(self, source_id):
+        with self._sources_lock:
+            face = self.sources.get(source_id or 'default')
+        index = self.swapper.identity_index
+        if face is None and source_id and index is not None and source_id in index:
+            # Identidade da biblioteca (índice de embeddings) sem registro prévio
+            face = index.face(source_id)
+        if face is None:
+            raise KeyError(f"Rosto de origem desconhecido: {source_id}")
+        return face
+
+    # --- Fila e agrupamento ---
+
+    def retry_after(self):
+        return max(1, int(self.queue.qsize() * self.item_seconds / max(1, self.swapper.max_workers)) + 1)
+
+    def submit(self, frame, source_face, detector=None, block=False, timeout=None):
+        item = _WorkItem(frame, source_face, detector)
+        try:
+            self.queue.put(item, block=block, timeout=timeout)
+        except queue.Full:
+            self._count('rejected')
+            raise QueueFullError(self.retry_after())
+        return item.future
+
+    def _next_batch(self):
+        try:
+            batch = [self.queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.perf_counter() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _detect(self, item):
+        if item.detector is not None:
+            return item.detector.detect(item.frame)
+        # Imagem avulsa: detecção sem estado (em blocos para fotos grandes)
+        return self.swapper.detect_still(item.frame)
+
+    def _detect_group(self, items):
+        results = []
+        for item in items:
+            try:
+                results.append((self._detect(item), None))
+            except Exception as e:
+                results.append((None, e))
+        return results
+
+    def _detect_batch(self, batch):
+        """
+        Detecta os rostos de um lote.
+
+        Imagens avulsas (detecção sem estado) rodam em paralelo. Quadros de um mesmo vídeo
+        compartilham um detector com estado (rostos anteriores, ROI): rodam em uma única
+        tarefa, em sequência e na ordem da fila.
+
+        Returns:
+            list: (rostos, exceção) de cada item, na ordem do lote
+        """
+        groups = {}
+        for index, item in enumerate(batch):
+            key = ('detector', id(item.detector)) if item.detector is not None else ('still', index)
+            groups.setdefault(key, []).append(index)
+        futures = [(indices, self.swapper.executor.submit(self._detect_group, [batch[i] for i in indices]))
+                   for indices in groups.values()]
+        results = [None] * len(batch)
+        for indices, future in futures:
+            for index, result in zip(indices, future.result()):
+                results[index] = result
+        return results
+
+    def _dispatch(self):
+        while not self.stopped:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            t0 = time.perf_counter()
+            # Detecção em paralelo; a troca do lote inteiro é uma inferência do inswapper
+            ready, faces_list = [], []
+            for item, (faces, error) in zip(batch, self._detect_batch(batch)):
+                if error is not None:
+                    item.future.set_exception(error)
+                else:
+                    faces_list.append(faces)
+                    ready.append(item)
+            if ready:
+                try:
+                    results = self.swapper.process_batch([item.frame for item in ready], faces_list,
+                                                         [item.source_face for item in ready],
+                                                         executor=self.swapper.executor)
+                    for item, res, faces in zip(ready, results, faces_list):
+                        item.future.set_result((res, len(faces)))
+                except Exception as e:
+                    for item in ready:
+                        item.future.set_exception(e)
+            elapsed = time.perf_counter() - t0
+            with self._stats_lock:
+                self.item_seconds = 0.9 * self.item_seconds + 0.1 * (elapsed / len(batch))
+                self.stats['items'] += len(batch)
+                self.stats['batches'] += 1
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def health(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+            item_seconds = self.item_seconds
+        with self._sources_lock:
+            sources = len(self.sources)
+        batches = stats['batches']
+        return {
+            'queue': self.queue.qsize(),
+            'queue_size': self.queue.maxsize,
+            'avg_batch': stats['items'] / batches if batches else 0.0,
+            'item_ms': item_seconds * 1000,
+            'sources': sources,
+            **stats,
+        }
+
+    # --- Jobs ---
+
+    def swap_image(self, img, source_id=None):
+        future = self.submit(img, self.get_source(source_id))
+        return future.result()
+
+    def swap_video(self, in_path, out_path, source_id=None):
+        """
+        Processa um vídeo pelo mesmo agrupador dos demais clientes.
+        Gera dicionários de progresso e, por último, o resultado.
+        """
+        source_face = self.get_source(source_id)
+        if not self.video_slots.acquire(blocking=False):
+            raise QueueFullError(self.retry_after() * 10)
+        try:
+            self._count('video_jobs')
+            cap = cv2.VideoCapture(in_path)
+            if not cap.isOpened():
+                raise IOError(f"Não foi possível abrir o vídeo: {in_path}")
+            fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+            total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            writer = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+
+            # Detector próprio do job: mantém o estado entre quadros deste vídeo
+            detector = AdaptiveFaceDetector(self.swapper.app.det_model, det_sizes=self.swapper.detector.det_sizes,
+                                            base_size=self.swapper.detector.base_size)
+            # Quadros em voo limitados: o job espera a fila em vez de ser rejeitado
+            pending = []
+            window = self.batch_size * 2
+            written = 0
+            t0 = time.time()
+            try:
+                while True:
+                    ret, frame = cap.read()
+                    if ret:
+                        pending.append(self.submit(frame, source_face, detector, block=True))
+                    while pending and (len(pending) >= window or not ret):
+                        res, _ = pending.pop(0).result()
+                        writer.write(res)
+                        written += 1
+                        if written % 30 == 0:
+                            yield {'status': 'running', 'frame': written, 'total': total,
+                                   'fps': written / max(time.time() - t0, 1e-6)}
+                    if not ret:
+                        break
+            finally:
+                cap.release()
+                writer.release()
+            yield {'status': 'done', 'frame': written, 'total': total, 'output': out_path,
+                   'seconds': time.time() - t0}
+        finally:
+            self.video_slots.release()
+
+
+class SwapRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    service = None
+
+    def log_message(self, format, *args):
+        # Sem log por requisição (client_address é vazio em sockets Unix)
+        pass
+
+    def _query(self):
+        return {k: v[-1] for k, v in parse_qs(urlparse(self.path).query).items()}
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length else b''
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, str(value))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _decode_image(self, data):
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR) if data else None
+        if img is None:
+            raise ValueError("Corpo da requisição não é uma imagem válida")
+        return img
+
+    def do_GET(self):
+        route = urlparse(self.path).path
+        if route == '/health':
+            self._send_json(200, self.service.health())
+        elif route == '/sources':
+            self._send_json(200, {'sources': sorted(self.service.sources)})
+        else:
+            self._send_json(404, {'error': 'rota desconhecida'})
+
+    def do_POST(self):
+        route = urlparse(self.path).path
+        query = self._query()
+        try:
+            if route == '/sources':
+                source_id = self.service.register_source(self._decode_image(self._body()), query.get('id'))
+                self._send_json(200, {'id': source_id})
+            elif route == '/swap':
+                self._swap(query)
+            elif route == '/jobs/video':
+                self._video(json.loads(self._body() or b'{}'))
+            else:
+                self._send_json(404, {'error': 'rota desconhecida'})
+        except QueueFullError as e:
+            self._send_json(503, {'error': 'fila cheia', 'retry_after': e.retry_after},
+                            headers={'Retry-After': e.retry_after})
+        except KeyError as e:
+            self._send_json(404, {'error': str(e.args[0])})
+        except (ValueError, IOError) as e:
+            self._send_json(400, {'error': str(e)})
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+
+    def _swap(self, query):
+        t0 = time.perf_counter()
+        img = self._decode_image(self._body())
+        res, face_count = self.service.swap_image(img, query.get('source'))
+        ext = '.png' if query.get('format') == 'png' else '.jpg'
+        ok, encoded = cv2.imencode(ext, res)
+        if not ok:
+            raise RuntimeError("Falha ao codificar a imagem")
+        body = encoded.tobytes()
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png' if ext == '.png' else 'image/jpeg')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-Faces', str(face_count))
+        self.send_header('X-Latency-Ms', f"{(time.perf_counter() - t0) * 1000:.1f}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _video(self, payload):
+        in_path = payload.get('input')
+        if not in_path or not os.path.exists(in_path):
+            raise ValueError(f"Vídeo de entrada não encontrado: {in_path}")
+        out_path = payload.get('output') or os.path.join(
+            "outputs", f"processed_{os.path.splitext(os.path.basename(in_path))[0]}_{int(time.time())}.mp4")
+        os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+        events = self.service.swap_video(in_path, out_path, payload.get('source'))
+        # Primeiro evento antes do cabeçalho: erros de admissão ainda viram 503/404
+        first = next(events)
+
+        # Stream NDJSON (uma linha JSON por evento) com transferência em chunks
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            self._write_chunk(first)
+            for event in events:
+                self._write_chunk(event)
+        except Exception as e:
+            self._write_chunk({'status': 'error', 'error': str(e)})
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_chunk(self, event):
+        line = (json.dumps(event) + '\n').encode('utf-8')
+        self.wfile.write(f"{len(line):x}\r\n".encode('ascii') + line + b'\r\n')
+        self.wfile.flush()
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        socketserver.UnixStreamServer.server_bind(self)
+        # Campos usados pelo BaseHTTPRequestHandler
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+
+def serve(swapper, listen='127.0.0.1:8765', unix_socket=None, **service_options):
+    """
+    Inicia o serviço e atende requisições até Ctrl+C.
+
+    Args:
+        swapper: FaceSwapper já inicializado.
+        listen: Endereço host:porta (ignorado se unix_socket for usado).
+        unix_socket: Caminho de um socket Unix (apenas Linux/macOS).
+        service_options: Repassados para SwapService.
+    """
+    service = SwapService(swapper, **service_options).start()
+    handler = type('Handler', (SwapRequestHandler,), {'service': service})
+    if unix_socket:
+        server = ThreadingUnixHTTPServer(unix_socket, handler)
+        address = unix_socket
+    else:
+        host, _, port = listen.rpartition(':')
+        server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), handler)
+        address = f"http://{host or '127.0.0.1'}:{port}"
+    print(f"[SwapService] Atendendo em {address} (fila {service.queue.maxsize}, lote {service.batch_size})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
+        if unix_socket and os.path.exists(unix_socket):
+            os.remove(unix_socket)
@@ -0,0 +1,211 @@
+"""
+Pool de sessões do ONNX Runtime para inferência concorrente.
+
+Com várias threads chamando session.run na mesma sessão, o paralelismo fica a
+cargo dos locks internos do ORT e cada chamada tenta usar todos os núcleos
+(intra_op), o que gera disputa de threads. O SessionPool mantém uma sessão por
+worker, cada uma com seu IO binding e tensores de entrada/saída pré-alocados,
+e divide os núcleos entre as sessões.
+
+Para limitar a memória, os pesos (initializers) são lidos uma única vez e
+compartilhados entre as sessões via SessionOptions.add_initializer, e as
+sessões usam a mesma arena de memória de CPU registrada no ambiente do ORT.
+Os dois mecanismos valem para a memória do host; em CUDA/TensorRT cada sessão
+ainda mantém sua própria cópia dos pesos na GPU.
+
+O pool expõe run/get_inputs/get_outputs/get_providers, então pode substituir
+o atributo .session do INSwapper ou do FaceEnhancer sem outras mudanças.
+"""
+import concurrent.futures
+import os
+import queue
+import threading
+
+import numpy as np
+import onnxruntime
+
+_ORT_DTYPES = {
+    'tensor(float)': np.float32,
+    'tensor(float16)': np.float16,
+    'tensor(double)': np.float64,
+    'tensor(int64)': np.int64,
+    'tensor(int32)': np.int32,
+    'tensor(uint8)': np.uint8,
+}
+
+_env_allocator_lock = threading.Lock()
+_env_allocator_registered = False
+
+
+def register_shared_arena():
+    """
+    Registra (uma vez por processo) uma arena de CPU no ambiente do ORT.
+    Sessões criadas com 'session.use_env_allocators' = 1 passam a alocar dela.
+
+    Returns:
+        bool: True se a arena compartilhada está disponível.
+    """
+    global _env_allocator_registered
+    with _env_allocator_lock:
+        if not _env_allocator_registered:
+            try:
+                mem_info = onnxruntime.OrtMemoryInfo("Cpu", onnxruntime.OrtAllocatorType.ORT_ARENA_ALLOCATOR,
+                                                     0, onnxruntime.OrtMemType.DEFAULT)
+                # 0 / -1: valores padrão do ORT para tamanho máximo, estratégia de extensão etc.
+                onnxruntime.create_and_register_allocator(mem_info, onnxruntime.OrtArenaCfg(0, -1, -1, -1))
+                _env_allocator_registered = True
+            except Exception as e:
+                print(f"[SessionPool] Aviso: arena compartilhada indisponível: {e}")
+        return _env_allocator_registered
+
+
+def load_initializers(model_path):
+    """
+    Lê os pesos do modelo como OrtValues para serem compartilhados entre sessões.
+
+    Returns:
+        dict: nome -> (array numpy, OrtValue). O array precisa continuar vivo
+            enquanto as sessões existirem, pois o OrtValue aponta para ele.
+    """
+    import onnx
+    from onnx import numpy_helper
+
+    model = onnx.load(model_path)
+    initializers = {}
+    for tensor in model.graph.initializer:
+        array = np.ascontiguousarray(numpy_helper.to_array(tensor))
+        initializers[tensor.name] = (array, onnxruntime.OrtValue.ortvalue_from_numpy(array))
+    return initializers
+
+
+def _provider_names(providers):
+    return [p[0] if isinstance(p, (tuple, list)) else p for p in providers]
+
+
+class _PoolSlot:
+    # Sessão de um worker com IO binding e tensores reaproveitados entre chamadas
+    def __init__(self, session, device):
+        self.session = session
+        self.device = device
+        self.binding = session.io_binding()
+        self.input_types = {i.name: _ORT_DTYPES.get(i.type, np.float32) for i in session.get_inputs()}
+        self.output_names = [o.name for o in session.get_outputs()]
+        self._inputs = {}
+        # Saídas alocadas pelo ORT na primeira chamada de cada combinação de shapes
+        self._outputs = {}
+
+    def _input_value(self, name, array):
+        key = (name, array.shape)
+        value = self._inputs.get(key)
+        if value is None:
+            value = onnxruntime.OrtValue.ortvalue_from_shape_and_type(array.shape, array.dtype, self.device)
+            self._inputs[key] = value
+        value.update_inplace(array)
+        return value
+
+    def run(self, output_names, input_feed, run_options=None):
+        output_names = output_names or self.output_names
+        binding = self.binding
+        binding.clear_binding_inputs()
+        binding.clear_binding_outputs()
+
+        for name, array in input_feed.items():
+            array = np.ascontiguousarray(array, dtype=self.input_types.get(name))
+            binding.bind_ortvalue_input(name, self._input_value(name, array))
+
+        key = (tuple(output_names), tuple((name, np.shape(a)) for name, a in input_feed.items()))
+        outputs = self._outputs.get(key)
+        for i, name in enumerate(output_names):
+            if outputs is not None:
+                binding.bind_ortvalue_output(name, outputs[i])
+            else:
+                binding.bind_output(name, self.device)
+
+        self.session.run_with_iobinding(binding, run_options)
+        if outputs is None:
+            outputs = binding.get_outputs()
+            self._outputs[key] = outputs
+        # numpy() de um OrtValue de CPU é uma view do buffer reaproveitado: copia
+        return [np.array(value.numpy()) for value in outputs]
+
+
+class SessionPool:
+    def __init__(self, model_path, providers, size=2, intra_op_threads=None, share_weights=True,
+                 shared_arena=True):
+        """
+        Args:
+            model_path: Caminho do modelo ONNX.
+            providers: Providers do ONNX Runtime (mesmo formato de InferenceSession).
+            size: Número de sessões (normalmente o número de workers que usam o modelo).
+            intra_op_threads: Threads por sessão. Se None, divide os núcleos entre as sessões.
+            share_weights: Compartilha os initializers entre as sessões (requer o pacote onnx).
+            shared_arena: Usa a arena de CPU registrada no ambiente do ORT.
+        """
+        self.model_path = model_path
+        self.size = max(1, size)
+        self.providers = providers
+        names = _provider_names(providers)
+        gpu = 'CUDAExecutionProvider' in names or 'TensorrtExecutionProvider' in names
+        gpu = gpu and 'CUDAExecutionProvider' in onnxruntime.get_available_providers()
+        self.device = 'cuda' if gpu else 'cpu'
+
+        if intra_op_threads is None:
+            intra_op_threads = max(1, (os.cpu_count() or 1) // self.size)
+        self.intra_op_threads = intra_op_threads
+
+        self._initializers = {}
+        if share_weights:
+            try:
+                self._initializers = load_initializers(model_path)
+            except Exception as e:
+                print(f"[SessionPool] Aviso: pesos não serão compartilhados: {e}")
+        use_env_allocators = shared_arena and register_shared_arena()
+
+        def create_session(_):
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = self.intra_op_threads
+            options.inter_op_num_threads = 1
+            options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+            if use_env_allocators:
+                options.add_session_config_entry('session.use_env_allocators', '1')
+            for name, (_, value) in self._initializers.items():
+                options.add_initializer(name, value)
+            return onnxruntime.InferenceSession(model_path, sess_options=options, providers=providers)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.size) as loader:
+            sessions = list(loader.map(create_session, range(self.size)))
+
+        self._slots = queue.Queue()
+        for session in sessions:
+            self._slots.put(_PoolSlot(session, self.device))
+        self._reference = sessions[0]
+        print(f"[SessionPool] {os.path.basename(model_path)}: {self.size} sessões, "
+              f"{self.intra_op_threads} threads cada, dispositivo {self.device}, "
+              f"pesos {'compartilhados' if self._initializers else 'por sessão'}.")
+
+    def get_inputs(self):
+        return self._reference.get_inputs()
+
+    def get_outputs(self):
+        return self._reference.get_outputs()
+
+    def get_providers(self):
+        return self._reference.get_providers()
+
+    def run(self, output_names, input_feed, run_options=None):
+        # Bloqueia até uma sessão ficar livre (no máximo `size` inferências simultâneas)
+        slot = self._slots.get()
+        try:
+            return slot.run(output_names, input_feed, run_options)
+        finally:
+            self._slots.put(slot)
+
+    def warmup(self, input_feed):
+        # Roda uma inferência em cada sessão (alocações, engines TensorRT)
+        slots = [self._slots.get() for _ in range(self.size)]
+        try:
+            for slot in slots:
+                slot.run(None, input_feed)
+        finally:
+            for slot in slots:
+                self._slots.put(slot)
@@ -0,0 +1,511 @@
+"""
+Fontes e destinos de quadros plugáveis para o modo tempo real.
+
+Permitem usar o FaceSwapper dentro de outro roteador de vídeo sem passar por
+webcam física ou câmera virtual. Os quadros são sempre BGR24 (uint8, HxWx3).
+
+URIs de entrada (--input-uri):
+    webcam:0            webcam local (WebcamStream)
+    file:caminho        arquivo de vídeo no ritmo original (VideoFileStream)
+    raw:-               BGR24 cru pelo stdin (exige --input-size LxA); raw:caminho lê de um arquivo/FIFO
+    shm:nome            anel em memória compartilhada criado por um produtor local (ShmRingWriter)
+    tcp://host:porta    escuta e recebe quadros com cabeçalho (FRAME_HEADER) de um produtor
+    unix:caminho        idem, em socket Unix
+
+URIs de saída (--output-uri):
+    window              janela do OpenCV (padrão, com teclado)
+    null                descarta os quadros (medições)
+    raw:-               BGR24 cru pelo stdout (logs vão para o stderr); raw:caminho escreve em arquivo/FIFO
+    shm:nome            cria um anel em memória compartilhada para um consumidor local
+    tcp://host:porta    escuta e envia quadros com cabeçalho ao consumidor conectado
+    unix:caminho        idem, em socket Unix
+
+Cada quadro carrega o instante de captura (time.time_ns). Entradas com
+cabeçalho (shm, socket) preservam o instante do produtor; as demais usam o
+momento da leitura. Os destinos medem a latência por quadro até a escrita.
+"""
+import os
+import queue
+import socket
+import struct
+import sys
+import threading
+import time
+from collections import deque
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Cabeçalho de cada quadro nos sockets: magic, largura, altura, índice, instante de captura (ns)
+FRAME_HEADER = struct.Struct('<4sIIqq')
+FRAME_MAGIC = b'DFR1'
+
+# Anel em memória compartilhada: cabeçalho global (magic, largura, altura, slots, último seq)
+# seguido de `slots` posições com (seq, instante de captura) + quadro
+RING_HEADER = struct.Struct('<4sIIIq')
+RING_MAGIC = b'DFS1'
+RING_HEADER_SIZE = 64
+SLOT_HEADER = struct.Struct('<qq')
+_SEQ = struct.Struct('<q')
+_RING_SEQ_OFFSET = 16
+
+
+class LatencyStats:
+    # Latência por quadro (ms) nas últimas `window` amostras
+    def __init__(self, window=300):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, ts_ns):
+        if ts_ns:
+            self.samples.append((time.time_ns() - ts_ns) / 1e6)
+            self.count += 1
+
+    def summary(self):
+        if not self.samples:
+            return {'avg': 0.0, 'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+        values = np.fromiter(self.samples, dtype=np.float64)
+        return {'avg': float(values.mean()), 'p50': float(np.percentile(values, 50)),
+                'p95': float(np.percentile(values, 95)), 'max': float(values.max())}
+
+    def __str__(self):
+        s = self.summary()
+        return f"média {s['avg']:.1f} ms, p50 {s['p50']:.1f} ms, p95 {s['p95']:.1f} ms, máx {s['max']:.1f} ms"
+
+
+def reserve_stdout():
+    """
+    Reserva o stdout original para dados binários. O descritor 1 passa a apontar
+    para o stderr, então prints (inclusive de bibliotecas nativas) não corrompem o stream.
+
+    Returns:
+        arquivo binário sem buffer ligado ao stdout original
+    """
+    sys.stdout.flush()
+    fd = os.dup(1)
+    os.dup2(2, 1)
+    return os.fdopen(fd, 'wb', buffering=0)
+
+
+def parse_size(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def _split_uri(uri):
+    if '://' in uri:
+        scheme, rest = uri.split('://', 1)
+    elif ':' in uri and len(uri.split(':', 1)[0]) > 1:
+        # len > 1: não confunde letra de unidade do Windows (C:\...) com esquema
+        scheme, rest = uri.split(':', 1)
+    else:
+        scheme, rest = uri, ''
+    return scheme.lower(), rest
+
+
+def _parse_address(scheme, rest):
+    if scheme == 'unix':
+        return socket.AF_UNIX, rest
+    host, _, port = rest.rpartition(':')
+    return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+
+def _listen(family, address):
+    if family == socket.AF_UNIX and os.path.exists(address):
+        os.remove(address)
+    server = socket.socket(family, socket.SOCK_STREAM)
+    if family == socket.AF_INET:
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(address)
+    server.listen(1)
+    server.settimeout(0.5)
+    return server
+
+
+def _recv_exact(conn, view):
+    received = 0
+    while received < len(view):
+        n = conn.recv_into(view[received:])
+        if not n:
+            return False
+        received += n
+    return True
+
+
+def _attach_shm(name):
+    # Um consumidor não deve remover o segmento ao sair (resource_tracker do Python < 3.13)
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+        return shm
+
+
+# --- Fontes ---
+
+class FrameSource:
+    # Leitura em thread própria; com a fila cheia descarta o quadro mais antigo (sempre o mais recente)
+    def __init__(self, queue_size=2):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.finished = False
+        self.stopped = False
+        self.dropped = 0
+        self.frames = 0
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        return self
+
+    def _grab(self):
+        # Retorna (quadro, instante de captura em ns) ou None no fim do stream
+        raise NotImplementedError
+
+    def _run(self):
+        try:
+            while not self.stopped:
+                item = self._grab()
+                if item is None:
+                    break
+                self.frames += 1
+                try:
+                    self.queue.put_nowait(item)
+                except queue.Full:
+                    try:
+                        self.queue.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+                    self.queue.put_nowait(item)
+        except Exception as e:
+            print(f"[{type(self).__name__}] Erro na leitura: {e}")
+        finally:
+            self.finished = True
+
+    def read_frame(self, timeout=0.5):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None, None
+
+    def read(self):
+        return self.read_frame()[0]
+
+    def stop(self):
+        self.stopped = True
+
+
+class RawPipeSource(FrameSource):
+    def __init__(self, path, width, height):
+        super().__init__()
+        self.width = width
+        self.height = height
+        self.stream = sys.stdin.buffer if path in ('', '-') else open(path, 'rb')
+        self.frame_bytes = width * height * 3
+
+    def _grab(self):
+        frame = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        view = memoryview(frame).cast('B')
+        read = 0
+        while read < self.frame_bytes:
+            n = self.stream.readinto(view[read:])
+            if not n:
+                return None
+            read += n
+        return frame, time.time_ns()
+
+
+class ShmRingReader(FrameSource):
+    def __init__(self, name, timeout=10.0, poll=0.0005):
+        super().__init__()
+        deadline = time.time() + timeout
+        while True:
+            try:
+                self.shm = _attach_shm(name)
+                break
+            except FileNotFoundError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.1)
+        magic, self.width, self.height, self.slots, _ = RING_HEADER.unpack_from(self.shm.buf, 0)
+        if magic != RING_MAGIC:
+            raise ValueError(f"Memória compartilhada '{name}' não é um anel de quadros")
+        self.frame_bytes = self.width * self.height * 3
+        self.stride = _slot_stride(self.frame_bytes)
+        self.poll = poll
+        self.last_seq = _SEQ.unpack_from(self.shm.buf, _RING_SEQ_OFFSET)[0]
+
+    def _grab(self):
+        buf = self.shm.buf
+        while not self.stopped:
+            seq = _SEQ.unpack_from(buf, _RING_SEQ_OFFSET)[0]
+            if seq == self.last_seq:
+                time.sleep(self.poll)
+                continue
+            offset = RING_HEADER_SIZE + (seq % self.slots) * self.stride
+            slot_seq, ts_ns = SLOT_HEADER.unpack_from(buf, offset)
+            if slot_seq != seq:
+                continue
+            frame = np.frombuffer(buf, dtype=np.uint8, count=self.frame_bytes,
+                                  offset=offset + SLOT_HEADER.size).reshape(self.height, self.width, 3).copy()
+            # Produtor reescreveu o slot durante a cópia: descarta e lê de novo
+            if _SEQ.unpack_from(buf, offset)[0] != seq:
+                continue
+            self.dropped += max(0, seq - self.last_seq - 1)
+            self.last_seq = seq
+            return frame, ts_ns
+        return None
+
+    def stop(self):
+        super().stop()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        self.shm.close()
+
+
+class SocketSource(FrameSource):
+    # Escuta e aceita um produtor por vez; ao desconectar, aguarda o próximo
+    def __init__(self, family, address):
+        super().__init__()
+        self.server = _listen(family, address)
+        self.conn = None
+        print(f"[SocketSource] Aguardando produtor em {address}")
+
+    def _accept(self):
+        while not self.stopped:
+            try:
+                conn, _ = self.server.accept()
+            except socket.timeout:
+                continue
+            conn.settimeout(None)
+            return conn
+        return None
+
+    def _grab(self):
+        header = bytearray(FRAME_HEADER.size)
+        while not self.stopped:
+            if self.conn is None:
+                self.conn = self._accept()
+                if self.conn is None:
+                    return None
+            if not _recv_exact(self.conn, memoryview(header)):
+                self.conn.close()
+                self.conn = None
+                continue
+            magic, width, height, _, ts_ns = FRAME_HEADER.unpack(header)
+            if magic != FRAME_MAGIC:
+                raise ValueError("Cabeçalho de quadro inválido")
+            frame = np.empty((height, width, 3), dtype=np.uint8)
+            if not _recv_exact(self.conn, memoryview(frame).cast('B')):
+                self.conn.close()
+                self.conn = None
+                continue
+            return frame, ts_ns or time.time_ns()
+        return None
+
+    def stop(self):
+        super().stop()
+        self.server.close()
+
+
+def read_frame(source):
+    """
+    Lê o próximo quadro de qualquer fonte.
+
+    Returns:
+        tuple: (quadro ou None, instante de captura em ns)
+    """
+    if hasattr(source, 'read_frame'):
+        return source.read_frame()
+    # WebcamStream / VideoFileStream: sempre o quadro mais recente
+    return source.read(), time.time_ns()
+
+
+def open_source(uri, size=None, fps=30, camera_size=(1920, 1080), fourcc='MJPG'):
+    # camera_size/fourcc: formato negociado com a webcam (webcam:N), como --camera-size/--camera-fourcc
+    scheme, rest = _split_uri(uri)
+    if scheme == 'webcam':
+        from .camera import WebcamStream
+        return WebcamStream(src=int(rest or 0), fps=fps, width=camera_size[0], height=camera_size[1],
+                            fourcc=fourcc).start()
+    if scheme == 'file':
+        from .camera import VideoFileStream
+        return VideoFileStream(rest, realtime=True).start()
+    if scheme == 'raw':
+        if size is None:
+            raise ValueError("Entrada raw exige --input-size LARGURAxALTURA")
+        return RawPipeSource(rest, *size).start()
+    if scheme == 'shm':
+        return ShmRingReader(rest).start()
+    if scheme in ('tcp', 'unix'):
+        return SocketSource(*_parse_address(scheme, rest)).start()
+    raise ValueError(f"URI de entrada não suportada: {uri}")
+
+
+# --- Destinos ---
+
+def _slot_stride(frame_bytes):
+    return (SLOT_HEADER.size + frame_bytes + 63) // 64 * 64
+
+
+class FrameSink:
+    def __init__(self):
+        self.latency = LatencyStats()
+        self.frames = 0
+        self.index = 0
+
+    def write(self, frame, ts_ns=None):
+        self._write(np.ascontiguousarray(frame), ts_ns or time.time_ns())
+        self.index += 1
+        self.frames += 1
+        self.latency.add(ts_ns)
+
+    def _write(self, frame, ts_ns):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class NullSink(FrameSink):
+    def _write(self, frame, ts_ns):
+        pass
+
+
+class RawPipeSink(FrameSink):
+    def __init__(self, path):
+        super().__init__()
+        self.stream = reserve_stdout() if path in ('', '-') else open(path, 'wb', buffering=0)
+        self.shape = None
+
+    def _write(self, frame, ts_ns):
+        if self.shape is None:
+            self.shape = frame.shape
+            print(f"[RawPipeSink] Saída bgr24 {frame.shape[1]}x{frame.shape[0]}")
+        elif frame.shape != self.shape:
+            raise ValueError(f"Tamanho do quadro mudou ({frame.shape} != {self.shape})")
+        self.stream.write(memoryview(frame).cast('B'))
+
+    def close(self):
+        self.stream.close()
+
+
+class ShmRingWriter(FrameSink):
+    # Cria o anel no primeiro quadro (o tamanho vem do quadro real)
+    def __init__(self, name, slots=4):
+        super().__init__()
+        self.name = name
+        self.slots = slots
+        self.shm = None
+        self.seq = 0
+
+    def _create(self, frame):
+        height, width = frame.shape[:2]
+        self.frame_bytes = width * height * 3
+        self.stride = _slot_stride(self.frame_bytes)
+        size = RING_HEADER_SIZE + self.slots * self.stride
+        try:
+            old = shared_memory.SharedMemory(name=self.name)
+            old.close()
+            old.unlink()
+        except FileNotFoundError:
+            pass
+        self.shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+        RING_HEADER.pack_into(self.shm.buf, 0, RING_MAGIC, width, height, self.slots, 0)
+        self.shape = frame.shape
+        print(f"[ShmRingWriter] Anel '{self.name}' criado: {width}x{height}, {self.slots} slots")
+
+    def _write(self, frame, ts_ns):
+        if self.shm is None:
+            self._create(frame)
+        elif frame.shape != self.shape:
+            raise ValueError(f"Tamanho do quadro mudou ({frame.shape} != {self.shape})")
+        seq = self.seq + 1
+        buf = self.shm.buf
+        offset = RING_HEADER_SIZE + (seq % self.slots) * self.stride
+        # seq negativo marca o slot como em escrita para leitores concorrentes
+        _SEQ.pack_into(buf, offset, -seq)
+        target = np.frombuffer(buf, dtype=np.uint8, count=self.frame_bytes, offset=offset + SLOT_HEADER.size)
+        target[:] = frame.reshape(-1)
+        SLOT_HEADER.pack_into(buf, offset, seq, ts_ns)
+        _SEQ.pack_into(buf, _RING_SEQ_OFFSET, seq)
+        self.seq = seq
+
+    def close(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+class SocketSink(FrameSink):
+    # Escuta e envia para o consumidor conectado; sem consumidor os quadros são descartados
+    def __init__(self, family, address):
+        super().__init__()
+        self.server = _listen(family, address)
+        self.address = address
+        self.conn = None
+        self.stopped = False
+        self.thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self.thread.start()
+        print(f"[SocketSink] Aguardando consumidor em {address}")
+
+    def _accept_loop(self):
+        while not self.stopped:
+            try:
+                conn, _ = self.server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            if conn.family == socket.AF_INET:
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn.settimeout(None)
+            old, self.conn = self.conn, conn
+            if old is not None:
+                old.close()
+
+    def _write(self, frame, ts_ns):
+        conn = self.conn
+        if conn is None:
+            return
+        header = FRAME_HEADER.pack(FRAME_MAGIC, frame.shape[1], frame.shape[0], self.index, ts_ns)
+        try:
+            conn.sendall(header)
+            conn.sendall(memoryview(frame).cast('B'))
+        except OSError:
+            # Consumidor desconectou
+            conn.close()
+            if self.conn is conn:
+                self.conn = None
+
+    def close(self):
+        self.stopped = True
+        self.server.close()
+        if self.conn is not None:
+            self.conn.close()
+
+
+def open_sink(uri):
+    """
+    Abre o destino dos quadros. Retorna None para 'window' (exibição normal).
+    """
+    scheme, rest = _split_uri(uri)
+    if scheme == 'window':
+        return None
+    if scheme == 'null':
+        return NullSink()
+    if scheme == 'raw':
+        return RawPipeSink(rest)
+    if scheme == 'shm':
+        return ShmRingWriter(rest)
+    if scheme in ('tcp', 'unix'):
+        return SocketSink(*_parse_address(scheme, rest))
+    raise ValueError(f"URI de saída não suportada: {uri}")
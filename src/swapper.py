@@ -3,25 +3,106 @@ import insightface
 import numpy as np
 import os
 import time
+import threading
 import concurrent.futures
-from .utils import setup_dll_directories, get_default_providers
-from .enhancer import FaceEnhancer
+import onnxruntime
+from insightface.app import FaceAnalysis
+from insightface.model_zoo.model_zoo import ModelRouter
+from insightface.utils import ensure_available
+from .utils import (setup_dll_directories, get_default_providers, resolve_model_variant, load_runtime_profile,
+                    RUNTIME_PROFILE)
+from .enhancer import FaceEnhancer, EnhancementCache, DEFAULT_RESTORER
+from .detection import AdaptiveFaceDetector, TiledFaceDetector, DET_SIZES
+from .sessions import SessionPool
+from .batch_swap import BatchedInswapper, paste_back
+from .identity_index import IdentityIndex
 
 # Setup DLL directories for Windows
 setup_dll_directories()
 
+# Arquivos do pacote buffalo_l por tarefa. Apenas detecção e reconhecimento são
+# usados pelo pipeline; os demais são carregados sob demanda.
+BUFFALO_L_FILES = {
+    'detection': 'det_10g.onnx',
+    'recognition': 'w600k_r50.onnx',
+    'landmark_3d_68': '1k3d68.onnx',
+    'landmark_2d_106': '2d106det.onnx',
+    'genderage': 'genderage.onnx',
+}
+
+DEFAULT_SWAPPER_MODEL = os.path.join('models', 'inswapper_128_fp16.onnx')
+
+
+def load_model(path, providers, intra_op_threads=None):
+    # Como insightface.model_zoo.get_model, mas com o número de threads da sessão ajustável
+    if not intra_op_threads:
+        return insightface.model_zoo.get_model(path, providers=providers)
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads
+    return ModelRouter(path).get_model(providers=providers, sess_options=options)
+
+
+def _resolve(future, result=None, exception=None):
+    # O agendador pode cancelar o future entre a verificação e a conclusão
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except concurrent.futures.InvalidStateError:
+        pass
+
+class LazyFaceAnalysis(FaceAnalysis):
+    # FaceAnalysis montado a partir de modelos já carregados.
+    # O FaceAnalysis original cria sessões para todos os .onnx do pacote, mesmo os não usados.
+    def __init__(self, models, model_dir, providers, optimized_models=True, intra_op_threads=None):
+        self.models = dict(models)
+        self.det_model = self.models['detection']
+        self.model_dir = model_dir
+        self.providers = providers
+        self.optimized_models = optimized_models
+        self.intra_op_threads = intra_op_threads
+
+    def load_module(self, taskname):
+        if taskname in self.models:
+            return self.models[taskname]
+        path = os.path.join(self.model_dir, BUFFALO_L_FILES[taskname])
+        if self.optimized_models:
+            path = resolve_model_variant(path, self.providers)
+        model = load_model(path, self.providers, self.intra_op_threads)
+        model.prepare(ctx_id=0)
+        self.models[taskname] = model
+        return model
+
 class FaceSwapper:
-    def __init__(self, model_path, providers=None, det_size=(320, 320), max_workers=None):
+    def __init__(self, model_path=None, providers=None, det_size=None, max_workers=None,
+                 analysis_modules=('detection', 'recognition'), warmup=True, det_sizes=None,
+                 roi_detect=False, full_sweep_interval=10, enhance_cache_threshold=0.0, enhance_cache_max_reuse=10,
+                 enhance_model=None, enhance_tier=None, enhance_budget_ms=None, enhance_workers=1,
+                 enhance_queue_size=None, session_pool=False, optimized_models=True, swap_batch_size=16,
+                 batch_frames=4, swap_cache_threshold=0.0, swap_cache_max_reuse=5, tile_size=640,
+                 tile_overlap=0.25, identity_index=None, intra_op_threads=None, detect_interval=None,
+                 runtime_profile=RUNTIME_PROFILE):
+        # Perfil da máquina (tools/probe_hardware.py): preenche o que não foi passado explicitamente
+        profile = load_runtime_profile(runtime_profile)
+        if profile:
+            print(f"[FaceSwapper] Perfil de execução {runtime_profile}: "
+                  + ", ".join(f"{k}={v}" for k, v in sorted(profile.items())))
+        if model_path is None:
+            model_path = profile.get('model') if os.path.exists(profile.get('model') or '') else DEFAULT_SWAPPER_MODEL
+        if det_size is None:
+            det_size = (profile.get('det_size', 320),) * 2
+        if max_workers is None:
+            max_workers = profile.get('max_workers')
+        self.intra_op_threads = intra_op_threads or profile.get('intra_op_threads')
+        self.detect_interval = detect_interval or profile.get('detect_interval', 5)
+
         if providers is None:
             providers = get_default_providers()
         self.providers = providers
         self.det_size = det_size
 
         print(f"[FaceSwapper] Inicializando FaceAnalysis com providers: {self.providers} e det_size: {self.det_size}")
-        
-        # Aplicativo de detecção de rostos
-        self.app = insightface.app.FaceAnalysis(name='buffalo_l', providers=self.providers)
-        self.app.prepare(ctx_id=0, det_size=self.det_size)
 
         # Modelo de troca de rostos
         if not os.path.exists(model_path):
@@ -29,19 +110,73 @@ class FaceSwapper:
             
         if not os.path.exists('trt_cache'):
             os.makedirs('trt_cache')
-            
-        self.swapper = insightface.model_zoo.get_model(model_path, providers=self.providers)
-        
-        # Inicializa Enhancer (GFPGAN)
-        try:
-            self.enhancer = FaceEnhancer()
-            self.enhancement_enabled = False # Desativado por padrão
-        except Exception as e:
-            print(f"[FaceSwapper] Aviso: Não foi possível carregar FaceEnhancer: {e}")
-            self.enhancer = None
-            self.enhancement_enabled = False
+
+        # Cria as sessões necessárias em paralelo (detecção, reconhecimento e inswapper)
+        t0 = time.time()
+        model_dir = ensure_available('models', 'buffalo_l', root='~/.insightface')
+        paths = {task: os.path.join(model_dir, BUFFALO_L_FILES[task]) for task in analysis_modules}
+        known_pack = all(os.path.exists(path) for path in paths.values())
+        if not known_pack:
+            # Pacote com nomes de arquivo diferentes: carrega só o inswapper aqui
+            paths = {}
+        paths['swapper'] = model_path
+        # Variantes otimizadas (tools/optimize_models.py) registradas no manifesto
+        self.optimized_models = optimized_models
+        if optimized_models:
+            paths = {task: resolve_model_variant(path, self.providers) for task, path in paths.items()}
+            if swap_batch_size > 1:
+                # Variante com lote dinâmico permite inferir vários rostos de uma vez
+                dynamic_path = resolve_model_variant(model_path, self.providers, batch=None)
+                if dynamic_path != model_path:
+                    paths['swapper'] = dynamic_path
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(paths)) as loader:
+            futures = {task: loader.submit(load_model, path, self.providers, self.intra_op_threads)
+                       for task, path in paths.items()}
+            models = {task: future.result() for task, future in futures.items()}
+
+        self.swapper = models.pop('swapper')
+
+        # Aplicativo de detecção de rostos
+        if known_pack:
+            self.app = LazyFaceAnalysis(models, model_dir, self.providers, optimized_models, self.intra_op_threads)
+        else:
+            self.app = FaceAnalysis(name='buffalo_l', providers=self.providers, allowed_modules=list(analysis_modules))
+        self.app.prepare(ctx_id=0, det_size=self.det_size)
+        print(f"[FaceSwapper] Modelos carregados em {time.time() - t0:.2f}s")
+
+        # Detector com pirâmide de resoluções (det_size é o nível base)
+        # roi_detect: entre varreduras completas, detecta só ao redor dos rostos conhecidos
+        self.detector = AdaptiveFaceDetector(self.app.det_model, det_sizes=det_sizes or DET_SIZES,
+                                             base_size=self.det_size[0], roi_mode=roi_detect,
+                                             full_sweep_interval=full_sweep_interval)
+
+        # Detector em blocos para imagens estáticas grandes (criado no primeiro uso)
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self._tiled_detector = None
+        self._tiled_lock = threading.Lock()
+
+        # Enhancer (restauração de rostos) é carregado apenas quando a melhoria é ativada
+        self.enhance_cache_threshold = enhance_cache_threshold
+        self.enhance_cache_max_reuse = enhance_cache_max_reuse
+        # Restaurador fixo (enhance_model) ou escolhido por nível/orçamento de latência
+        self.enhance_model = enhance_model
+        self.enhance_tier = enhance_tier
+        self.enhance_budget_ms = enhance_budget_ms
+        self.session_pool = session_pool
+        self._enhancer = None
+        self._enhancer_failed = False
+        self._enhancer_thread = None
+        self._enhancer_lock = threading.Lock()
+        self.enhancement_enabled = False # Desativado por padrão
 
         self.source_face = None
+        self.source_id = None
+        # Biblioteca de identidades (tools/build_identity_index.py): origem escolhida por id
+        if isinstance(identity_index, str):
+            identity_index = IdentityIndex(identity_index, readonly=True)
+            print(f"[FaceSwapper] Índice de identidades com {len(identity_index)} rostos")
+        self.identity_index = identity_index
 
         # Estado para detecção periódica
         self.frame_count = 0
@@ -54,50 +189,370 @@ class FaceSwapper:
         else:
             self.max_workers = max_workers
         self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
-        print(f"[FaceSwapper] Inicializado com {self.max_workers} threads de trabalho.")
 
-    def set_source_image(self, source_img_path):
-        img = cv2.imread(source_img_path)
-        if img is None:
-            raise ValueError(f"Não foi possível ler a imagem de origem: {source_img_path}")
+        # Estágio de melhoria com pool próprio: a troca do quadro N+1 roda enquanto o quadro N
+        # está no enhancer. enhance_queue_size limita quantos quadros podem aguardar/estar
+        # no enhancer; acima disso o quadro sai sem melhoria em vez de atrasar a saída.
+        self.enhance_workers = max(1, enhance_workers)
+        self.enhance_queue_size = enhance_queue_size if enhance_queue_size is not None else self.enhance_workers + 1
+        self.enhance_executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.enhance_workers)
+        self._enhance_pending = 0
+        self._enhance_pending_lock = threading.Lock()
+        self.pipeline_stats = {'enhanced': 0, 'enhance_skipped': 0}
+        print(f"[FaceSwapper] Inicializado com {self.max_workers} threads de troca e {self.enhance_workers} de melhoria.")
+
+        # Uma sessão do inswapper por worker (pesos compartilhados) em vez de uma sessão disputada
+        if session_pool and self.max_workers > 1:
+            self.swapper.session = SessionPool(paths['swapper'], self.providers, size=self.max_workers,
+                                               intra_op_threads=self.intra_op_threads)
+
+        # Rostos de um quadro (ou de vários quadros no modo offline) em uma única inferência
+        self.batch_swapper = BatchedInswapper(self.swapper, max_batch=swap_batch_size)
+        self.batch_frames = max(1, batch_frames)
+
+        # Reaproveitamento da troca para rostos parados (modo tempo real, desativado com 0):
+        # recorte alinhado quase igual ao anterior -> cola a saída anterior com a matriz atual
+        self.swap_cache = None
+        if swap_cache_threshold > 0:
+            self.swap_cache = EnhancementCache(threshold=swap_cache_threshold, max_reuse=swap_cache_max_reuse)
+        if self.batch_swapper.dynamic:
+            print(f"[FaceSwapper] Inswapper com lote dinâmico: até {swap_batch_size} rostos por inferência.")
+        elif swap_batch_size > 1:
+            print("[FaceSwapper] Inswapper com lote fixo: um rosto por inferência "
+                  "(gere a variante com tools/optimize_models.py --batch 0).")
+
+        # Warm-up em segundo plano (alocação de memória, engines TensorRT) antes do primeiro quadro
+        self._warmup_thread = None
+        if warmup:
+            self._warmup_thread = threading.Thread(target=self._warmup, daemon=True)
+            self._warmup_thread.start()
+
+    def _warmup(self):
+        t0 = time.time()
+        try:
+            # Cada nível da pirâmide é um shape diferente para o provider
+            for size in self.detector.det_sizes:
+                dummy = np.zeros((size, size, 3), dtype=np.uint8)
+                self.app.det_model.detect(dummy, input_size=(size, size))
+            if 'recognition' in self.app.models:
+                self.app.models['recognition'].get_feat(np.zeros((112, 112, 3), dtype=np.uint8))
+            blob = np.zeros((1, 3, self.swapper.input_size[1], self.swapper.input_size[0]), dtype=np.float32)
+            latent = np.zeros((1, self.swapper.emap.shape[0]), dtype=np.float32)
+            feed = {self.swapper.input_names[0]: blob, self.swapper.input_names[1]: latent}
+            if isinstance(self.swapper.session, SessionPool):
+                self.swapper.session.warmup(feed)
+            else:
+                self.swapper.session.run(self.swapper.output_names, feed)
+            print(f"[FaceSwapper] Warm-up concluído em {time.time() - t0:.2f}s")
+        except Exception as e:
+            print(f"[FaceSwapper] Aviso: warm-up falhou: {e}")
+
+    def wait_ready(self):
+        if self._warmup_thread is not None:
+            self._warmup_thread.join()
+
+    @property
+    def enhancer(self):
+        return self._enhancer
+
+    def _load_enhancer(self):
+        try:
+            cache_options = {'cache_threshold': self.enhance_cache_threshold,
+                             'cache_max_reuse': self.enhance_cache_max_reuse,
+                             'pool_size': self.enhance_workers if self.session_pool else 1,
+                             'optimized_models': self.optimized_models}
+            if self.enhance_model is None and (self.enhance_tier or self.enhance_budget_ms):
+                enhancer = FaceEnhancer.select(tier=self.enhance_tier, budget_ms=self.enhance_budget_ms, **cache_options)
+            else:
+                enhancer = FaceEnhancer(restorer=self.enhance_model or DEFAULT_RESTORER, **cache_options)
+                enhancer.warmup()
+            self._enhancer = enhancer
+        except Exception as e:
+            print(f"[FaceSwapper] Aviso: Não foi possível carregar FaceEnhancer: {e}")
+            self._enhancer_failed = True
+            self.enhancement_enabled = False
+
+    def load_enhancer(self, block=True):
+        # Inicia (uma única vez) o carregamento do enhancer em segundo plano
+        with self._enhancer_lock:
+            if self._enhancer is not None or self._enhancer_failed:
+                return self._enhancer
+            if self._enhancer_thread is None:
+                print("[FaceSwapper] Carregando FaceEnhancer.")
+                self._enhancer_thread = threading.Thread(target=self._load_enhancer, daemon=True)
+                self._enhancer_thread.start()
+            thread = self._enhancer_thread
+        if block:
+            thread.join()
+        return self._enhancer
+
+    def set_enhancement(self, enabled, block=False):
+        # Com block=False a melhoria passa a valer assim que o modelo terminar de carregar
+        if enabled:
+            self.load_enhancer(block=block)
+            if self._enhancer_failed:
+                enabled = False
+        self.enhancement_enabled = enabled
+        return enabled
 
+    def face_from_image(self, img):
+        # Rosto de origem (com embedding) de uma imagem já decodificada
         faces = self.app.get(img)
         if len(faces) == 0:
             raise ValueError("Nenhum rosto detectado na imagem de origem")
 
         # Usa o maior rosto
-        self.source_face = sorted(faces, key=lambda x: (x.bbox[2] - x.bbox[0])*(x.bbox[3] - x.bbox[1]))[-1]
+        return sorted(faces, key=lambda x: (x.bbox[2] - x.bbox[0])*(x.bbox[3] - x.bbox[1]))[-1]
+
+    def set_source_image(self, source_img_path):
+        img = cv2.imread(source_img_path)
+        if img is None:
+            raise ValueError(f"Não foi possível ler a imagem de origem: {source_img_path}")
+
+        self._set_source(self.face_from_image(img))
         print("[FaceSwapper] Rosto de origem definido")
 
-    def _detect_faces_downscale(self, frame, scale=0.5):
-        small = cv2.resize(frame, (0,0), fx=scale, fy=scale)
-        faces_small = self.app.get(small)
-        faces = []
-        for f in faces_small:
-            f.bbox = (np.array(f.bbox) / scale).astype(np.float32)
-            if hasattr(f, 'kps') and f.kps is not None:
-                f.kps = (np.array(f.kps) / scale).astype(np.float32)
-            faces.append(f)
+    def set_source_by_id(self, identity_id):
+        """
+        Define o rosto de origem a partir do índice de identidades (sem detecção).
+
+        Args:
+            identity_id: Id da identidade no índice
+
+        Raises:
+            KeyError: Id desconhecido ou nenhum índice carregado
+        """
+        if self.identity_index is None:
+            raise KeyError("Nenhum índice de identidades carregado")
+        self._set_source(self.identity_index.face(identity_id), identity_id)
+        print(f"[FaceSwapper] Rosto de origem definido: {identity_id}")
+
+    def _set_source(self, face, identity_id=None):
+        self.source_face = face
+        self.source_id = identity_id
+        # Saídas trocadas/melhoradas em cache são do rosto anterior
+        if self.swap_cache is not None:
+            self.swap_cache.clear()
+        if self._enhancer is not None and self._enhancer.cache is not None:
+            self._enhancer.cache.clear()
+
+    def match_source(self, img, k=5, n_probe=0):
+        """
+        Identidades do índice mais parecidas com o maior rosto da imagem.
+
+        Returns:
+            list: (id, similaridade) em ordem decrescente
+        """
+        if self.identity_index is None:
+            raise KeyError("Nenhum índice de identidades carregado")
+        face = self.face_from_image(img)
+        return self.identity_index.search(face.normed_embedding, k=k, n_probe=n_probe)[0]
+
+    def detect_faces(self, frame, small=None, small_scale=1.0):
+        # small: versão já reduzida do quadro (ex.: gerada pelo leitor de vídeo)
+        # Só roda o detector: os rostos alvo não precisam de embedding
+        return self.detector.detect(frame, small=small, small_scale=small_scale)
+
+    def detect_still(self, img):
+        """
+        Detecta rostos em uma imagem estática, sem o estado do modo tempo real.
+
+        Imagens com lado maior que 2x o bloco usam o detector em blocos (rostos pequenos
+        em fotos grandes); as demais, uma passada no maior nível da pirâmide.
+
+        Args:
+            img: Imagem BGR em resolução original
+
+        Returns:
+            list: Rostos (Face com bbox, kps e det_score)
+        """
+        if max(img.shape[:2]) > 2 * self.tile_size:
+            with self._tiled_lock:
+                if self._tiled_detector is None:
+                    self._tiled_detector = TiledFaceDetector(self.app.det_model, tile_size=self.tile_size,
+                                                             overlap=self.tile_overlap,
+                                                             max_workers=self.max_workers)
+            return self._tiled_detector.detect(img)
+
+        # Detector sem estado, com uma segunda passada no maior nível se nada for achado
+        detector = AdaptiveFaceDetector(self.app.det_model, det_sizes=self.detector.det_sizes,
+                                        base_size=self.detector.base_size)
+        faces = detector.detect(img)
+        if not faces:
+            faces = detector._run(img, detector.det_sizes[-1])
         return faces
 
-    def _swap_worker(self, frame, faces, source_face):
-        res = frame.copy()
-        for face in faces:
-            try:
-                res = self.swapper.get(res, face, source_face, paste_back=True)
-            except Exception:
+    @property
+    def pipeline_depth(self):
+        # Máximo de quadros em processamento ao mesmo tempo nos dois estágios
+        return self.max_workers + self.enhance_queue_size
+
+    def swap_frames(self, frames, faces_list, source_faces, copy=True, cache=None):
+        """
+        Troca os rostos de vários quadros com inferências em lote.
+
+        Todos os rostos são alinhados a partir dos quadros originais, então rostos
+        sobrepostos não veem a troca um do outro (o INSwapper.get em sequência via).
+
+        Args:
+            frames: Quadros BGR
+            faces_list: Rostos alvo de cada quadro
+            source_faces: Rosto de origem de cada quadro
+            copy: Se False, os rostos são colados nos próprios quadros de entrada
+            cache: EnhancementCache para reaproveitar trocas de rostos parados
+
+        Returns:
+            list: Quadros com os rostos trocados
+        """
+        results = [frame.copy() for frame in frames] if copy else frames
+        jobs, targets = [], []
+        for index, (frame, faces, source_face) in enumerate(zip(frames, faces_list, source_faces)):
+            for face in faces:
+                if face.kps is not None:
+                    jobs.append((frame, face, source_face))
+                    targets.append((index, face))
+        if not jobs:
+            return results
+
+        try:
+            swapped = self.batch_swapper.swap(jobs, cache=cache)
+        except Exception:
+            if len(jobs) == 1:
+                return results
+            # Isola o rosto com problema em vez de perder o lote inteiro
+            swapped = []
+            for job in jobs:
+                try:
+                    swapped.extend(self.batch_swapper.swap([job], cache=cache))
+                except Exception:
+                    swapped.append(None)
+
+        for (index, face), item in zip(targets, swapped):
+            if item is None:
                 continue
-        
+            bgr_fake, M = item
+            # Reaproveitado pelo enhancer para o alinhamento do recorte
+            face.swap_matrix = M
+            paste_back(results[index], bgr_fake, M)
+        return results
+
+    def _swap_faces(self, frame, faces, source_face, cache=None):
+        return self.swap_frames([frame], [faces], [source_face], cache=cache)[0]
+
+    def _enhance_faces(self, res, faces):
         # Aplica melhoria se ativado e disponível
         if self.enhancer and self.enhancement_enabled:
             try:
                 res = self.enhancer.enhance(res, faces)
             except Exception as e:
                 print(f"[FaceSwapper] Erro no enhancer: {e}")
-                
         return res
 
-    def process_frame_async(self, frame, detect_interval=5):
+    def _enhance_stage(self, future, res, faces):
+        if future.cancelled():
+            return res
+        return self._enhance_faces(res, faces)
+
+    def _swap_worker(self, frame, faces, source_face):
+        # Troca e melhoria em sequência (processamento offline: nenhum quadro é pulado)
+        res = self._swap_faces(frame, faces, source_face)
+        return self._enhance_faces(res, faces)
+
+    def process_batch(self, frames, faces_list, source_faces, executor=None, copy=True):
+        # Troca em lote seguida da melhoria por quadro (em paralelo se houver executor)
+        results = self.swap_frames(frames, faces_list, source_faces, copy=copy)
+        if executor is None:
+            return [self._enhance_faces(res, faces) for res, faces in zip(results, faces_list)]
+        return list(executor.map(self._enhance_faces, results, faces_list))
+
+    def swap_stream(self, items, batch_frames=None):
+        """
+        Processa uma sequência de quadros em grupos (modo offline), preservando a ordem.
+
+        Args:
+            items: Iterável de (quadro, rostos); consumido sob demanda
+            batch_frames: Quadros por grupo (padrão: self.batch_frames)
+
+        Yields:
+            Quadro processado (o original se a troca falhar)
+        """
+        batch_frames = batch_frames or self.batch_frames
+        pending = []
+        for frame, faces in items:
+            # Cópia própria: leitores como o FFmpegVideoReader reaproveitam o buffer do quadro
+            pending.append((frame.copy(), faces))
+            if len(pending) >= batch_frames:
+                yield from self._flush_stream(pending)
+                pending = []
+        if pending:
+            yield from self._flush_stream(pending)
+
+    def _flush_stream(self, pending):
+        frames = [frame for frame, _ in pending]
+        faces_list = [faces for _, faces in pending]
+        try:
+            return self.process_batch(frames, faces_list, [self.source_face] * len(frames), copy=False)
+        except Exception as e:
+            print(f"[FaceSwapper] Erro na troca em lote: {e}")
+            return frames
+
+    def _swap_stage(self, future, frame, faces, source_face):
+        # Quadro descartado pelo agendador antes de começar: não faz a troca
+        if future.cancelled():
+            return None
+        # Quadro com o rosto de origem anterior (troca em andamento) não alimenta o cache
+        cache = self.swap_cache if source_face is self.source_face else None
+        return self._swap_faces(frame, faces, source_face, cache=cache)
+
+    def _on_swapped(self, swap_future, future, faces):
+        if future.cancelled():
+            return
+        try:
+            res = swap_future.result()
+        except Exception as e:
+            _resolve(future, exception=e)
+            return
+
+        if not (faces and self.enhancer and self.enhancement_enabled):
+            _resolve(future, res)
+            return
+
+        with self._enhance_pending_lock:
+            saturated = self._enhance_pending >= self.enhance_queue_size
+            if saturated:
+                self.pipeline_stats['enhance_skipped'] += 1
+            else:
+                self._enhance_pending += 1
+        if saturated:
+            # Enhancer ocupado: entrega o quadro só com a troca
+            _resolve(future, res)
+            return
+
+        enhance_future = self.enhance_executor.submit(self._enhance_stage, future, res, faces)
+        enhance_future.add_done_callback(lambda f: self._on_enhanced(f, future, res))
+
+    def _on_enhanced(self, enhance_future, future, res):
+        with self._enhance_pending_lock:
+            self._enhance_pending -= 1
+            self.pipeline_stats['enhanced'] += 1
+        if future.cancelled():
+            return
+        try:
+            _resolve(future, enhance_future.result())
+        except Exception:
+            _resolve(future, res)
+
+    def swap_reuse_rate(self):
+        # Fração dos rostos em que a troca anterior foi reaproveitada (sem inferência)
+        return self.swap_cache.hit_rate() if self.swap_cache is not None else 0.0
+
+    def enhance_skip_rate(self):
+        total = self.pipeline_stats['enhanced'] + self.pipeline_stats['enhance_skipped']
+        return self.pipeline_stats['enhance_skipped'] / total if total else 0.0
+
+    def process_frame_async(self, frame, detect_interval=None):
+        # detect_interval: quadros entre detecções (padrão: do perfil de execução ou 5)
+        detect_interval = detect_interval or self.detect_interval
         if self.source_face is None:
             # Retorna um future completo com o quadro original
             future = concurrent.futures.Future()
@@ -107,7 +562,7 @@ class FaceSwapper:
         # Detecta rostos periodicamente (Síncrono para manter o estado simples)
         if self.frame_count % detect_interval == 0:
             try:
-                faces = self._detect_faces_downscale(frame, scale=0.5)
+                faces = self.detect_faces(frame)
                 self.last_faces = faces
             except Exception as e:
                 print(f"Erro de detecção: {e}")
@@ -119,11 +574,11 @@ class FaceSwapper:
         frame_copy = frame.copy()
         faces_copy = list(self.last_faces) 
         
-        future = self.executor.submit(self._swap_worker, frame_copy, faces_copy, self.source_face)
+        # O future retornado só é concluído após o estágio de melhoria (ou quando ele é pulado)
+        future = concurrent.futures.Future()
+        swap_future = self.executor.submit(self._swap_stage, future, frame_copy, faces_copy, self.source_face)
+        swap_future.add_done_callback(lambda f: self._on_swapped(f, future, faces_copy))
         return future
 
     def toggle_enhancer(self):
-        if self.enhancer:
-            self.enhancement_enabled = not self.enhancement_enabled
-            return self.enhancement_enabled
-        return False
\ No newline at end of file
+        return self.set_enhancement(not self.enhancement_enabled)
\ No newline at end of file
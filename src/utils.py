@@ -30,6 +30,23 @@ def find_tensorrt_lib_path():
     return trt_lib if trt_lib and os.path.exists(trt_lib) else None
 
 
+def _find_package_dir(name):
+    """
+    Retorna o diretório de um pacote instalado sem importá-lo.
+    
+    Returns:
+        str or None: Caminho do pacote ou None se não instalado
+    """
+    import importlib.util
+    try:
+        spec = importlib.util.find_spec(name)
+    except (ImportError, ValueError):
+        return None
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    return list(spec.submodule_search_locations)[0]
+
+
 def setup_dll_directories():
     """
     Adiciona diretórios DLL necessários ao caminho de busca para Windows.
@@ -42,17 +59,12 @@ def setup_dll_directories():
     
     try:
         # Adiciona diretório capi do ONNX Runtime
-        try:
-            import insightface
-            ort_capi = os.path.join(
-                os.path.dirname(os.path.dirname(insightface.__file__)), 
-                'onnxruntime', 
-                'capi'
-            )
+        # (localizado via find_spec, sem importar pacotes pesados na inicialização)
+        ort_dir = _find_package_dir('onnxruntime')
+        if ort_dir:
+            ort_capi = os.path.join(ort_dir, 'capi')
             if os.path.exists(ort_capi):
                 os.add_dll_directory(ort_capi)
-        except ImportError:
-            pass
         
         # Adiciona diretório lib do TensorRT
         trt_lib = find_tensorrt_lib_path()
@@ -60,13 +72,11 @@ def setup_dll_directories():
             os.add_dll_directory(trt_lib)
         
         # Adiciona diretório lib do PyTorch (para zlibwapi.dll e outras dependências)
-        try:
-            import torch
-            torch_lib = os.path.join(os.path.dirname(torch.__file__), 'lib')
+        torch_dir = _find_package_dir('torch')
+        if torch_dir:
+            torch_lib = os.path.join(torch_dir, 'lib')
             if os.path.exists(torch_lib):
                 os.add_dll_directory(torch_lib)
-        except ImportError:
-            pass
         
         print("Diretórios DLL adicionados ao caminho de busca.")
     except Exception as e:
@@ -93,3 +103,160 @@ def get_default_providers():
         }),
         'CPUExecutionProvider'
     ]
+
+
+# Manifesto das variantes otimizadas (gerado por tools/optimize_models.py)
+MODEL_MANIFEST = os.path.join('models', 'manifest.json')
+
+
+def _provider_name(provider):
+    return provider[0] if isinstance(provider, tuple) else provider
+
+
+def load_model_manifest(manifest_path=MODEL_MANIFEST):
+    """
+    Lê o manifesto de modelos otimizados.
+    
+    Returns:
+        dict: Conteúdo do manifesto ({'variants': []} se ausente ou inválido)
+    """
+    import json
+    if not os.path.exists(manifest_path):
+        return {'variants': []}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Aviso: Manifesto de modelos inválido ({manifest_path}): {e}")
+        return {'variants': []}
+    manifest.setdefault('variants', [])
+    return manifest
+
+
+def _serves_shapes(variant, input_shapes):
+    # Dimensões (exceto o lote) fixadas na variante precisam atender as entradas do chamador:
+    # as informadas em input_shapes ou, sem elas, as que eram dinâmicas no modelo original
+    source_inputs = variant.get('source_inputs') or {}
+    for name, dims in (variant.get('inputs') or {}).items():
+        wanted = (input_shapes or {}).get(name)
+        for i, dim in enumerate(dims[1:], start=1):
+            if dim is None:
+                continue
+            if wanted is not None:
+                if i < len(wanted) and wanted[i] is not None and wanted[i] != dim:
+                    return False
+            elif name in source_inputs and source_inputs[name][i] is None:
+                return False
+    return True
+
+
+def resolve_model_variant(model_path, providers=None, batch=1, manifest_path=MODEL_MANIFEST, input_shapes=None):
+    """
+    Retorna a variante otimizada de um modelo registrada no manifesto, se houver uma válida.
+    
+    Variantes com alvo 'cpu' (fusões do ORT específicas do CPU EP) só são usadas quando
+    nenhum provider acelerado da lista está disponível. Variantes cujo modelo original
+    mudou desde a otimização, ou geradas por outra versão do ONNX Runtime, são ignoradas.
+    
+    Args:
+        model_path: Caminho do modelo original
+        providers: Providers da sessão que será criada
+        batch: Tamanho de lote desejado (None = variante com lote dinâmico)
+        manifest_path: Caminho do manifesto
+        input_shapes: Shapes que o chamador vai usar por entrada (None nas dimensões livres).
+            Sem eles, variantes que fixaram dimensões dinâmicas do original (--shape) são ignoradas.
+        
+    Returns:
+        str: Caminho da variante otimizada ou o próprio model_path
+    """
+    manifest = load_model_manifest(manifest_path)
+    if not manifest['variants'] or not os.path.exists(model_path):
+        return model_path
+
+    import onnxruntime
+    available = set(onnxruntime.get_available_providers())
+    accelerated = any(_provider_name(p) != 'CPUExecutionProvider' and _provider_name(p) in available
+                      for p in (providers or ['CPUExecutionProvider']))
+
+    source = os.path.realpath(model_path)
+    stat = os.stat(model_path)
+    candidates = []
+    for variant in manifest['variants']:
+        if os.path.realpath(variant['source']) != source or not os.path.exists(variant['path']):
+            continue
+        if variant.get('source_size') != stat.st_size or variant.get('source_mtime_ns') != stat.st_mtime_ns:
+            print(f"[Modelos] Variante {variant['path']} ignorada: modelo original alterado. "
+                  f"Execute tools/optimize_models.py novamente.")
+            continue
+        if variant.get('target') == 'cpu':
+            if accelerated or variant.get('ort_version') != onnxruntime.__version__:
+                continue
+        if not _serves_shapes(variant, input_shapes):
+            continue
+        # Lote fixo igual ao pedido tem prioridade; lote dinâmico atende qualquer pedido
+        if variant.get('batch') == batch:
+            candidates.append((0, variant))
+        elif variant.get('batch') is None and all(not dims or dims[0] is None
+                                                  for dims in (variant.get('inputs') or {}).values()):
+            # Lote dinâmico de fato (manifestos antigos podiam registrar lote 1 fixo como dinâmico)
+            candidates.append((1, variant))
+    if not candidates:
+        return model_path
+
+    # Entre empates, fusões mais agressivas (cpu) antes das portáveis
+    candidates.sort(key=lambda c: (c[0], c[1].get('target') != 'cpu'))
+    path = candidates[0][1]['path']
+    print(f"[Modelos] Usando variante otimizada {path} para {model_path}")
+    return path
+
+
+# Perfil de execução da máquina (gerado por tools/probe_hardware.py)
+RUNTIME_PROFILE = os.path.join('models', 'runtime_profile.json')
+
+
+def cpu_model_name():
+    # Nome do processador (no Linux o platform.processor() costuma ser só a arquitetura)
+    import platform
+    if os.path.exists('/proc/cpuinfo'):
+        with open('/proc/cpuinfo', 'r', encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                if line.lower().startswith(('model name', 'hardware')):
+                    return line.split(':', 1)[1].strip()
+    return platform.processor() or platform.machine()
+
+
+def host_fingerprint():
+    """
+    Identifica a máquina para a qual um perfil de execução foi gerado.
+    
+    Returns:
+        dict: Arquitetura, nome do processador e número de núcleos lógicos
+    """
+    import platform
+    return {'machine': platform.machine(), 'cpu': cpu_model_name(), 'logical_cores': os.cpu_count()}
+
+
+def load_runtime_profile(profile_path=RUNTIME_PROFILE):
+    """
+    Lê as configurações do perfil de execução, se ele foi gerado nesta máquina.
+    
+    Args:
+        profile_path: Caminho do perfil
+        
+    Returns:
+        dict: Configurações ajustadas ({} se ausente, inválido ou de outra máquina)
+    """
+    import json
+    if not profile_path or not os.path.exists(profile_path):
+        return {}
+    try:
+        with open(profile_path, 'r', encoding='utf-8') as f:
+            profile = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Aviso: Perfil de execução inválido ({profile_path}): {e}")
+        return {}
+    if profile.get('fingerprint') != host_fingerprint():
+        print(f"[Perfil] {profile_path} foi gerado para outra máquina; ignorado. "
+              f"Execute tools/probe_hardware.py novamente.")
+        return {}
+    return profile.get('settings', {})
@@ -0,0 +1,420 @@
+"""
+Processamento offline de vídeos em blocos (chunks) retomáveis.
+
+O vídeo de entrada é dividido em segmentos alinhados a keyframes (sem re-encode),
+cada segmento é processado de forma independente e marcado como concluído no
+diretório do job. Vários processos (ou máquinas que compartilham o mesmo sistema
+de arquivos) podem trabalhar no mesmo job ao mesmo tempo. No final os segmentos
+processados são concatenados sem perdas com ffmpeg e o áudio original é
+reaplicado.
+"""
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import time
+
+import cv2
+
+
+def _rotation(stream):
+    # Rotação do stream em graus: side data 'Display Matrix' (ffmpeg >= 5) ou a tag 'rotate'
+    for side_data in stream.get('side_data_list', []):
+        if 'rotation' in side_data:
+            return int(float(side_data['rotation'])) % 360
+    rotate = stream.get('tags', {}).get('rotate', '0')
+    return int(float(rotate)) % 360 if rotate.lstrip('-').replace('.', '', 1).isdigit() else 0
+
+
+def probe_video(path):
+    """
+    Lê metadados do primeiro stream de vídeo usando ffprobe.
+
+    O ffmpeg aplica a rotação do stream (vídeos de celular) ao decodificar; com rotação
+    de 90/270 graus width e height já vêm trocados para o tamanho dos quadros decodificados.
+
+    Returns:
+        dict: width, height, fps, frames (0 se desconhecido), duration em segundos e rotation
+    """
+    result = subprocess.run([
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-show_streams', '-show_entries', 'format=duration',
+        '-of', 'json', path
+    ], check=True, capture_output=True)
+    info = json.loads(result.stdout)
+    stream = info['streams'][0]
+    fps = 0.0
+    # avg_frame_rate é mais fiel para GIFs e vídeos VFR; r_frame_rate como fallback
+    for key in ('avg_frame_rate', 'r_frame_rate'):
+        num, den = stream.get(key, '0/1').split('/')
+        if float(den) and float(num):
+            fps = float(num) / float(den)
+            break
+    nb_frames = stream.get('nb_frames', '0')
+    duration = float(info.get('format', {}).get('duration', 0) or 0)
+    rotation = _rotation(stream)
+    width, height = int(stream['width']), int(stream['height'])
+    if rotation in (90, 270):
+        width, height = height, width
+    return {
+        'width': width,
+        'height': height,
+        'fps': fps,
+        'frames': int(nb_frames) if str(nb_frames).isdigit() else int(duration * fps),
+        'duration': duration,
+        'rotation': rotation,
+    }
+
+
+def default_job_dir(video_path, root="outputs/jobs"):
+    """
+    Diretório de job determinístico para um vídeo, para que uma nova execução
+    com o mesmo arquivo retome de onde parou.
+    """
+    abs_path = os.path.abspath(video_path)
+    stat = os.stat(abs_path)
+    key = f"{abs_path}|{stat.st_size}|{int(stat.st_mtime)}"
+    digest = hashlib.md5(key.encode('utf-8')).hexdigest()[:10]
+    name = os.path.splitext(os.path.basename(video_path))[0]
+    return os.path.join(root, f"{name}_{digest}")
+
+
+def swap_video_file(swapper, in_path, out_path, fps=None, on_frame=None):
+    """
+    Processa um arquivo de vídeo quadro a quadro (sem áudio) com o FaceSwapper.
+
+    Args:
+        swapper: Instância de FaceSwapper com rosto de origem definido.
+        in_path: Vídeo de entrada.
+        out_path: Arquivo mp4 de saída.
+        fps: FPS de saída. Se None, usa o FPS do arquivo de entrada.
+        on_frame: Callback opcional chamado a cada quadro com o número de quadros processados.
+
+    Returns:
+        int: Número de quadros processados.
+    """
+    cap = cv2.VideoCapture(in_path)
+    if not cap.isOpened():
+        raise IOError(f"Não foi possível abrir o vídeo: {in_path}")
+    if fps is None:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    writer = cv2.VideoWriter(out_path, fourcc, fps, (width, height))
+
+    def read_frames():
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                return
+            yield frame, swapper.detect_faces(frame)
+
+    frame_count = 0
+    try:
+        # Quadros agrupados: uma inferência do inswapper para os rostos de vários quadros
+        for res in swapper.swap_stream(read_frames()):
+            writer.write(res)
+            frame_count += 1
+            if on_frame:
+                on_frame(frame_count)
+    finally:
+        cap.release()
+        writer.release()
+    return frame_count
+
+
+class ChunkedVideoJob:
+    """
+    Job de vídeo dividido em segmentos com checkpoint em disco.
+
+    Estrutura do diretório do job:
+        manifest.json   metadados do vídeo e lista de segmentos
+        segments/       segmentos originais (cópia sem re-encode, alinhados a keyframes)
+        locks/          um arquivo por segmento em processamento (host:pid)
+        done/           segmentos processados e finalizados
+    """
+
+    def __init__(self, video_path, job_dir=None, chunk_seconds=30, stale_after=300):
+        self.video_path = video_path
+        self.job_dir = job_dir or default_job_dir(video_path)
+        self.chunk_seconds = chunk_seconds
+        # Tempo sem heartbeat após o qual um lock é considerado abandonado
+        self.stale_after = stale_after
+        self.manifest = None
+
+        self.segments_dir = os.path.join(self.job_dir, 'segments')
+        self.locks_dir = os.path.join(self.job_dir, 'locks')
+        self.done_dir = os.path.join(self.job_dir, 'done')
+        self.manifest_path = os.path.join(self.job_dir, 'manifest.json')
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    @property
+    def fps(self):
+        return self.manifest['fps']
+
+    @property
+    def segments(self):
+        return self.manifest['segments']
+
+    def prepare(self, meta=None, timeout=600, strict=()):
+        """
+        Divide o vídeo em segmentos (apenas o primeiro processo faz isso) ou
+        carrega o manifest existente para retomar o job.
+
+        Args:
+            meta: Metadados gravados no manifest e comparados ao retomar.
+            strict: Chaves de meta que precisam ser iguais às do job original
+                (ex.: a identidade de origem); diferença gera ValueError.
+        """
+        for d in (self.job_dir, self.segments_dir, self.locks_dir, self.done_dir):
+            os.makedirs(d, exist_ok=True)
+
+        split_lock = os.path.join(self.job_dir, 'split.lock')
+        deadline = time.time() + timeout
+        while not os.path.exists(self.manifest_path):
+            if self._try_lock(split_lock):
+                try:
+                    if not os.path.exists(self.manifest_path):
+                        self._split(meta or {})
+                finally:
+                    os.remove(split_lock)
+                break
+            if time.time() > deadline:
+                raise TimeoutError(f"Tempo esgotado aguardando divisão do vídeo em {self.job_dir}")
+            # Outro processo está dividindo o vídeo
+            time.sleep(1.0)
+
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+
+        for key, value in (meta or {}).items():
+            if self.manifest.get('meta', {}).get(key) != value:
+                if key in strict:
+                    raise ValueError(f"'{key}' difere do job original em {self.job_dir} "
+                                     f"({self.manifest.get('meta', {}).get(key)} != {value}); "
+                                     f"segmentos concluídos misturariam identidades. Use outro --job-dir.")
+                print(f"[ChunkedVideoJob] Aviso: '{key}' difere do job original "
+                      f"({self.manifest.get('meta', {}).get(key)} != {value})")
+
+        done = len(self.segments) - len(self.pending())
+        print(f"[ChunkedVideoJob] Job em {self.job_dir}: {done}/{len(self.segments)} segmentos concluídos.")
+        return self
+
+    def _split(self, meta):
+        print(f"[ChunkedVideoJob] Dividindo vídeo em segmentos de ~{self.chunk_seconds}s.")
+        info = probe_video(self.video_path)
+        # -c copy corta apenas em keyframes, então os segmentos podem ser
+        # decodificados de forma independente
+        subprocess.run([
+            'ffmpeg', '-y', '-i', self.video_path,
+            '-map', '0:v:0', '-c', 'copy',
+            '-f', 'segment', '-segment_time', str(self.chunk_seconds),
+            '-reset_timestamps', '1',
+            os.path.join(self.segments_dir, 'seg_%05d.mkv')
+        ], check=True, capture_output=True)
+
+        segments = sorted(f for f in os.listdir(self.segments_dir) if f.endswith('.mkv'))
+        if not segments:
+            raise RuntimeError("ffmpeg não gerou nenhum segmento")
+
+        manifest = {
+            'video': os.path.abspath(self.video_path),
+            'fps': info['fps'],
+            'width': info['width'],
+            'height': info['height'],
+            'chunk_seconds': self.chunk_seconds,
+            'segments': segments,
+            'meta': meta,
+        }
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+        print(f"[ChunkedVideoJob] {len(segments)} segmentos criados.")
+
+    def _try_lock(self, path):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return self._take_over(path)
+        with os.fdopen(fd, 'w') as f:
+            f.write(self.owner)
+        # Confirma a posse: um worker que viu o lock anterior como abandonado pode ter mexido nele
+        return self._owns(path)
+
+    def _take_over(self, path):
+        # Assume locks abandonados (processo morto, máquina desligada). O lock é renomeado para um
+        # nome único antes de ser removido: só um worker consegue o rename, e o arquivo movido é
+        # conferido de novo, pois entre a verificação e o rename outro worker pode ter criado um lock novo.
+        try:
+            if not self._is_stale(path):
+                return False
+            moved = f"{path}.{self.owner.replace(':', '_')}.{time.time_ns()}.stale"
+            os.rename(path, moved)
+        except FileNotFoundError:
+            # Liberado nesse meio tempo
+            return self._try_lock(path)
+        try:
+            if not self._is_stale(moved):
+                # Lock novo de outro worker: devolve (link falha se já existe outro lock no lugar)
+                try:
+                    os.link(moved, path)
+                except OSError:
+                    pass
+                return False
+        finally:
+            os.remove(moved)
+        return self._try_lock(path)
+
+    def _is_stale(self, path):
+        return time.time() - os.path.getmtime(path) > self.stale_after or not self._owner_alive(path)
+
+    def _owns(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read().strip() == self.owner
+        except (FileNotFoundError, PermissionError, UnicodeDecodeError):
+            return False
+
+    def _owner_alive(self, path):
+        # Dono do lock nesta máquina: verifica o pid. Outras máquinas dependem do stale_after.
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                host, _, pid = f.read().strip().rpartition(':')
+        except (PermissionError, UnicodeDecodeError):
+            return True
+        if host != socket.gethostname() or not pid.isdigit() or os.name == 'nt':
+            # No Windows os.kill(pid, 0) encerraria o processo
+            return True
+        if int(pid) == os.getpid():
+            return True
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def _done_path(self, index):
+        return os.path.join(self.done_dir, os.path.splitext(self.segments[index])[0] + '.mp4')
+
+    def _lock_path(self, index):
+        return os.path.join(self.locks_dir, os.path.splitext(self.segments[index])[0] + '.lock')
+
+    def pending(self):
+        return [i for i in range(len(self.segments)) if not os.path.exists(self._done_path(i))]
+
+    def is_complete(self):
+        return not self.pending()
+
+    def claim_next(self):
+        """Reserva o próximo segmento pendente. Retorna o índice ou None."""
+        for index in self.pending():
+            if self._try_lock(self._lock_path(index)):
+                # Pode ter sido concluído entre a listagem e o lock
+                if os.path.exists(self._done_path(index)):
+                    self.release(index)
+                    continue
+                return index
+        return None
+
+    def heartbeat(self, index):
+        try:
+            os.utime(self._lock_path(index))
+        except FileNotFoundError:
+            pass
+
+    def release(self, index):
+        # Só remove o próprio lock (após um takeover, o arquivo pode ser de outro worker)
+        if not self._owns(self._lock_path(index)):
+            return
+        try:
+            os.remove(self._lock_path(index))
+        except FileNotFoundError:
+            pass
+
+    def complete(self, index, part_path):
+        # Rename atômico: um segmento em done/ está sempre completo
+        os.replace(part_path, self._done_path(index))
+        self.release(index)
+
+    def run(self, process_chunk):
+        """
+        Processa segmentos pendentes até não restar nenhum livre.
+
+        Args:
+            process_chunk: Função (in_path, out_path, heartbeat) que processa um segmento.
+                heartbeat() deve ser chamado periodicamente para manter o lock.
+
+        Returns:
+            int: Número de segmentos processados por este processo.
+        """
+        processed = 0
+        while True:
+            index = self.claim_next()
+            if index is None:
+                return processed
+
+            in_path = os.path.join(self.segments_dir, self.segments[index])
+            # Arquivo parcial por dono: dois workers no mesmo segmento (lock assumido) não escrevem no mesmo arquivo
+            part_path = f"{self._done_path(index)}.{self.owner.replace(':', '_')}.part.mp4"
+            print(f"[ChunkedVideoJob] Processando segmento {index + 1}/{len(self.segments)}")
+            try:
+                process_chunk(in_path, part_path, lambda: self.heartbeat(index))
+                self.complete(index, part_path)
+                processed += 1
+            except BaseException:
+                # Inclui KeyboardInterrupt: libera o segmento para outro worker/execução
+                self.release(index)
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                raise
+
+    def wait(self, process_chunk=None, poll=2.0):
+        """
+        Aguarda segmentos sendo processados por outros workers.
+
+        Args:
+            process_chunk: Mesma função de run(). Se informada, segmentos cujo lock ficou
+                abandonado (worker morto, execução anterior interrompida) são assumidos
+                e processados aqui em vez de esperar para sempre.
+        """
+        while not self.is_complete():
+            if process_chunk is not None and self.run(process_chunk):
+                continue
+            time.sleep(poll)
+
+    def finalize(self, out_path, audio_source=None):
+        """
+        Concatena os segmentos processados sem re-encode e adiciona o áudio original.
+        Apenas um processo executa a finalização.
+        """
+        if not self.is_complete():
+            raise RuntimeError("Job ainda possui segmentos pendentes")
+
+        finalize_lock = os.path.join(self.job_dir, 'finalize.lock')
+        if not self._try_lock(finalize_lock):
+            print("[ChunkedVideoJob] Finalização já em andamento por outro processo.")
+            return None
+
+        try:
+            list_path = os.path.join(self.job_dir, 'concat.txt')
+            with open(list_path, 'w', encoding='utf-8') as f:
+                for index in range(len(self.segments)):
+                    path = os.path.abspath(self._done_path(index)).replace('\\', '/')
+                    f.write(f"file '{path}'\n")
+
+            audio_source = audio_source or self.video_path
+            cmd = ['ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', list_path,
+                   '-i', audio_source,
+                   '-map', '0:v:0', '-map', '1:a:0?',
+                   '-c:v', 'copy', '-c:a', 'aac', out_path]
+            subprocess.run(cmd, check=True, capture_output=True)
+            print(f"[ChunkedVideoJob] Vídeo final salvo em: {out_path}")
+            return out_path
+        finally:
+            os.remove(finalize_lock)
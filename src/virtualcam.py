@@ -0,0 +1,204 @@
+"""
+Saída para câmera virtual em thread própria.
+
+O loop principal apenas entrega o quadro mais recente (submit); a conversão de
+formato, o envio e o ritmo (sleep_until_next_frame) acontecem em outra thread,
+sem bloquear exibição e teclado. A resolução é a do quadro real da webcam,
+então não há redimensionamento por quadro. Se o consumidor for mais lento que
+o pipeline, quadros intermediários são descartados; se for mais rápido, o
+último quadro é repetido para manter o ritmo.
+
+Backends: os do pyvirtualcam ('obs', 'v4l2loopback', 'unitycapture' ou 'auto'
+para o primeiro disponível) e 'null', que descarta os quadros no ritmo pedido
+(testes e medições sem driver instalado).
+"""
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# Formatos aceitos em --vcam-format (nome do pyvirtualcam.PixelFormat)
+PIXEL_FORMATS = ('bgr', 'rgb', 'i420', 'nv12', 'yuyv', 'uyvy')
+VCAM_BACKENDS = ('auto', 'obs', 'v4l2loopback', 'unitycapture', 'null')
+
+
+class NullCamera:
+    # Mesma interface usada do pyvirtualcam.Camera, sem dispositivo
+    def __init__(self, width, height, fps):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.device = 'null'
+        self.native_fmt = None
+        self.frames_sent = 0
+        self._next_frame_t = None
+
+    def send(self, frame):
+        self.frames_sent += 1
+
+    def sleep_until_next_frame(self):
+        now = time.perf_counter()
+        if self._next_frame_t is None:
+            self._next_frame_t = now
+        self._next_frame_t += 1.0 / self.fps
+        if self._next_frame_t > now:
+            time.sleep(self._next_frame_t - now)
+        else:
+            self._next_frame_t = now
+
+    def close(self):
+        pass
+
+
+def frame_converter(fmt, width, height):
+    """
+    Cria a função de conversão BGR -> formato da câmera virtual, com buffer de
+    saída pré-alocado e separado do buffer de entrada (o envio acontece fora do lock).
+
+    Returns:
+        callable: convert(frame_bgr) -> array no formato pedido
+    """
+    if fmt == 'bgr':
+        out = np.empty((height, width, 3), dtype=np.uint8)
+
+        def copy(frame):
+            np.copyto(out, frame)
+            return out
+        return copy
+    if fmt == 'rgb':
+        out = np.empty((height, width, 3), dtype=np.uint8)
+        return lambda frame: cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=out)
+    if fmt in ('yuyv', 'uyvy'):
+        code = cv2.COLOR_BGR2YUV_YUY2 if fmt == 'yuyv' else cv2.COLOR_BGR2YUV_UYVY
+        out = np.empty((height, width, 2), dtype=np.uint8)
+        return lambda frame: cv2.cvtColor(frame, code, dst=out)
+
+    i420 = np.empty((height * 3 // 2, width), dtype=np.uint8)
+    if fmt == 'i420':
+        return lambda frame: cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420, dst=i420)
+    if fmt == 'nv12':
+        nv12 = np.empty_like(i420)
+        chroma = width * height // 4
+
+        def convert(frame):
+            cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420, dst=i420)
+            nv12[:height] = i420[:height]
+            # Planos U e V do I420 intercalados no plano UV do NV12
+            planes = i420[height:].reshape(-1)
+            uv = nv12[height:].reshape(-1, 2)
+            uv[:, 0] = planes[:chroma]
+            uv[:, 1] = planes[chroma:]
+            return nv12
+        return convert
+    raise ValueError(f"Formato de câmera virtual desconhecido: {fmt}")
+
+
+class VirtualCamOutput:
+    def __init__(self, width, height, fps=30, fmt='auto', backend='auto', device=None):
+        """
+        Args:
+            width, height: Resolução dos quadros entregues (normalmente a da webcam).
+            fps: Ritmo de envio para a câmera virtual.
+            fmt: Formato de pixel enviado ('auto' usa o formato nativo do backend, se conhecido).
+            backend: Backend do pyvirtualcam, 'auto' ou 'null'.
+            device: Dispositivo específico (ex.: /dev/video10 no v4l2loopback).
+        """
+        # Formatos YUV 4:2:0 exigem dimensões pares; o quadro é cortado em 1 pixel se preciso
+        self.width = width - width % 2
+        self.height = height - height % 2
+        self.fps = fps
+        self.backend = backend
+        self.device = device
+        self.fmt = fmt
+
+        self.camera = None
+        self._convert = None
+        self._frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        self._back = np.empty_like(self._frame)
+        self._has_frame = False
+        self._new_frame = False
+        self._lock = threading.Lock()
+        self.stopped = False
+        self.thread = None
+        self.stats = {'submitted': 0, 'sent': 0, 'dropped': 0, 'repeated': 0}
+
+    def _open_camera(self, fmt):
+        if self.backend == 'null':
+            return NullCamera(self.width, self.height, self.fps)
+        import pyvirtualcam
+        kwargs = {'fmt': getattr(pyvirtualcam.PixelFormat, fmt.upper()), 'device': self.device}
+        if self.backend != 'auto':
+            kwargs['backend'] = self.backend
+        return pyvirtualcam.Camera(width=self.width, height=self.height, fps=self.fps, **kwargs)
+
+    def open(self):
+        fmt = 'bgr' if self.fmt == 'auto' else self.fmt
+        self.camera = self._open_camera(fmt)
+        if self.fmt == 'auto':
+            # Envia no formato nativo do backend: evita a conversão feita pelo driver
+            native = self.camera.native_fmt
+            native = native.name.lower() if native is not None else None
+            if native in PIXEL_FORMATS and native != fmt:
+                self.camera.close()
+                fmt = native
+                self.camera = self._open_camera(fmt)
+        self.fmt = fmt
+        self._convert = frame_converter(fmt, self.width, self.height)
+        print(f"[VirtualCam] Câmera virtual iniciada: {self.camera.device} "
+              f"({self.width}x{self.height} @ {self.fps} FPS, {fmt.upper()})")
+        return self
+
+    def start(self):
+        if self.camera is None:
+            self.open()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.update, daemon=True)
+            self.thread.start()
+        return self
+
+    def submit(self, frame):
+        # Chamado pelo loop principal: copia o quadro (a interface é desenhada depois no mesmo array)
+        if frame.shape[0] != self.height or frame.shape[1] != self.width:
+            if 0 <= frame.shape[0] - self.height <= 1 and 0 <= frame.shape[1] - self.width <= 1:
+                frame = frame[:self.height, :self.width]
+            else:
+                frame = cv2.resize(frame, (self.width, self.height))
+        np.copyto(self._back, frame)
+        with self._lock:
+            self._frame, self._back = self._back, self._frame
+            if self._new_frame:
+                self.stats['dropped'] += 1
+            self._new_frame = True
+            self._has_frame = True
+            self.stats['submitted'] += 1
+
+    def update(self):
+        while not self.stopped:
+            with self._lock:
+                if not self._has_frame:
+                    frame = None
+                else:
+                    if not self._new_frame:
+                        self.stats['repeated'] += 1
+                    self._new_frame = False
+                    # Converte dentro do lock: submit() não reescreve este buffer enquanto isso
+                    frame = self._convert(self._frame)
+            if frame is None:
+                time.sleep(0.01)
+                continue
+            try:
+                self.camera.send(frame)
+                self.stats['sent'] += 1
+                self.camera.sleep_until_next_frame()
+            except Exception as e:
+                print(f"[VirtualCam] Erro ao enviar quadro: {e}")
+                time.sleep(0.1)
+
+    def stop(self):
+        self.stopped = True
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        if self.camera is not None:
+            self.camera.close()
+            self.camera = None
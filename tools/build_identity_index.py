@@ -0,0 +1,148 @@
+import argparse
+import concurrent.futures
+import glob
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+# Adiciona raiz do projeto ao caminho para importar de src
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.utils import setup_dll_directories, get_default_providers
+
+# Configura diretórios DLL para Windows
+setup_dll_directories()
+
+from insightface.app import FaceAnalysis
+from insightface.utils import face_align
+from src.identity_index import IdentityIndex, DTYPES
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def list_images(root):
+    # Imagens da pasta e subpastas; o id é o caminho relativo sem extensão ('/' como separador)
+    images = {}
+    for path in sorted(glob.glob(os.path.join(root, '**', '*'), recursive=True)):
+        if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+            identity = os.path.splitext(os.path.relpath(path, root))[0].replace(os.sep, '/')
+            images[identity] = path
+    return images
+
+
+def aligned_crop(app, path):
+    """
+    Lê a imagem e recorta (alinhado, 112x112) o maior rosto para o modelo de reconhecimento.
+
+    Returns:
+        np.ndarray | None: Recorte BGR ou None se a imagem não tem rosto
+    """
+    img = cv2.imread(path)
+    if img is None:
+        return None
+    bboxes, kpss = app.det_model.detect(img, max_num=0, metric='default')
+    if bboxes.shape[0] == 0 or kpss is None:
+        return None
+    areas = (bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])
+    return face_align.norm_crop(img, landmark=kpss[int(np.argmax(areas))], image_size=112)
+
+
+def embed_images(app, index, items, batch, workers):
+    """
+    Extrai os embeddings em lotes (uma inferência do reconhecimento por lote) e os adiciona ao índice.
+
+    Args:
+        items: Lista de (id, caminho)
+
+    Returns:
+        tuple: (adicionadas, sem rosto)
+    """
+    recognition = app.models['recognition']
+    added = skipped = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(items), batch):
+            chunk = items[start:start + batch]
+            crops = list(pool.map(lambda item: aligned_crop(app, item[1]), chunk))
+            found = [(item, crop) for item, crop in zip(chunk, crops) if crop is not None]
+            skipped += len(chunk) - len(found)
+            if not found:
+                continue
+            embeddings = recognition.get_feat([crop for _, crop in found])
+            index.add([identity for (identity, _), _ in found], embeddings,
+                      [{'image': path, 'mtime': os.path.getmtime(path)} for (_, path), _ in found])
+            # Salvo a cada lote: uma interrupção não perde o que já foi extraído
+            index.save()
+            added += len(found)
+            print(f"  {min(start + batch, len(items))}/{len(items)} imagens processadas")
+    return added, skipped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cria/atualiza o índice de embeddings de uma biblioteca de identidades")
+    parser.add_argument("--images", help="Pasta da biblioteca (subpastas incluídas); o id é o caminho relativo sem extensão")
+    parser.add_argument("--index", default="models/identities", help="Pasta do índice")
+    parser.add_argument("--dtype", choices=sorted(DTYPES), default="float32", help="Tipo da matriz de embeddings (apenas na criação)")
+    parser.add_argument("--batch", type=int, default=64, help="Rostos por inferência do modelo de reconhecimento")
+    parser.add_argument("--workers", type=int, default=4, help="Threads de leitura e detecção")
+    parser.add_argument("--refresh", action="store_true", help="Extrai de novo todas as imagens (padrão: só novas ou alteradas)")
+    parser.add_argument("--prune", action="store_true", help="Remove do índice as identidades cuja imagem não existe mais em --images")
+    parser.add_argument("--remove", action="append", help="Remove uma identidade pelo id (pode repetir)")
+    parser.add_argument("--compact", action="store_true", help="Regrava a matriz sem as linhas removidas")
+    parser.add_argument("--ivf-lists", type=int, default=0, help="Treina o índice grosso com N listas (-1 = ~raiz do total, 0 = não treina)")
+    parser.add_argument("--query", help="Imagem para consultar as identidades mais parecidas")
+    parser.add_argument("--top", type=int, default=5, help="Resultados da consulta")
+    parser.add_argument("--n-probe", type=int, default=0, help="Listas do índice grosso comparadas na consulta (0 = busca exata)")
+    args = parser.parse_args()
+
+    index = IdentityIndex(args.index, dtype=args.dtype)
+    print(f"Índice {args.index}: {len(index)} identidades ({index.dtype})")
+
+    if args.remove:
+        index.remove(args.remove)
+        print(f"Removidas: {', '.join(args.remove)}")
+
+    app = None
+    if args.images or args.query:
+        app = FaceAnalysis(name='buffalo_l', providers=get_default_providers(),
+                           allowed_modules=['detection', 'recognition'])
+        app.prepare(ctx_id=0, det_size=(640, 640))
+
+    if args.images:
+        images = list_images(args.images)
+        if args.prune:
+            missing = [identity for identity in index.rows if identity not in images]
+            index.remove(missing)
+            print(f"Removidas {len(missing)} identidades sem imagem")
+        pending = [(identity, path) for identity, path in images.items()
+                   if args.refresh or identity not in index
+                   or index.info.get(identity, {}).get('mtime') != os.path.getmtime(path)]
+        print(f"{len(images)} imagens encontradas, {len(pending)} a processar")
+        t0 = time.time()
+        added, skipped = embed_images(app, index, pending, max(1, args.batch), max(1, args.workers))
+        elapsed = time.time() - t0
+        print(f"{added} identidades adicionadas, {skipped} imagens sem rosto ({elapsed:.1f}s)")
+
+    if args.compact:
+        index.compact()
+    if args.ivf_lists:
+        index.build_ivf(n_lists=args.ivf_lists if args.ivf_lists > 0 else None)
+    index.save()
+    print(f"Índice salvo: {len(index)} identidades")
+
+    if args.query:
+        img = cv2.imread(args.query)
+        if img is None:
+            print(f"Não foi possível ler a imagem: {args.query}")
+            sys.exit(1)
+        faces = app.get(img)
+        if not faces:
+            print("Nenhum rosto detectado na imagem de consulta")
+            sys.exit(1)
+        face = max(faces, key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]))
+        t0 = time.perf_counter()
+        results = index.search(face.normed_embedding, k=args.top, n_probe=args.n_probe)[0]
+        print(f"\nMais parecidas ({(time.perf_counter() - t0) * 1000:.1f} ms):")
+        for identity, score in results:
+            print(f"  {identity:40s} {score:.3f}")
@@ -0,0 +1,291 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import onnx
+import onnxruntime
+
+# Adiciona raiz do projeto ao caminho para importar de src
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.utils import setup_dll_directories, load_model_manifest, MODEL_MANIFEST
+
+# Configura diretórios DLL para Windows
+setup_dll_directories()
+
+from profile_models import default_models, parse_shapes, DTYPES
+
+# Nível de otimização do ORT salvo no modelo. 'basic' (dobra de constantes, remoção de nós
+# redundantes) é portável entre providers; 'extended' e 'all' incluem fusões (Conv+Add+Relu,
+# GELU, LayerNorm...) com operadores do CPU EP, e 'all' ainda converte o layout para NCHWc
+# do processador atual.
+LEVELS = {
+    'basic': (onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC, 'any'),
+    'extended': (onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED, 'cpu'),
+    'all': (onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL, 'cpu'),
+}
+
+
+def _graph_inputs(model):
+    initializers = {init.name for init in model.graph.initializer}
+    return [inp for inp in model.graph.input if inp.name not in initializers]
+
+
+def _dims(value_info):
+    return [d.dim_value if d.HasField('dim_value') else None for d in value_info.type.tensor_type.shape.dim]
+
+
+def fix_shapes(model, batch, shapes):
+    """
+    Fixa as dimensões das entradas do grafo.
+
+    Args:
+        model: ModelProto (alterado no lugar)
+        batch: Lote fixo (> 0) ou None para tornar o lote dinâmico
+        shapes: Shapes completos por nome de entrada (têm prioridade)
+
+    Returns:
+        dict: Shape final de cada entrada (None nas dimensões dinâmicas)
+    """
+    result = {}
+    for inp in _graph_inputs(model):
+        dims = inp.type.tensor_type.shape.dim
+        if inp.name in shapes:
+            if len(shapes[inp.name]) != len(dims):
+                raise ValueError(f"Shape de {inp.name} deve ter {len(dims)} dimensões")
+            for dim, value in zip(dims, shapes[inp.name]):
+                dim.dim_value = value
+            if not batch:
+                # Variante registrada como dinâmica: o lote continua livre mesmo com --shape
+                dims[0].dim_param = 'batch'
+        elif dims:
+            if batch:
+                dims[0].dim_value = batch
+            else:
+                dims[0].dim_param = 'batch'
+        result[inp.name] = _dims(inp)
+
+    if not batch:
+        # Saídas com lote 1 fixo também passam a ter lote dinâmico
+        for out in model.graph.output:
+            dims = out.type.tensor_type.shape.dim
+            if dims and (not dims[0].HasField('dim_value') or dims[0].dim_value == 1):
+                dims[0].dim_param = 'batch'
+
+    # Shapes intermediários antigos podem contradizer os novos; são inferidos de novo
+    del model.graph.value_info[:]
+    return result
+
+
+def simplify(model):
+    try:
+        import onnxsim
+    except ImportError:
+        print("  onnxsim não instalado (pip install onnxsim); simplificação ignorada.")
+        return model
+    simplified, ok = onnxsim.simplify(model)
+    if not ok:
+        print("  Aviso: onnxsim não validou o modelo simplificado; mantendo o original.")
+        return model
+    print(f"  onnxsim: {len(model.graph.node)} -> {len(simplified.graph.node)} nós")
+    return simplified
+
+
+def unused_initializers(model):
+    # Ex.: 'emap' do inswapper, lido pelo insightface como o último inicializador do
+    # grafo e não usado por nenhum nó (as otimizações o removeriam)
+    used = {name for node in model.graph.node for name in node.input}
+    return [init for init in model.graph.initializer if init.name not in used]
+
+
+def cpu_session(model, options=None):
+    # Sem os avisos de inicializador não usado (esperados, ver unused_initializers)
+    options = options or onnxruntime.SessionOptions()
+    options.log_severity_level = 3
+    return onnxruntime.InferenceSession(model, sess_options=options, providers=['CPUExecutionProvider'])
+
+
+def ort_optimize(model, out_path, level, threads):
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = LEVELS[level][0]
+    options.optimized_model_filepath = out_path
+    if threads:
+        options.intra_op_num_threads = threads
+    cpu_session(model.SerializeToString(), options)
+
+
+def random_feed(session, batch, shapes, spatial=640):
+    feed = {}
+    for inp in session.get_inputs():
+        if inp.name in shapes:
+            shape = tuple(shapes[inp.name])
+            if not isinstance(inp.shape[0], int):
+                shape = (batch,) + shape[1:]
+        else:
+            shape = tuple(d if isinstance(d, int) and d > 0 else (batch if i == 0 else spatial)
+                          for i, d in enumerate(inp.shape))
+        dtype = DTYPES.get(inp.type, np.float32)
+        if np.issubdtype(dtype, np.floating):
+            feed[inp.name] = np.random.rand(*shape).astype(dtype)
+        else:
+            feed[inp.name] = np.ones(shape, dtype=dtype)
+    return feed
+
+
+def run_reference(session, feed):
+    # O original pode ter lote 1 fixo: roda amostra por amostra e concatena
+    batch = next(iter(feed.values())).shape[0]
+    if batch == 1 or session.get_inputs()[0].shape[0] != 1:
+        return session.run(None, feed)
+    parts = [session.run(None, {k: v[i:i + 1] for k, v in feed.items()}) for i in range(batch)]
+    return [np.concatenate(outputs, axis=0) for outputs in zip(*parts)]
+
+
+def check_parity(source_path, optimized_path, batch, shapes, runs):
+    """
+    Compara as saídas do modelo otimizado com as do original em entradas aleatórias.
+
+    Returns:
+        dict: Maior diferença absoluta e relativa (à maior magnitude da referência)
+    """
+    reference = cpu_session(source_path)
+    optimized = cpu_session(optimized_path)
+    # Variante dinâmica é verificada com lote 2
+    test_batch = batch or 2
+    max_abs = max_rel = 0.0
+    for _ in range(runs):
+        feed = random_feed(optimized, test_batch, shapes)
+        expected = run_reference(reference, feed)
+        actual = optimized.run(None, feed)
+        for exp, act in zip(expected, actual):
+            if exp.shape != act.shape:
+                raise RuntimeError(f"Shape de saída diferente: {exp.shape} vs {act.shape}")
+            diff = float(np.max(np.abs(exp.astype(np.float64) - act.astype(np.float64)), initial=0.0))
+            scale = float(np.max(np.abs(exp.astype(np.float64)), initial=0.0)) or 1.0
+            max_abs = max(max_abs, diff)
+            max_rel = max(max_rel, diff / scale)
+    return {'max_abs': max_abs, 'max_rel': max_rel}
+
+
+def benchmark(path, batch, shapes, runs=10):
+    session = cpu_session(path)
+    feed = random_feed(session, batch or 1, shapes)
+    session.run(None, feed)
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        session.run(None, feed)
+    return (time.perf_counter() - t0) / runs * 1000.0
+
+
+def optimize_model(source_path, out_dir, batch, shapes, level, use_onnxsim, threads):
+    """
+    Gera a variante otimizada de um modelo.
+
+    Returns:
+        tuple: (caminho da variante, shapes das entradas, shapes das entradas do original)
+    """
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    out_path = os.path.join(out_dir, f"{name}.b{batch or 'N'}.{level}.onnx")
+
+    model = onnx.load(source_path)
+    preserved = unused_initializers(model)
+    source_shapes = {inp.name: _dims(inp) for inp in _graph_inputs(model)}
+    input_shapes = fix_shapes(model, batch, shapes)
+    print(f"  Entradas: " + ", ".join(f"{k} {v}" for k, v in input_shapes.items()))
+    model = onnx.shape_inference.infer_shapes(model)
+    if use_onnxsim:
+        model = simplify(model)
+
+    ort_optimize(model, out_path, level, threads)
+
+    # Recoloca os inicializadores não usados, na ordem original, no fim da lista
+    optimized = onnx.load(out_path)
+    present = {init.name for init in optimized.graph.initializer}
+    for init in preserved:
+        if init.name in present:
+            optimized.graph.initializer.remove(next(i for i in optimized.graph.initializer if i.name == init.name))
+        optimized.graph.initializer.append(init)
+    onnx.save(optimized, out_path)
+    return out_path, input_shapes, source_shapes
+
+
+def register_variant(manifest, entry):
+    # Substitui a variante anterior do mesmo modelo/lote/nível
+    manifest['variants'] = [v for v in manifest['variants']
+                            if not (os.path.realpath(v['source']) == os.path.realpath(entry['source'])
+                                    and v.get('batch') == entry['batch'] and v.get('level') == entry['level'])]
+    manifest['variants'].append(entry)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera variantes otimizadas dos modelos ONNX (shapes estáticos, simplificação e fusões)")
+    parser.add_argument("--model", action="append", help="Modelo ONNX (pode repetir). Padrão: inswapper, GFPGAN e buffalo_l.")
+    parser.add_argument("--batch", type=int, default=1, help="Lote fixo da variante (0 = lote dinâmico)")
+    parser.add_argument("--shape", action="append", help="Shape fixo de uma entrada, ex.: input.1=1x3x640x640")
+    parser.add_argument("--level", choices=sorted(LEVELS), default="extended",
+                        help="Otimizações do ORT salvas no modelo ('basic' é portável para GPU; as demais são para o CPU EP)")
+    parser.add_argument("--no-onnxsim", action="store_true", help="Não executa o onnxsim antes das otimizações do ORT")
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="Diferença relativa máxima aceita na verificação de paridade")
+    parser.add_argument("--parity-runs", type=int, default=3, help="Entradas aleatórias usadas na verificação de paridade")
+    parser.add_argument("--threads", type=int, default=0, help="intra_op_num_threads (0 = padrão do ORT)")
+    parser.add_argument("--out", default="models/optimized", help="Pasta das variantes geradas")
+    parser.add_argument("--manifest", default=MODEL_MANIFEST, help="Manifesto lido por FaceSwapper/FaceEnhancer")
+    args = parser.parse_args()
+
+    models = args.model or default_models()
+    if not models:
+        print("Nenhum modelo encontrado. Use --model.")
+        sys.exit(1)
+    os.makedirs(args.out, exist_ok=True)
+    shapes = parse_shapes(args.shape)
+    batch = args.batch if args.batch > 0 else None
+    manifest = load_model_manifest(args.manifest)
+
+    registered = 0
+    for source_path in models:
+        print(f"\n[{os.path.basename(source_path)}] Otimizando (lote {batch or 'dinâmico'}, nível {args.level})")
+        try:
+            out_path, input_shapes, source_shapes = optimize_model(source_path, args.out, batch, shapes, args.level,
+                                                                   not args.no_onnxsim, args.threads)
+            parity = check_parity(source_path, out_path, batch, shapes, args.parity_runs)
+        except Exception as e:
+            print(f"  Erro: {e}")
+            continue
+
+        print(f"  Paridade: diferença máxima {parity['max_abs']:.2e} (relativa {parity['max_rel']:.2e})")
+        if parity['max_rel'] > args.tolerance:
+            print(f"  Variante rejeitada: acima da tolerância {args.tolerance:.0e}. Mantida em {out_path} para inspeção.")
+            continue
+
+        try:
+            before = benchmark(source_path, batch, shapes)
+            after = benchmark(out_path, batch, shapes)
+            print(f"  CPU: {before:.2f} ms -> {after:.2f} ms por execução")
+        except Exception as e:
+            print(f"  Aviso: benchmark falhou: {e}")
+
+        stat = os.stat(source_path)
+        register_variant(manifest, {
+            'source': source_path,
+            'path': out_path,
+            'batch': batch,
+            'level': args.level,
+            'target': LEVELS[args.level][1],
+            'inputs': input_shapes,
+            'source_inputs': source_shapes,
+            'source_size': stat.st_size,
+            'source_mtime_ns': stat.st_mtime_ns,
+            'ort_version': onnxruntime.__version__,
+            'parity': parity,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        })
+        registered += 1
+        print(f"  Variante registrada: {out_path}")
+
+    if registered:
+        os.makedirs(os.path.dirname(args.manifest) or '.', exist_ok=True)
+        with open(args.manifest, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        print(f"\n{registered} variante(s) registrada(s) em {args.manifest}")
@@ -0,0 +1,471 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import onnx
+import onnxruntime
+from onnx import numpy_helper
+
+# Adiciona raiz do projeto ao caminho para importar de src
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.utils import (setup_dll_directories, get_default_providers, resolve_model_variant, host_fingerprint,
+                       cpu_model_name, RUNTIME_PROFILE)
+
+# Configura diretórios DLL para Windows
+setup_dll_directories()
+
+from src.detection import DET_SIZES
+from optimize_models import unused_initializers
+
+# Extensões de CPU relevantes para o ONNX Runtime (kernels FP32, FP16 e INT8)
+SIMD_FLAGS = {
+    'sse4_2': 'SSE4.2', 'avx': 'AVX', 'avx2': 'AVX2', 'fma': 'FMA', 'f16c': 'F16C',
+    'avx512f': 'AVX-512F', 'avx512bw': 'AVX-512BW', 'avx512_vnni': 'AVX-512 VNNI', 'avx_vnni': 'AVX-VNNI',
+    'avx512_bf16': 'AVX-512 BF16', 'amx_int8': 'AMX-INT8', 'asimd': 'NEON', 'asimddp': 'NEON DotProd',
+}
+# Extensões com instruções de produto escalar INT8 (quantização compensa)
+INT8_FLAGS = {'avx512_vnni', 'avx_vnni', 'amx_int8', 'asimddp'}
+
+BUFFALO_DET = os.path.join(os.path.expanduser("~"), ".insightface", "models", "buffalo_l", "det_10g.onnx")
+
+
+def print_section(title):
+    print(f"\n{'='*60}")
+    print(f"  {title}")
+    print(f"{'='*60}")
+
+
+def _sysctl(name):
+    try:
+        return subprocess.run(['sysctl', '-n', name], capture_output=True, text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ''
+
+
+def _cpuinfo_optional():
+    # py-cpuinfo (opcional) cobre Windows; no Linux e macOS os dados vêm do sistema
+    try:
+        import cpuinfo
+    except ImportError:
+        return {}
+    return cpuinfo.get_cpu_info()
+
+
+def physical_cores():
+    try:
+        import psutil
+        return psutil.cpu_count(logical=False) or os.cpu_count()
+    except ImportError:
+        pass
+    if os.path.exists('/proc/cpuinfo'):
+        cores, physical_id = set(), '0'
+        with open('/proc/cpuinfo', 'r', encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                key = key.strip()
+                if key == 'physical id':
+                    physical_id = value.strip()
+                elif key == 'core id':
+                    cores.add((physical_id, value.strip()))
+        if cores:
+            return len(cores)
+    if sys.platform == 'darwin':
+        value = _sysctl('hw.physicalcpu')
+        if value.isdigit():
+            return int(value)
+    # Sem informação de topologia: assume SMT de 2 vias quando há núcleos lógicos pares
+    logical = os.cpu_count() or 1
+    return logical // 2 if logical >= 4 and logical % 2 == 0 else logical
+
+
+def simd_features():
+    flags = set()
+    if os.path.exists('/proc/cpuinfo'):
+        with open('/proc/cpuinfo', 'r', encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                if line.lower().startswith(('flags', 'features')):
+                    flags.update(line.split(':', 1)[1].split())
+                    break
+    elif sys.platform == 'darwin':
+        features = (_sysctl('machdep.cpu.features') + ' ' + _sysctl('machdep.cpu.leaf7_features')).lower()
+        flags.update(f.replace('.', '_') for f in features.split())
+        if platform.machine() == 'arm64':
+            flags.add('asimd')
+            if _sysctl('hw.optional.arm.FEAT_DotProd') == '1':
+                flags.add('asimddp')
+    else:
+        flags.update(_cpuinfo_optional().get('flags', []))
+    # Nomes variam entre fontes (ex.: avx512vnni no py-cpuinfo)
+    flags.update(f.replace('avx512vnni', 'avx512_vnni').replace('avxvnni', 'avx_vnni') for f in list(flags))
+    return sorted(flag for flag in SIMD_FLAGS if flag in flags)
+
+
+def cache_sizes():
+    # Tamanho (KB) por nível de cache de dados/unificado do primeiro núcleo
+    caches = {}
+    base = '/sys/devices/system/cpu/cpu0/cache'
+    if os.path.isdir(base):
+        for entry in sorted(glob.glob(os.path.join(base, 'index*'))):
+            try:
+                with open(os.path.join(entry, 'type')) as f:
+                    kind = f.read().strip()
+                with open(os.path.join(entry, 'level')) as f:
+                    level = f.read().strip()
+                with open(os.path.join(entry, 'size')) as f:
+                    size = f.read().strip()
+            except OSError:
+                continue
+            if kind == 'Instruction':
+                continue
+            kb = int(size[:-1]) * (1024 if size.endswith('M') else 1) if size[-1] in 'KM' else int(size) // 1024
+            caches[f"L{level}"] = kb
+    elif sys.platform == 'darwin':
+        for level, name in (('L1', 'hw.l1dcachesize'), ('L2', 'hw.l2cachesize'), ('L3', 'hw.l3cachesize')):
+            value = _sysctl(name)
+            if value.isdigit() and int(value):
+                caches[level] = int(value) // 1024
+    else:
+        info = _cpuinfo_optional()
+        for level, key in (('L2', 'l2_cache_size'), ('L3', 'l3_cache_size')):
+            if info.get(key):
+                caches[level] = int(info[key]) // 1024
+    return caches
+
+
+def total_ram_gb():
+    try:
+        import psutil
+        return psutil.virtual_memory().total / 1024 ** 3
+    except ImportError:
+        pass
+    if os.path.exists('/proc/meminfo'):
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemTotal'):
+                    return int(line.split()[1]) / 1024 ** 2
+    if sys.platform == 'darwin':
+        value = _sysctl('hw.memsize')
+        return int(value) / 1024 ** 3 if value.isdigit() else 0.0
+    if sys.platform == 'win32':
+        import ctypes
+
+        class MEMORYSTATUSEX(ctypes.Structure):
+            _fields_ = [('dwLength', ctypes.c_ulong), ('dwMemoryLoad', ctypes.c_ulong),
+                        ('ullTotalPhys', ctypes.c_ulonglong), ('ullAvailPhys', ctypes.c_ulonglong),
+                        ('ullTotalPageFile', ctypes.c_ulonglong), ('ullAvailPageFile', ctypes.c_ulonglong),
+                        ('ullTotalVirtual', ctypes.c_ulonglong), ('ullAvailVirtual', ctypes.c_ulonglong),
+                        ('ullAvailExtendedVirtual', ctypes.c_ulonglong)]
+        status = MEMORYSTATUSEX()
+        status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+        ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status))
+        return status.ullTotalPhys / 1024 ** 3
+    return 0.0
+
+
+def probe_hardware():
+    return {
+        'cpu': cpu_model_name(),
+        'machine': platform.machine(),
+        'logical_cores': os.cpu_count(),
+        'physical_cores': physical_cores(),
+        'simd': simd_features(),
+        'cache_kb': cache_sizes(),
+        'ram_gb': round(total_ram_gb(), 1),
+    }
+
+
+# --- Micro-benchmark ---
+
+def make_session(path, providers, intra_op_threads=None):
+    options = onnxruntime.SessionOptions()
+    options.log_severity_level = 3
+    if intra_op_threads:
+        options.intra_op_num_threads = intra_op_threads
+    return onnxruntime.InferenceSession(path, sess_options=options, providers=providers)
+
+
+def random_feed(session, spatial=None, seed=0):
+    # Dimensões dinâmicas: lote 1 e entrada espacial 'spatial' (detector)
+    rng = np.random.default_rng(seed)
+    feed = {}
+    for inp in session.get_inputs():
+        shape = [d if isinstance(d, int) and d > 0 else (1 if i == 0 else spatial)
+                 for i, d in enumerate(inp.shape)]
+        dtype = np.float16 if inp.type == 'tensor(float16)' else np.float32
+        feed[inp.name] = rng.random(shape).astype(dtype)
+    if len(feed) == 2:
+        # Inswapper: latente da origem normalizado, como no pipeline
+        name = session.get_inputs()[1].name
+        feed[name] /= np.linalg.norm(feed[name])
+    return feed
+
+
+def latency_ms(session, feed, seconds):
+    session.run(None, feed)
+    runs, t0 = 0, time.perf_counter()
+    while runs < 3 or time.perf_counter() - t0 < seconds:
+        session.run(None, feed)
+        runs += 1
+    return (time.perf_counter() - t0) / runs * 1000.0
+
+
+def throughput(session, feed, workers, seconds):
+    """
+    Execuções por segundo com 'workers' threads chamando a mesma sessão, como o pool do FaceSwapper.
+
+    Returns:
+        tuple: (execuções por segundo, latência média em ms)
+    """
+    session.run(None, feed)
+    counts = [0] * workers
+    stop = threading.Event()
+
+    def loop(index):
+        while not stop.is_set():
+            session.run(None, feed)
+            counts[index] += 1
+
+    threads = [threading.Thread(target=loop, args=(i,), daemon=True) for i in range(workers)]
+    t0 = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - t0
+    total = max(1, sum(counts))
+    return total / elapsed, elapsed * workers / total * 1000.0
+
+
+def swapper_candidates(model_dir, int8_path):
+    candidates = sorted(glob.glob(os.path.join(model_dir, 'inswapper_128*.onnx')))
+    if int8_path and int8_path not in candidates and os.path.exists(int8_path):
+        candidates.append(int8_path)
+    return candidates
+
+
+def make_int8(source_path, out_path):
+    # Quantização dinâmica do ORT (pesos INT8, ativações quantizadas em tempo de execução)
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    print(f"  Gerando variante INT8 em {out_path}...")
+    quantize_dynamic(source_path, out_path, weight_type=QuantType.QInt8)
+    # A quantização descarta o 'emap' (não usado por nós), lido pelo insightface como o
+    # último inicializador: recoloca os inicializadores não usados no fim, como em optimize_models
+    preserved = unused_initializers(onnx.load(source_path))
+    quantized = onnx.load(out_path)
+    for init in preserved:
+        present = next((i for i in quantized.graph.initializer if i.name == init.name), None)
+        if present is not None:
+            quantized.graph.initializer.remove(present)
+        quantized.graph.initializer.append(init)
+    onnx.save(quantized, out_path)
+    return out_path
+
+
+def swapper_feed(path, session, seed=0):
+    """
+    Entrada do inswapper como no pipeline: o latente vem de um embedding de origem
+    multiplicado pelo 'emap' do próprio modelo (último inicializador, como no INSwapper).
+
+    Raises:
+        ValueError: Modelo sem um 'emap' compatível com a entrada do latente
+    """
+    emap = numpy_helper.to_array(onnx.load(path).graph.initializer[-1]).astype(np.float32)
+    target, source = session.get_inputs()[:2]
+    if emap.ndim != 2 or emap.shape[1] != source.shape[-1]:
+        raise ValueError(f"último inicializador {list(emap.shape)} não é um emap válido")
+    rng = np.random.default_rng(seed)
+    embedding = rng.standard_normal((1, emap.shape[0])).astype(np.float32)
+    latent = (embedding / np.linalg.norm(embedding)) @ emap
+    latent /= np.linalg.norm(latent)
+    dtypes = {inp.name: np.float16 if inp.type == 'tensor(float16)' else np.float32 for inp in (target, source)}
+    crop = rng.random((1, 3, 128, 128))
+    return {target.name: crop.astype(dtypes[target.name]), source.name: latent.astype(dtypes[source.name])}
+
+
+def select_swapper(candidates, providers, threads, tolerance, seconds):
+    """
+    Mede cada variante do inswapper e escolhe a mais rápida com saída equivalente à de referência.
+
+    A referência é o primeiro modelo FP32 (sem '_fp16'/'_int8' no nome) ou o primeiro candidato.
+
+    Returns:
+        tuple: (caminho escolhido, resultados por modelo)
+    """
+    reference_path = next((c for c in candidates if '_fp16' not in c and '_int8' not in c), candidates[0])
+    variant = resolve_model_variant(reference_path, providers)
+    reference = make_session(variant, providers, threads)
+    expected = reference.run(None, swapper_feed(variant, reference))[0].astype(np.float32)
+    del reference
+
+    results = {}
+    for path in candidates:
+        try:
+            # Mesmo embedding de origem em todos: o latente passa pelo emap de cada variante
+            variant = resolve_model_variant(path, providers)
+            session = make_session(variant, providers, threads)
+            model_feed = swapper_feed(variant, session)
+            output = session.run(None, model_feed)[0].astype(np.float32)
+            diff = float(np.mean(np.abs(output - expected)))
+            ms = latency_ms(session, model_feed, seconds)
+        except Exception as e:
+            print(f"  {os.path.basename(path)}: erro ({e})")
+            continue
+        ok = diff <= tolerance
+        results[path] = {'ms': round(ms, 2), 'mean_abs_diff': diff, 'accepted': ok}
+        print(f"  {os.path.basename(path):32s} {ms:8.2f} ms  diferença média {diff:.4f}"
+              f"{'' if ok else '  (rejeitado: acima da tolerância)'}")
+    accepted = [path for path, r in results.items() if r['accepted']]
+    if not accepted:
+        return reference_path, results
+    return min(accepted, key=lambda p: results[p]['ms']), results
+
+
+def thread_configs(cores, accelerated, max_workers):
+    # (threads por sessão, workers). Na GPU só o número de workers importa.
+    if accelerated:
+        return [(None, w) for w in range(1, max_workers + 1)]
+    configs = set()
+    for threads in {1, 2, 4, max(1, cores // 2), cores}:
+        if threads <= cores:
+            configs.add((threads, max(1, min(max_workers, cores // threads))))
+    configs.add((cores, 1))
+    return sorted(configs, key=lambda c: (c[0], c[1]))
+
+
+def tune_threads(path, providers, cores, accelerated, max_workers, seconds):
+    best, results = None, []
+    for threads, workers in thread_configs(cores, accelerated, max_workers):
+        session = make_session(resolve_model_variant(path, providers), providers, threads)
+        fps, ms = throughput(session, random_feed(session), workers, seconds)
+        results.append({'intra_op_threads': threads, 'workers': workers, 'faces_per_s': round(fps, 1),
+                        'latency_ms': round(ms, 2)})
+        print(f"  threads {str(threads or 'auto'):>4s} x workers {workers}: {fps:7.1f} rostos/s, {ms:7.2f} ms por rosto")
+        # Menos de 5% de ganho não compensa a latência maior de mais workers
+        if best is None or fps > best['faces_per_s'] * 1.05:
+            best = results[-1]
+    return best, results
+
+
+def tune_detection(det_path, providers, threads, target_fps, seconds):
+    """
+    Escolhe o det_size e o intervalo de detecção para o FPS alvo.
+
+    A detecção roda na thread principal a cada detect_interval quadros: o maior nível que
+    cabe em metade do orçamento do quadro vira det_size, e o intervalo mantém o custo
+    médio da detecção abaixo de 15% do orçamento.
+    """
+    session = make_session(resolve_model_variant(det_path, providers), providers, threads)
+    budget = 1000.0 / target_fps
+    timings = {}
+    for size in DET_SIZES:
+        timings[size] = round(latency_ms(session, random_feed(session, spatial=size), seconds), 2)
+        print(f"  det_size {size:4d}: {timings[size]:7.2f} ms")
+    fitting = [size for size in DET_SIZES if timings[size] <= budget * 0.5]
+    det_size = max(fitting) if fitting else DET_SIZES[0]
+    detect_interval = int(min(10, max(1, np.ceil(timings[det_size] / (budget * 0.15)))))
+    return det_size, detect_interval, timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detecta o hardware, mede os modelos e grava o perfil de execução usado pelo FaceSwapper")
+    parser.add_argument("--out", default=RUNTIME_PROFILE, help="Arquivo do perfil de execução")
+    parser.add_argument("--model-dir", default="models", help="Pasta com as variantes do inswapper (inswapper_128*.onnx)")
+    parser.add_argument("--det-model", default=BUFFALO_DET, help="Modelo de detecção (det_10g do buffalo_l)")
+    parser.add_argument("--target-fps", type=float, default=30.0, help="FPS alvo do modo tempo real (orçamento por quadro)")
+    parser.add_argument("--max-workers", type=int, default=8, help="Máximo de workers testados")
+    parser.add_argument("--seconds", type=float, default=1.5, help="Duração de cada medição")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="Diferença média máxima (0-1) de uma variante em relação ao FP32")
+    parser.add_argument("--int8", action="store_true", help="Gera e testa uma variante INT8 (quantização dinâmica) do inswapper")
+    parser.add_argument("--cpu", action="store_true", help="Mede apenas no CPU (ignora GPU)")
+    parser.add_argument("--dry-run", action="store_true", help="Mostra o perfil sem gravar")
+    args = parser.parse_args()
+
+    print_section("HARDWARE")
+    hardware = probe_hardware()
+    print(f"CPU: {hardware['cpu']} ({hardware['machine']})")
+    print(f"Núcleos: {hardware['physical_cores']} físicos, {hardware['logical_cores']} lógicos")
+    print(f"SIMD: {', '.join(SIMD_FLAGS[f] for f in hardware['simd']) or 'não detectado'}")
+    print("Cache: " + (", ".join(f"{k} {v} KB" for k, v in hardware['cache_kb'].items()) or "não detectado"))
+    print(f"RAM: {hardware['ram_gb']:.1f} GB")
+
+    available = onnxruntime.get_available_providers()
+    providers = ['CPUExecutionProvider'] if args.cpu else [
+        p for p in get_default_providers() if (p[0] if isinstance(p, tuple) else p) in available]
+    accelerated = any((p[0] if isinstance(p, tuple) else p) != 'CPUExecutionProvider' for p in providers)
+    cores = hardware['physical_cores']
+    print(f"Providers: {[p[0] if isinstance(p, tuple) else p for p in providers]}")
+
+    candidates = swapper_candidates(args.model_dir, None)
+    if not candidates:
+        print(f"Nenhum inswapper_128*.onnx encontrado em {args.model_dir}.")
+        sys.exit(1)
+
+    if args.int8 and not accelerated:
+        int8_path = os.path.join(args.model_dir, 'inswapper_128_int8.onnx')
+        if not os.path.exists(int8_path):
+            source = next((c for c in candidates if '_fp16' not in c), None)
+            if source is None:
+                print("  Variante INT8 requer o modelo FP32 (inswapper_128.onnx).")
+            else:
+                try:
+                    make_int8(source, int8_path)
+                except Exception as e:
+                    print(f"  Erro ao gerar variante INT8: {e}")
+        candidates = swapper_candidates(args.model_dir, int8_path)
+    elif not any(flag in INT8_FLAGS for flag in hardware['simd']):
+        # Sem instruções de produto escalar INT8 a variante quantizada raramente compensa
+        candidates = [c for c in candidates if '_int8' not in c] or candidates
+
+    print_section("INSWAPPER: VARIANTES")
+    model, model_results = select_swapper(candidates, providers, None if accelerated else cores,
+                                          args.tolerance, args.seconds)
+    print(f"Escolhido: {model}")
+
+    print_section("INSWAPPER: THREADS E WORKERS")
+    best, thread_results = tune_threads(model, providers, cores, accelerated, args.max_workers, args.seconds)
+    print(f"Escolhido: {best['intra_op_threads'] or 'auto'} threads por sessão, {best['workers']} workers")
+
+    settings = {'model': model, 'max_workers': best['workers']}
+    if best['intra_op_threads']:
+        settings['intra_op_threads'] = best['intra_op_threads']
+    benchmarks = {'swapper_variants': model_results, 'swapper_threads': thread_results}
+
+    print_section("DETECÇÃO")
+    if os.path.exists(args.det_model):
+        det_size, detect_interval, det_results = tune_detection(
+            args.det_model, providers, best['intra_op_threads'], args.target_fps, args.seconds)
+        print(f"Escolhido: det_size {det_size}, detecção a cada {detect_interval} quadros")
+        settings.update({'det_size': det_size, 'detect_interval': detect_interval})
+        benchmarks['detection_ms'] = det_results
+    else:
+        print(f"Modelo de detecção não encontrado ({args.det_model}); det_size e intervalo mantêm o padrão.")
+
+    profile = {
+        'version': 1,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'fingerprint': host_fingerprint(),
+        'hardware': hardware,
+        'ort_version': onnxruntime.__version__,
+        'providers': [p[0] if isinstance(p, tuple) else p for p in providers],
+        'target_fps': args.target_fps,
+        'settings': settings,
+        'benchmarks': benchmarks,
+    }
+
+    print_section("PERFIL")
+    print(json.dumps(settings, indent=2))
+    if args.dry_run:
+        sys.exit(0)
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(profile, f, indent=2)
+    print(f"\nPerfil salvo em {args.out} (carregado pelo FaceSwapper na inicialização; --no-runtime-profile ignora)")
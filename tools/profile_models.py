@@ -0,0 +1,180 @@
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+from collections import defaultdict
+
+import numpy as np
+import onnxruntime
+
+# Adiciona raiz do projeto ao caminho para importar de src
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.utils import setup_dll_directories
+
+# Configura diretórios DLL para Windows
+setup_dll_directories()
+
+DTYPES = {
+    'tensor(float)': np.float32,
+    'tensor(float16)': np.float16,
+    'tensor(double)': np.float64,
+    'tensor(int64)': np.int64,
+    'tensor(int32)': np.int32,
+}
+
+# Tamanho usado para dimensões espaciais dinâmicas (ex.: detector com entrada livre)
+DEFAULT_SPATIAL = {'det_10g': 640}
+
+
+def default_models():
+    # Modelos do projeto: inswapper, GFPGAN e cada modelo do pacote buffalo_l
+    models = []
+    for path in ("models/inswapper_128.onnx", "models/inswapper_128_fp16.onnx", "models/GFPGANv1.4.onnx"):
+        if os.path.exists(path):
+            models.append(path)
+    buffalo_dir = os.path.join(os.path.expanduser("~"), ".insightface", "models", "buffalo_l")
+    models.extend(sorted(glob.glob(os.path.join(buffalo_dir, "*.onnx"))))
+    return models
+
+
+def parse_shapes(values):
+    # --shape nome=1x3x640x640
+    shapes = {}
+    for value in values or []:
+        name, dims = value.split('=', 1)
+        shapes[name] = tuple(int(d) for d in dims.lower().split('x'))
+    return shapes
+
+
+def make_inputs(session, model_name, shapes):
+    feed = {}
+    spatial = DEFAULT_SPATIAL.get(model_name, 640)
+    for inp in session.get_inputs():
+        if inp.name in shapes:
+            shape = shapes[inp.name]
+        else:
+            # Primeira dimensão dinâmica = batch 1; as demais usam o tamanho espacial padrão
+            shape = tuple(d if isinstance(d, int) and d > 0 else (1 if i == 0 else spatial)
+                          for i, d in enumerate(inp.shape))
+        dtype = DTYPES.get(inp.type, np.float32)
+        if np.issubdtype(dtype, np.floating):
+            feed[inp.name] = np.random.rand(*shape).astype(dtype)
+        else:
+            feed[inp.name] = np.ones(shape, dtype=dtype)
+    return feed
+
+
+def profile_model(model_path, runs, warmup, threads, shapes, out_dir):
+    model_name = os.path.splitext(os.path.basename(model_path))[0]
+    options = onnxruntime.SessionOptions()
+    options.enable_profiling = True
+    options.profile_file_prefix = os.path.join(out_dir, f"{model_name}_ort")
+    if threads:
+        options.intra_op_num_threads = threads
+
+    session = onnxruntime.InferenceSession(model_path, sess_options=options, providers=['CPUExecutionProvider'])
+    feed = make_inputs(session, model_name, shapes)
+    print(f"\n[{model_name}] Entradas: " + ", ".join(f"{k} {v.shape}" for k, v in feed.items()))
+
+    for _ in range(warmup + runs):
+        session.run(None, feed)
+    profile_path = session.end_profiling()
+
+    trace_path = os.path.join(out_dir, f"{model_name}_trace.json")
+    shutil.move(profile_path, trace_path)
+    with open(trace_path, 'r', encoding='utf-8') as f:
+        events = json.load(f)
+    return model_name, trace_path, aggregate(events, warmup)
+
+
+def aggregate(events, warmup):
+    # Eventos de execução completos (ph == 'X'); as primeiras `warmup` execuções são descartadas
+    run_events = sorted((e for e in events if e.get('name') == 'model_run'), key=lambda e: e['ts'])
+    measured = run_events[warmup:]
+    if not measured:
+        raise RuntimeError("Nenhuma execução medida no perfil")
+    cutoff = measured[0]['ts']
+
+    by_op = defaultdict(lambda: [0.0, 0])
+    by_node = defaultdict(lambda: [0.0, 0, ''])
+    for e in events:
+        if e.get('cat') != 'Node' or e.get('ts', 0) < cutoff or not e.get('name', '').endswith('_kernel_time'):
+            continue
+        op = e.get('args', {}).get('op_name', '?')
+        node = e['name'][:-len('_kernel_time')]
+        by_op[op][0] += e['dur']
+        by_op[op][1] += 1
+        by_node[node][0] += e['dur']
+        by_node[node][1] += 1
+        by_node[node][2] = op
+
+    runs = len(measured)
+    return {
+        'runs': runs,
+        'run_ms': sum(e['dur'] for e in measured) / runs / 1000.0,
+        'node_ms': sum(v[0] for v in by_op.values()) / runs / 1000.0,
+        'ops': sorted(((op, total / runs / 1000.0, count // runs) for op, (total, count) in by_op.items()),
+                      key=lambda x: -x[1]),
+        'nodes': sorted(((node, op, total / runs / 1000.0) for node, (total, _, op) in by_node.items()),
+                        key=lambda x: -x[2]),
+    }
+
+
+def format_report(model_name, stats, top):
+    lines = [f"Modelo: {model_name}",
+             f"Execuções medidas: {stats['runs']}",
+             f"Tempo por execução: {stats['run_ms']:.2f} ms (soma dos nós: {stats['node_ms']:.2f} ms)",
+             "",
+             "Por operador:",
+             f"  {'Operador':<24}{'ms/exec':>10}{'%':>8}{'Nós':>8}"]
+    total = stats['node_ms'] or 1.0
+    for op, ms, count in stats['ops'][:top]:
+        lines.append(f"  {op:<24}{ms:>10.3f}{ms / total * 100:>7.1f}%{count:>8}")
+    lines += ["", f"Nós mais lentos (top {top}):",
+              f"  {'Nó':<48}{'Operador':<20}{'ms/exec':>10}{'%':>8}"]
+    for node, op, ms in stats['nodes'][:top]:
+        lines.append(f"  {node[:47]:<48}{op:<20}{ms:>10.3f}{ms / total * 100:>7.1f}%")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Perfil por operador dos modelos ONNX (CPU)")
+    parser.add_argument("--model", action="append", help="Modelo ONNX (pode repetir). Padrão: inswapper, GFPGAN e buffalo_l.")
+    parser.add_argument("--runs", type=int, default=20, help="Execuções medidas por modelo")
+    parser.add_argument("--warmup", type=int, default=3, help="Execuções de aquecimento (descartadas)")
+    parser.add_argument("--threads", type=int, default=0, help="intra_op_num_threads (0 = padrão do ORT)")
+    parser.add_argument("--shape", action="append", help="Shape fixo de uma entrada, ex.: input.1=1x3x640x640")
+    parser.add_argument("--top", type=int, default=20, help="Linhas das tabelas de hotspots")
+    parser.add_argument("--out", default="outputs/profiles", help="Pasta dos relatórios e traces")
+    args = parser.parse_args()
+
+    models = args.model or default_models()
+    if not models:
+        print("Nenhum modelo encontrado. Use --model.")
+        sys.exit(1)
+    os.makedirs(args.out, exist_ok=True)
+    shapes = parse_shapes(args.shape)
+
+    summary = []
+    for model_path in models:
+        try:
+            model_name, trace_path, stats = profile_model(model_path, args.runs, args.warmup, args.threads,
+                                                          shapes, args.out)
+        except Exception as e:
+            print(f"Erro ao perfilar {model_path}: {e}")
+            continue
+        report = format_report(model_name, stats, args.top)
+        print(report)
+        report_path = os.path.join(args.out, f"{model_name}_hotspots.txt")
+        with open(report_path, 'w', encoding='utf-8') as f:
+            f.write(report + "\n")
+        print(f"Relatório: {report_path}")
+        print(f"Trace (abrir em chrome://tracing ou ui.perfetto.dev): {trace_path}")
+        summary.append((model_name, stats['run_ms']))
+
+    if summary:
+        print("\nResumo (ms por execução, CPU):")
+        for model_name, ms in sorted(summary, key=lambda x: -x[1]):
+            print(f"  {model_name:<32}{ms:>10.2f}")